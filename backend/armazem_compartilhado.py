@@ -0,0 +1,173 @@
+"""Avaliações simuladas compartilhadas entre os workers do uvicorn.
+
+Com `uvicorn main:app --workers N` cada worker é um processo com a própria
+matriz em memória; a base (snapshot binário) já é compartilhada pelo mmap dos
+`.npy`, mas as notas do `/avaliar` ficavam só no worker que as recebeu.
+
+O armazém é um arquivo mapeado em memória (de preferência em `/dev/shm`) com
+um cabeçalho (versão, quantidade, capacidade) e as avaliações em sequência,
+em registros de tamanho fixo. Quem escreve segura a trava do arquivo, anexa
+os registros e só depois aumenta a quantidade e a versão; os outros workers
+comparam a versão a cada requisição e aplicam só a cauda nova, lida direto do
+mapeamento, nas próprias estruturas — sem reler CSV nem log.
+
+O log do `RegistroAvaliacoes` continua sendo a cópia durável; o armazém é
+realinhado com ele quando um worker sobe.
+"""
+import mmap
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+MAGICO = 0x31434D5641  # "AVMC1"
+VERSAO_FORMATO = 1
+TAMANHO_CABECALHO = 64
+# posições no cabeçalho (uint64)
+_MAGICO, _FORMATO, _VERSAO, _QUANTIDADE, _CAPACIDADE = range(5)
+REGISTRO = np.dtype([("usuario_id", "<i8"), ("item_id", "<i8"), ("nota", "<f8")])
+
+
+class ArmazemAvaliacoes:
+    """Sequência de avaliações `(usuario_id, item_id, nota)` num arquivo mapeado, com contador de versão."""
+
+    def __init__(self, caminho: str, capacidade_inicial: int = 1 << 16):
+        if fcntl is None:
+            raise RuntimeError("armazém compartilhado precisa de fcntl (Linux/macOS)")
+        self.caminho = caminho
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        self._fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o644)
+        # a trava do arquivo vale por processo; entre threads do mesmo worker, esta
+        self._lock = threading.Lock()
+        # avaliações do armazém já aplicadas neste worker, e a versão vista por último
+        self.aplicadas = 0
+        self.versao_vista = -1
+        self.sincronizacoes = 0
+
+        with self.trava():
+            if not self._valido():
+                self._formatar(capacidade_inicial)
+        self._mapear()
+
+    def _valido(self) -> bool:
+        if os.fstat(self._fd).st_size < TAMANHO_CABECALHO:
+            return False
+        cabecalho = np.frombuffer(os.pread(self._fd, 16, 0), dtype="<u8")
+        return int(cabecalho[_MAGICO]) == MAGICO and int(cabecalho[_FORMATO]) == VERSAO_FORMATO
+
+    def _formatar(self, capacidade: int):
+        os.ftruncate(self._fd, TAMANHO_CABECALHO + capacidade * REGISTRO.itemsize)
+        cabecalho = np.zeros(TAMANHO_CABECALHO // 8, dtype="<u8")
+        cabecalho[[_MAGICO, _FORMATO, _CAPACIDADE]] = MAGICO, VERSAO_FORMATO, capacidade
+        os.pwrite(self._fd, cabecalho.tobytes(), 0)
+
+    def _mapear(self):
+        # o mapeamento antigo some quando ninguém mais aponta para ele
+        self._mapa = mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+        self._cabecalho = np.ndarray(TAMANHO_CABECALHO // 8, dtype="<u8", buffer=self._mapa)
+        capacidade = (len(self._mapa) - TAMANHO_CABECALHO) // REGISTRO.itemsize
+        self._registros = np.ndarray(capacidade, dtype=REGISTRO, buffer=self._mapa, offset=TAMANHO_CABECALHO)
+
+    @contextmanager
+    def trava(self):
+        """Exclusão entre processos (e threads) para escrever."""
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @property
+    def versao(self) -> int:
+        return int(self._cabecalho[_VERSAO])
+
+    @property
+    def quantidade(self) -> int:
+        return int(self._cabecalho[_QUANTIDADE])
+
+    def mudou(self) -> bool:
+        """Leitura de 8 bytes: outro worker publicou algo desde a última sincronização?"""
+        return int(self._cabecalho[_VERSAO]) != self.versao_vista
+
+    def registros(self) -> np.ndarray:
+        """Visão (sem cópia) das avaliações publicadas."""
+        n = self.quantidade
+        if n > len(self._registros):
+            self._mapear()
+        return self._registros[:n]
+
+    def novos(self) -> list[tuple[int, int, float]]:
+        """Avaliações publicadas que este worker ainda não aplicou; avança `aplicadas`."""
+        # a versão é lida antes da quantidade: quem escreve grava na ordem inversa
+        versao = self.versao
+        publicados = self.registros()
+        novos = publicados[self.aplicadas:].tolist()
+        self.aplicadas = max(self.aplicadas, len(publicados))
+        self.versao_vista = versao
+        if novos:
+            self.sincronizacoes += 1
+        return novos
+
+    def anexar(self, triplas: list[tuple[int, int, float]]):
+        """Publica avaliações; chamar com `trava()` e depois de aplicar os `novos()`."""
+        n = self.quantidade
+        fim = n + len(triplas)
+        capacidade = int(self._cabecalho[_CAPACIDADE])
+        if fim > capacidade:
+            capacidade = max(fim, 2 * capacidade)
+            os.ftruncate(self._fd, TAMANHO_CABECALHO + capacidade * REGISTRO.itemsize)
+            self._cabecalho[_CAPACIDADE] = capacidade
+        if fim > len(self._registros):
+            self._mapear()
+        self._registros[n:fim] = np.array(triplas, dtype=REGISTRO)
+        # registros, depois quantidade, depois versão
+        self._cabecalho[_QUANTIDADE] = fim
+        self._cabecalho[_VERSAO] += 1
+        self.aplicadas = fim
+        self.versao_vista = self.versao
+
+    def alinhar(self, registros: list[dict]):
+        """Deixa o armazém igual às avaliações do log (na subida do worker); chamar com `trava()`."""
+        esperado = np.array(
+            [(r["usuario_id"], r["item_id"], r["nota"]) for r in registros], dtype=REGISTRO
+        ) if registros else np.empty(0, dtype=REGISTRO)
+        atuais = self.registros()
+        if len(atuais) != len(esperado) or not (atuais == esperado).all():
+            # armazém novo (ex.: /dev/shm limpo no boot) ou de outros dados
+            self._cabecalho[_QUANTIDADE] = 0
+            self.anexar(esperado.tolist())
+        self.aplicadas = len(esperado)
+        self.versao_vista = self.versao
+
+    def estado(self) -> dict:
+        return {
+            "caminho": self.caminho,
+            "versao": self.versao,
+            "avaliacoes": self.quantidade,
+            "aplicadas_neste_worker": self.aplicadas,
+            "capacidade": int(self._cabecalho[_CAPACIDADE]),
+            "sincronizacoes": self.sincronizacoes,
+            "pid": os.getpid(),
+        }
+
+
+class MiddlewareSincronizacao:
+    """Antes de cada requisição, aplica o que outros workers publicaram no armazém (se a versão mudou)."""
+
+    def __init__(self, app, armazem: ArmazemAvaliacoes, sincronizar):
+        self.app = app
+        self.armazem = armazem
+        self.sincronizar = sincronizar
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self.armazem.mudou():
+            await run_in_threadpool(self.sincronizar)
+        await self.app(scope, receive, send)
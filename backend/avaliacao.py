@@ -0,0 +1,352 @@
+import itertools
+import math
+import os
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fatoracao import ModeloFatores
+from filtragem_itens import RecomendadorPorItens
+from matriz_avaliacoes import MatrizAvaliacoes, VersaoMatriz
+from similaridade import MotorSimilaridade
+
+
+def metricas_ranking(ranking: list[int], relevantes: set[int], K: int) -> tuple[float, float, float]:
+    """`(precisao@K, recall@K, NDCG@K)` com relevância binária; recall e NDCG são NaN sem relevantes."""
+    ganhos = np.array([1.0 if i in relevantes else 0.0 for i in ranking[:K]])
+    acertos = ganhos.sum()
+    precisao = acertos / K
+    if not relevantes:
+        return precisao, math.nan, math.nan
+    descontos = 1.0 / np.log2(np.arange(2, K + 2))
+    dcg = float((ganhos * descontos[:len(ganhos)]).sum())
+    idcg = float(descontos[:min(K, len(relevantes))].sum())
+    return precisao, acertos / len(relevantes), dcg / idcg
+
+
+def intervalo(por_usuario: np.ndarray, por_fold: np.ndarray, confianca: float) -> dict:
+    """Média sobre os usuários com intervalo t de Student (usuários são as amostras independentes)."""
+    valores = por_usuario[~np.isnan(por_usuario)]
+    n = len(valores)
+    media = float(valores.mean()) if n else None
+    inferior = superior = None
+    if n >= 2:
+        # scipy.stats leva ~1,4 s para importar; só a validação cruzada precisa dele
+        from scipy import stats
+
+        margem = stats.t.ppf((1 + confianca) / 2, n - 1) * valores.std(ddof=1) / math.sqrt(n)
+        inferior, superior = media - margem, media + margem
+    folds = por_fold[~np.isnan(por_fold)]
+    return {
+        "media": None if media is None else round(media, 4),
+        "ic_inferior": None if inferior is None else round(float(inferior), 4),
+        "ic_superior": None if superior is None else round(float(superior), 4),
+        "desvio_entre_folds": round(float(folds.std(ddof=1)), 4) if len(folds) >= 2 else None,
+        "usuarios": n,
+    }
+
+
+class MotorAvaliacao:
+    """Avaliação top-K com holdout sem refazer a matriz para cada usuário.
+
+    A matriz de treino (todas as avaliações originais) é montada uma vez. O
+    holdout de um usuário só muda a linha dele, então cada usuário é avaliado
+    com a própria linha mascarada (sem os itens de teste) contra a matriz
+    compartilhada, o que dá o mesmo resultado de pivotar o `treino_df` dele.
+
+    No método "itens" a matriz item × item também é compartilhada: trocar a
+    linha do usuário pela de treino é uma correção de posto 1 em G.
+
+    No método "fatores" um único modelo ALS é treinado sem os itens de teste
+    de nenhum usuário (as divisões são determinísticas), e cada usuário entra
+    por fold-in da própria linha de treino.
+    """
+
+    def __init__(self, avaliacoes: pd.DataFrame, nomes: dict[int, str] | None = None,
+                 trabalhadores: int | None = None, parametros_fatores: dict | None = None,
+                 matriz: MatrizAvaliacoes | VersaoMatriz | None = None, metricas=None):
+        self.av = avaliacoes.copy()
+        self.av.columns = [c.strip().lower() for c in self.av.columns]
+        self.nomes = nomes or {}
+        self.trabalhadores = trabalhadores or min(4, os.cpu_count() or 1)
+
+        # `matriz` (se vier) precisa ser a matriz dessas mesmas avaliações, ou uma versão fixada dela
+        self.matriz = matriz if matriz is not None else MatrizAvaliacoes.de_dataframe(self.av)
+        self.motor = MotorSimilaridade(self.matriz)
+        csr = self.matriz.csr()
+        # quantos usuários avaliaram cada coluna (item)
+        self._usuarios_por_coluna = np.diff(csr.tocsc().indptr)
+        self._ids_itens = np.asarray(self.matriz.ids_itens[:self.matriz.n_itens], dtype=np.int64)
+        self._posicoes = self.av.groupby("usuario_id").indices
+        self._gram = None
+        self.parametros_fatores = parametros_fatores or {}
+        self._modelos_fatores: dict[tuple, ModeloFatores] = {}
+        # `metricas` (se vier) recebe o tempo de cada etapa de `rankings`
+        self.metricas = metricas
+
+    def nome_do_item(self, item_id: int) -> str:
+        return self.nomes.get(item_id, f"Item {item_id}")
+
+    def dividir(self, usuario_id: int, holdout: float = 0.4, min_test: int = 1, seed: int | None = None):
+        """Mesma divisão de `divisao_conjuntos`, mas só com as linhas do usuário.
+
+        Retorna `(treino_u, teste_u, erro)`.
+        """
+        A_u = self.av.take(self._posicoes.get(usuario_id, []))
+        n = len(A_u)
+        if n < 3:
+            return None, None, {"erro": "Usuário com poucas avaliações para holdout (< 3)."}
+
+        test_size = max(min_test, math.ceil(n * holdout))
+        teste_idx = set(A_u.sample(n=test_size, random_state=seed).index.tolist())
+
+        treino_u = A_u.drop(index=teste_idx)
+        teste_u = A_u.loc[list(teste_idx)]
+        return treino_u, teste_u, None
+
+    def topk(self, usuario_id: int, treino_u: pd.DataFrame, K_top: int = 5, K_viz: int = 3,
+             metodo: str = "usuarios", modelo: ModeloFatores | None = None) -> list[int]:
+        """`topk_RECOMENDACAO` sobre o treino em que só a linha do usuário mudou."""
+        return self.rankings(usuario_id, treino_u, K_top, [K_viz], metodo, modelo)[K_viz]
+
+    def rankings(self, usuario_id: int, treino_u: pd.DataFrame, K_top: int, K_viz: list[int],
+                 metodo: str = "usuarios", modelo: ModeloFatores | None = None) -> dict[int, list[int]]:
+        """Os `K_top` primeiros de `topk` para cada valor de `K_viz`, montando o alvo uma vez só.
+
+        A lista de um K_top menor é o começo desta. Os vizinhos saem ordenados
+        (similaridade, depois id), então os de um K_viz menor são o começo dos
+        do maior e a similaridade também é calculada uma vez.
+        """
+        if treino_u.empty:
+            return {kv: [] for kv in K_viz}
+        etapas = self.metricas.etapas("rankings_acuracia") if self.metricas is not None else None
+
+        medias = treino_u.groupby("item_id")["nota"].mean()
+        alvo = np.zeros(self.matriz.n_itens, dtype=np.float64)
+        colunas_treino = np.array([self.matriz.itens[int(i)] for i in medias.index], dtype=np.int64)
+        alvo[colunas_treino] = medias.to_numpy(dtype=np.float64)
+        if etapas is not None:
+            etapas.marcar("alvo")
+
+        if metodo == "itens":
+            return self._topk_itens(usuario_id, alvo, colunas_treino, K_top, K_viz, etapas)
+        if metodo == "fatores":
+            # o modelo não tem vizinhos: a mesma lista para todo K_viz
+            modelo = modelo or self.modelo_fatores()
+            vetor = modelo.dobrar(medias.index, medias.to_numpy())
+            if etapas is not None:
+                etapas.marcar("fold_in")
+            lista = modelo.ordenar(vetor, set(int(i) for i in medias.index))[:K_top]
+            if etapas is not None:
+                etapas.marcar("pontuacao")
+            return {kv: lista for kv in K_viz}
+
+        todos_vizinhos = self.motor.vizinhos(usuario_id, k=max(K_viz), alvo=alvo)
+        if etapas is not None:
+            etapas.marcar("vizinhos")
+        if not todos_vizinhos:
+            return {kv: [] for kv in K_viz}
+
+        # colunas que existiriam no pivot do treino: avaliadas por outro usuário
+        # ou pelo próprio usuário no treino
+        usuarios_por_coluna = self._usuarios_por_coluna.copy()
+        colunas_usuario = [self.matriz.itens[i] for i in self.matriz.avaliados(usuario_id)]
+        usuarios_por_coluna[colunas_usuario] -= 1
+        presentes = usuarios_por_coluna > 0
+        presentes[colunas_treino] = True
+
+        linhas = np.array([self.matriz.linha(u) for u in todos_vizinhos])
+        medias_viz = {kv: linhas[:kv].mean(axis=0) for kv in K_viz}
+        if etapas is not None:
+            etapas.marcar("media_vizinhos")
+
+        avaliados = set(int(i) for i in medias.index)
+        resultado = {}
+        for kv in K_viz:
+            media = medias_viz[kv]
+            notas_preditas = (
+                pd.Series(media[presentes], index=self._ids_itens[presentes])
+                .sort_index()
+                .sort_values(ascending=False)
+            )
+            candidatos = [int(i) for i in notas_preditas.index if i not in avaliados]
+            resultado[kv] = candidatos[:K_top]
+        if etapas is not None:
+            etapas.marcar("candidatos")
+        return resultado
+
+    def _gram_treino(self) -> np.ndarray:
+        if self._gram is None:
+            csr = self.matriz.csr()
+            self._gram = (csr.T @ csr).toarray()
+        return self._gram
+
+    def modelo_fatores(self, holdout: float = 0.4, seed_base: int = 42) -> ModeloFatores:
+        """Modelo treinado com as avaliações de treino de todos os usuários."""
+        chave = (holdout, seed_base)
+        if chave not in self._modelos_fatores:
+            teste_idx = []
+            for uid in self._posicoes:
+                _, teste_u, err = self.dividir(uid, holdout=holdout, min_test=1, seed=seed_base + uid)
+                if not err:
+                    teste_idx.extend(teste_u.index)
+            treino = MatrizAvaliacoes.de_dataframe(self.av.drop(index=teste_idx))
+            self._modelos_fatores[chave] = ModeloFatores.treinar(treino, **self.parametros_fatores)
+        return self._modelos_fatores[chave]
+
+    def _topk_itens(self, usuario_id: int, alvo: np.ndarray, colunas_treino: np.ndarray,
+                    K_top: int, K_viz: list[int], etapas=None) -> dict[int, list[int]]:
+        completa = self.matriz.linha(usuario_id)
+        gram = self._gram_treino() - np.outer(completa, completa) + np.outer(alvo, alvo)
+        # as listas saem ordenadas: as de um K_viz menor são as primeiras colunas
+        todas_colunas, todas_sims = RecomendadorPorItens.listas(gram, max(K_viz))
+        if etapas is not None:
+            etapas.marcar("vizinhos")
+
+        resultado = {}
+        for kv in K_viz:
+            vizinhos = RecomendadorPorItens.montar(todas_colunas[:, :kv], todas_sims[:, :kv])
+            notas, den = RecomendadorPorItens.pontuar(vizinhos, alvo, colunas_treino)
+            candidatos = RecomendadorPorItens.ordenar(self._ids_itens, notas, den, colunas_treino)
+            resultado[kv] = candidatos[:K_top]
+        if etapas is not None:
+            etapas.marcar("pontuacao")
+        return resultado
+
+    def avaliar_usuario(self, uid: int, K_top: int = 5, K_viz: int = 3, holdout: float = 0.4,
+                        limiar: float = 3.0, seed_base: int = 42, metodo: str = "usuarios") -> dict:
+        treino_u, teste_u, err = self.dividir(uid, holdout=holdout, min_test=1, seed=seed_base + uid)
+        if err:
+            return {
+                "usuario_id": uid,
+                **err,
+                "topK": [],
+                "relevantes": [],
+                "acertos": 0,
+                "acuracia": None
+            }
+
+        modelo = self.modelo_fatores(holdout=holdout, seed_base=seed_base) if metodo == "fatores" else None
+        topK_ids = self.topk(uid, treino_u, K_top=K_top, K_viz=K_viz, metodo=metodo, modelo=modelo)
+        relevantes = sorted(set(teste_u[teste_u["nota"] >= limiar]["item_id"].tolist()))
+
+        acertos = sum(1 for iid in topK_ids if iid in relevantes)
+        acuracia = round(acertos / K_top, 4) if K_top > 0 else 0.0
+
+        return {
+            "usuario_id": uid,
+            "top5 recomendações": [{"nome": self.nome_do_item(iid)} for iid in topK_ids],
+            "relevantes": [{"nome": self.nome_do_item(iid)} for iid in relevantes],
+            "acertos": acertos,
+            "acuracia": acuracia
+        }
+
+    def dividir_folds(self, usuario_id: int, folds: int = 5, seed: int | None = None) -> list[np.ndarray] | None:
+        """Posições (em `av`) das avaliações de teste de cada fold do usuário, ou None se ele tem poucas."""
+        posicoes = self._posicoes.get(usuario_id)
+        if posicoes is None or len(posicoes) < max(3, folds):
+            return None
+        ordem = np.random.default_rng(seed).permutation(posicoes)
+        return [np.sort(ordem[f::folds]) for f in range(folds)]
+
+    def validacao_cruzada(self, user_ids: list[int], folds: int = 5, K_top: list[int] = (5,),
+                          K_viz: list[int] = (3,), limiar: list[float] = (3.0,), metodo: str = "usuarios",
+                          seed_base: int = 42, confianca: float = 0.95, etapas=None) -> dict:
+        """precisão@K, recall@K e NDCG@K para cada combinação da grade, com k folds por usuário.
+
+        A divisão, o alvo e a similaridade de cada (usuário, fold) são feitos
+        uma vez; cada K_viz custa uma média/ordenação, e K_top e o limiar só
+        recortam a lista e o conjunto de relevantes. No método "fatores" é
+        treinado um modelo por fold.
+        """
+        inicio = time.perf_counter()
+        K_top, K_viz, limiar = sorted(set(K_top)), sorted(set(K_viz)), sorted(set(limiar))
+        grade = list(itertools.product(K_top, K_viz, limiar))
+
+        divisoes = {}
+        for uid in user_ids:
+            partes = self.dividir_folds(uid, folds=folds, seed=seed_base + uid)
+            if partes is not None:
+                divisoes[uid] = partes
+        usuarios = list(divisoes)
+        if etapas is not None:
+            etapas.marcar("divisao")
+
+        modelos = [None] * folds
+        if metodo == "itens":
+            self._gram_treino()
+        elif metodo == "fatores":
+            for f in range(folds):
+                mascara = np.ones(len(self.av), dtype=bool)
+                for partes in divisoes.values():
+                    mascara[partes[f]] = False
+                treino = MatrizAvaliacoes.de_dataframe(self.av[mascara])
+                modelos[f] = ModeloFatores.treinar(treino, **self.parametros_fatores)
+        if etapas is not None:
+            etapas.marcar("modelos")
+
+        # métrica × combinação da grade × usuário × fold
+        valores = np.full((3, len(grade), len(usuarios), folds), np.nan)
+
+        def avaliar_usuario(j: int):
+            uid = usuarios[j]
+            posicoes = self._posicoes[uid]
+            for f, teste in enumerate(divisoes[uid]):
+                treino_u = self.av.take(np.setdiff1d(posicoes, teste))
+                teste_u = self.av.take(teste)
+                listas = self.rankings(uid, treino_u, max(K_top), K_viz, metodo=metodo, modelo=modelos[f])
+                relevantes = {lim: set(teste_u.loc[teste_u["nota"] >= lim, "item_id"].tolist()) for lim in limiar}
+                for c, (kt, kv, lim) in enumerate(grade):
+                    valores[:, c, j, f] = metricas_ranking(listas[kv], relevantes[lim], kt)
+
+        if self.trabalhadores <= 1 or len(usuarios) <= 1:
+            for j in range(len(usuarios)):
+                avaliar_usuario(j)
+        else:
+            with ThreadPoolExecutor(max_workers=self.trabalhadores) as pool:
+                list(pool.map(avaliar_usuario, range(len(usuarios))))
+        if etapas is not None:
+            etapas.marcar("rankings")
+
+        with warnings.catch_warnings():
+            # usuário (ou fold) sem nenhum relevante: média de fatia vazia vira NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            por_usuario = np.nanmean(valores, axis=3)
+            por_fold = np.nanmean(valores, axis=2)
+        tabela = []
+        for c, (kt, kv, lim) in enumerate(grade):
+            linha = {"K_top": kt, "K_viz": kv, "limiar": lim}
+            for m, nome in enumerate(("precisao", "recall", "ndcg")):
+                linha[nome] = intervalo(por_usuario[m, c], por_fold[m, c], confianca)
+            tabela.append(linha)
+        if etapas is not None:
+            etapas.marcar("agregacao")
+
+        com_ndcg = [linha for linha in tabela if linha["ndcg"]["media"] is not None]
+        return {
+            "metodo": metodo,
+            "folds": folds,
+            "confianca": confianca,
+            "usuarios_avaliados": len(usuarios),
+            "usuarios_ignorados": len(user_ids) - len(usuarios),
+            "combinacoes": len(grade),
+            "tabela": tabela,
+            "melhor_ndcg": max(com_ndcg, key=lambda linha: linha["ndcg"]["media"]) if com_ndcg else None,
+            "tempo_segundos": round(time.perf_counter() - inicio, 3),
+        }
+
+    def avaliar(self, user_ids: list[int], **parametros) -> list[dict]:
+        """Avalia os usuários em paralelo, mantendo a ordem de `user_ids`."""
+        if parametros.get("metodo") == "itens":
+            # monta G antes de abrir as threads
+            self._gram_treino()
+        elif parametros.get("metodo") == "fatores":
+            # treina antes de abrir as threads
+            self.modelo_fatores(holdout=parametros.get("holdout", 0.4), seed_base=parametros.get("seed_base", 42))
+        if self.trabalhadores <= 1 or len(user_ids) <= 1:
+            return [self.avaliar_usuario(uid, **parametros) for uid in user_ids]
+        with ThreadPoolExecutor(max_workers=self.trabalhadores) as pool:
+            return list(pool.map(lambda uid: self.avaliar_usuario(uid, **parametros), user_ids))
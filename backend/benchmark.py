@@ -0,0 +1,414 @@
+"""Benchmark dos caminhos de recomendação e avaliação com dados sintéticos.
+
+Para cada escala (número de avaliações) gera, com seed fixa, um `itens.csv` e
+um `avaliacoes.csv` sintéticos: popularidade dos itens em lei de potência
+(Zipf), atividade dos usuários log-normal (poucos avaliam muito, a maioria
+pouco) e notas com viés de usuário e de item. Cada escala roda num processo
+novo que importa `main` apontando `DADOS_DIR` para esses CSVs, então é medido
+exatamente o código dos endpoints. Por caminho saem latência p50/p99,
+vazão e pico de memória alocada; por escala, tempo de carga e RSS máximo.
+
+O resultado vai para um JSON (com o commit do git) que pode ser comparado
+com outro para achar regressões:
+
+    python benchmark.py [--escalas 1k,100k,1M] [--saida resultado.json]
+    python benchmark.py --comparar base.json --saida novo.json [--tolerancia 0.2]
+
+Variáveis de ambiente do `main` (BUSCA_VIZINHOS, ITENS_VIZINHOS, FATORES_*...)
+valem também aqui e ficam registradas no JSON.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows: sem RSS máximo
+    resource = None
+
+import numpy as np
+import pandas as pd
+
+VERSAO_FORMATO = 1
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CATEGORIAS = ["Cultura", "Gastronomia", "História", "Lazer", "Natureza"]
+LOCALIZACOES = ["Centro", "Zona Norte", "Zona Sul", "Zona Leste", "Zona Oeste"]
+PRECOS = ["Gratuito", "Baixo", "Médio", "Alto"]
+
+# ordem de execução; "avaliar" por último porque muda a matriz
+CAMINHOS = (
+    "recomendar_usuarios",
+    "recomendar_itens",
+    "recomendar_fatores",
+    "recomendar_endpoint",
+    "topk_recomendacao",
+    "usuarios_elegiveis",
+    "acuracia_usuario",
+    "acuracia",
+    "avaliar",
+)
+
+# variáveis do main que mudam o que é medido
+VARIAVEIS_AMBIENTE = (
+    "BUSCA_VIZINHOS", "LSH_TABELAS", "LSH_BITS", "LSH_SONDAS", "LSH_MAX_CANDIDATOS",
+    "ITENS_VIZINHOS", "FATORES_DIMENSAO", "FATORES_REGULARIZACAO", "FATORES_ITERACOES",
+    "CACHE_CAPACIDADE", "CACHE_TTL", "REGISTRO_FSYNC", "MATERIALIZAR", "MATERIALIZAR_CANDIDATOS",
+    "ARMAZEM_COMPARTILHADO",
+)
+
+
+def ler_escala(texto: str) -> int:
+    """'1k' -> 1000, '1M' -> 1000000, '2500' -> 2500."""
+    texto = texto.strip()
+    multiplicador = {"k": 1_000, "K": 1_000, "m": 1_000_000, "M": 1_000_000}.get(texto[-1:], 1)
+    numero = texto[:-1] if multiplicador > 1 else texto
+    return int(float(numero) * multiplicador)
+
+
+def nome_escala(n: int) -> str:
+    if n >= 1_000_000 and n % 1_000_000 == 0:
+        return f"{n // 1_000_000}M"
+    if n >= 1_000 and n % 1_000 == 0:
+        return f"{n // 1_000}k"
+    return str(n)
+
+
+def dimensoes(n_avaliacoes: int) -> tuple[int, int]:
+    """(usuários, itens) para uma escala: ~10 notas por usuário, catálogo bem menor."""
+    n_usuarios = max(20, n_avaliacoes // 10)
+    n_itens = int(np.clip(n_avaliacoes // 500, 30, 2_000))
+    return n_usuarios, n_itens
+
+
+def gerar_dados(n_avaliacoes: int, seed: int = 42, zipf: float = 1.0) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """`(itens, avaliacoes)` sintéticos, no mesmo formato dos CSVs do backend.
+
+    Os pares (usuário, item) são sorteados com peso = atividade × popularidade
+    e repetidos são descartados até chegar em `n_avaliacoes` pares distintos.
+    """
+    rng = np.random.default_rng(seed)
+    n_usuarios, n_itens = dimensoes(n_avaliacoes)
+    n_avaliacoes = min(n_avaliacoes, n_usuarios * n_itens)
+
+    # popularidade em lei de potência sobre uma ordem aleatória dos itens
+    popularidade = 1.0 / np.arange(1, n_itens + 1) ** zipf
+    popularidade = popularidade[rng.permutation(n_itens)]
+    popularidade /= popularidade.sum()
+    atividade = rng.lognormal(mean=0.0, sigma=1.0, size=n_usuarios)
+    atividade /= atividade.sum()
+
+    codigos = np.empty(0, dtype=np.int64)
+    while len(codigos) < n_avaliacoes:
+        falta = n_avaliacoes - len(codigos)
+        u = rng.choice(n_usuarios, size=int(falta * 1.3) + 16, p=atividade)
+        i = rng.choice(n_itens, size=len(u), p=popularidade)
+        novos = np.concatenate([codigos, u.astype(np.int64) * n_itens + i])
+        # unique ordena; o embaralhamento abaixo desfaz a ordem
+        codigos = np.unique(novos)
+    codigos = rng.permutation(codigos)[:n_avaliacoes]
+    u, i = np.divmod(codigos, n_itens)
+
+    vies_usuario = rng.normal(0.0, 0.5, size=n_usuarios)
+    qualidade_item = rng.normal(0.0, 0.7, size=n_itens)
+    notas = 3.2 + vies_usuario[u] + qualidade_item[i] + rng.normal(0.0, 0.8, size=len(u))
+    notas = np.clip(np.rint(notas), 1, 5).astype(np.int64)
+
+    ordem = np.lexsort((i, u))
+    avaliacoes = pd.DataFrame({
+        "usuario_id": u[ordem] + 1,
+        "item_id": i[ordem] + 1,
+        "nota": notas[ordem],
+    })
+
+    ids = np.arange(1, n_itens + 1)
+    itens = pd.DataFrame({
+        "id": ids,
+        "nome": [f"Experiência {k}" for k in ids],
+        "categoria": rng.choice(CATEGORIAS, size=n_itens),
+        "localizacao": rng.choice(LOCALIZACOES, size=n_itens),
+        "preco_estimado": rng.choice(PRECOS, size=n_itens),
+        # em volta do centro de Manaus; o CSV original tem espaço antes de "longitude"
+        "latitude": -3.1 + rng.normal(0.0, 0.05, size=n_itens),
+        " longitude": -60.02 + rng.normal(0.0, 0.05, size=n_itens),
+    })
+    return itens, avaliacoes
+
+
+def gravar_dados(pasta: str, n_avaliacoes: int, seed: int = 42) -> dict:
+    itens, avaliacoes = gerar_dados(n_avaliacoes, seed=seed)
+    itens.to_csv(os.path.join(pasta, "itens.csv"), index=False)
+    avaliacoes.to_csv(os.path.join(pasta, "avaliacoes.csv"), index=False)
+    n_usuarios = int(avaliacoes["usuario_id"].nunique())
+    return {
+        "avaliacoes": len(avaliacoes),
+        "usuarios": n_usuarios,
+        "itens": len(itens),
+        "densidade": round(len(avaliacoes) / (n_usuarios * len(itens)), 6),
+    }
+
+
+def medir(chamada, argumentos: list, repeticoes: int, orcamento: float, amostras_memoria: int = 3) -> dict:
+    """Chama `chamada(arg)` até `repeticoes` vezes ou até estourar `orcamento` segundos.
+
+    A primeira chamada é aquecimento e não entra nas latências. O pico de
+    memória vem de uma passada à parte com tracemalloc, para não pesar no tempo.
+    """
+    chamada(argumentos[0])
+
+    latencias = []
+    inicio = time.perf_counter()
+    for k in range(repeticoes):
+        arg = argumentos[(k + 1) % len(argumentos)]
+        t = time.perf_counter()
+        chamada(arg)
+        latencias.append(time.perf_counter() - t)
+        if time.perf_counter() - inicio > orcamento:
+            break
+    total = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        for arg in argumentos[:amostras_memoria]:
+            chamada(arg)
+        pico = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+    ms = np.asarray(latencias) * 1000.0
+    return {
+        "chamadas": len(latencias),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "media_ms": round(float(ms.mean()), 4),
+        "vazao_por_s": round(len(latencias) / total, 2) if total > 0 else None,
+        "pico_memoria_mb": round(max(pico, 0) / 2**20, 3),
+    }
+
+
+def rss_maximo_mb() -> float | None:
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS devolve bytes, Linux kilobytes
+    return round(kb / 2**20 if sys.platform == "darwin" else kb / 2**10, 1)
+
+
+def executar_escala(pasta: str, caminhos: list[str], repeticoes: int, orcamento: float,
+                    acuracia_ate: int, seed: int) -> dict:
+    """Roda dentro do processo filho: importa o `main` sobre os CSVs de `pasta` e mede cada caminho."""
+    os.environ["DADOS_DIR"] = pasta
+    os.environ.setdefault("SNAPSHOT_DIR", os.path.join(pasta, "dados_binarios"))
+    # só o treino inicial; retreino periódico no meio da medição distorce tudo
+    os.environ["FATORES_TREINO_PERIODICO"] = "0"
+    sys.path.insert(0, BASE_DIR)
+
+    inicio = time.perf_counter()
+    import main
+    carga = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    main.recomendador_fatores.iniciar()
+    while main.recomendador_fatores.modelo is None and main.recomendador_fatores.erro is None:
+        time.sleep(0.01)
+    treino_fatores = time.perf_counter() - inicio
+
+    # idem para a tabela materializada: mede o caminho de consulta, não o de cálculo
+    inicio = time.perf_counter()
+    while main.materializacao is not None and main.materializacao.construida_em is None:
+        time.sleep(0.01)
+    materializacao = time.perf_counter() - inicio
+
+    rng = random.Random(seed)
+    matriz = main.matriz_avaliacoes
+    usuarios = list(matriz.ids_usuarios)
+    itens = list(matriz.ids_itens)
+    amostra = [rng.choice(usuarios) for _ in range(max(repeticoes, 1) + 1)]
+    # usuários do endpoint seguem Zipf, então parte dos pedidos acerta o cache
+    pesos = [1.0 / (k + 1) for k in range(len(usuarios))]
+    amostra_zipf = rng.choices(usuarios, weights=pesos, k=max(repeticoes, 1) + 1)
+    elegiveis = main.usuarios_acuracia(min_avaliacoes=3)["usuario_id"].astype(int).tolist() or usuarios
+
+    # top-K do /acuracia (MotorAvaliacao.topk) sobre divisões feitas antes da medição
+    divisoes = []
+    for u in (rng.choice(elegiveis) for _ in amostra):
+        treino_u, _, err = main.motor_avaliacao.dividir(u, seed=42 + u)
+        if not err:
+            divisoes.append((u, treino_u))
+
+    def recomendar(metodo):
+        return lambda u: main.recomendar(main.RecomendacaoRequest(usuario_id=u, metodo=metodo))
+
+    roteiro = {
+        "recomendar_usuarios": (recomendar("usuarios"), amostra),
+        "recomendar_itens": (recomendar("itens"), amostra),
+        "recomendar_fatores": (recomendar("fatores"), amostra),
+        "recomendar_endpoint": (lambda u: main.recomendar_endpoint(main.RecomendacaoRequest(usuario_id=u)), amostra_zipf),
+        "topk_recomendacao": (lambda par: main.motor_avaliacao.topk(*par), divisoes),
+        "usuarios_elegiveis": (lambda _: main.listar_usuarios_elegiveis(min_avaliacoes=3), [None]),
+        "acuracia_usuario": (lambda u: main.motor_avaliacao.avaliar_usuario(u), [rng.choice(elegiveis) for _ in amostra]),
+        "acuracia": (lambda _: main.calculo_acuracia(metodo="usuarios"), [None]),
+        "avaliar": (
+            lambda par: main.avaliar(main.AvaliacaoSimulada(usuario_id=par[0], item_id=par[1], nota=par[2])),
+            [(u, rng.choice(itens), float(rng.randint(1, 5))) for u in amostra],
+        ),
+    }
+
+    resultados = {}
+    for nome in caminhos:
+        if nome == "acuracia" and matriz.nnz > acuracia_ate:
+            resultados[nome] = {"pulado": f"mais de {acuracia_ate} avaliações (--acuracia-ate)"}
+            continue
+        chamada, argumentos = roteiro[nome]
+        # chamadas de lote inteiro (acurácia, lista de elegíveis) são poucas
+        n = repeticoes if len(argumentos) > 1 else max(1, min(repeticoes, 5))
+        resultados[nome] = medir(chamada, argumentos, n, orcamento)
+
+    main.recomendador_fatores.parar()
+    if main.materializacao is not None:
+        main.materializacao.parar()
+    return {
+        "carga_s": round(carga, 4),
+        "treino_fatores_s": round(treino_fatores, 4),
+        "materializacao_s": round(materializacao, 4),
+        "rss_maximo_mb": rss_maximo_mb(),
+        "caminhos": resultados,
+    }
+
+
+def commit_atual() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=BASE_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "alteracoes_locais": bool(status) if status is not None else None}
+
+
+def rodar(escalas: list[int], caminhos: list[str], repeticoes: int, orcamento: float,
+          acuracia_ate: int, seed: int) -> dict:
+    resultado = {
+        "versao_formato": VERSAO_FORMATO,
+        **commit_atual(),
+        "data": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parametros": {"repeticoes": repeticoes, "orcamento_s": orcamento, "acuracia_ate": acuracia_ate, "seed": seed},
+        "ambiente": {v: os.environ[v] for v in VARIAVEIS_AMBIENTE if v in os.environ},
+        "escalas": {},
+    }
+    for n in escalas:
+        pasta = tempfile.mkdtemp(prefix=f"benchmark-{nome_escala(n)}-")
+        try:
+            inicio = time.perf_counter()
+            dados = gravar_dados(pasta, n, seed=seed)
+            geracao = time.perf_counter() - inicio
+            print(f"[{nome_escala(n)}] {dados['avaliacoes']} avaliações, {dados['usuarios']} usuários, "
+                  f"{dados['itens']} itens", file=sys.stderr)
+
+            saida = os.path.join(pasta, "resultado.json")
+            # processo novo por escala: carga e RSS máximo sem herança da escala anterior
+            subprocess.run([
+                sys.executable, os.path.abspath(__file__), "--_filho", pasta, "--saida", saida,
+                "--caminhos", ",".join(caminhos), "--repeticoes", str(repeticoes),
+                "--orcamento", str(orcamento), "--acuracia-ate", str(acuracia_ate), "--seed", str(seed),
+            ], check=True)
+            with open(saida, encoding="utf-8") as f:
+                medicao = json.load(f)
+        finally:
+            # snapshot binário, trava e log do /avaliar ficam todos dentro da pasta
+            shutil.rmtree(pasta, ignore_errors=True)
+
+        resultado["escalas"][nome_escala(n)] = {"dados": dados, "geracao_s": round(geracao, 4), **medicao}
+        for nome, m in medicao["caminhos"].items():
+            if "pulado" in m:
+                print(f"  {nome:22s} pulado", file=sys.stderr)
+            else:
+                print(f"  {nome:22s} p50 {m['p50_ms']:10.3f} ms  p99 {m['p99_ms']:10.3f} ms  "
+                      f"{m['vazao_por_s']:10.1f}/s  {m['pico_memoria_mb']:8.2f} MB", file=sys.stderr)
+    return resultado
+
+
+def comparar(base: dict, atual: dict, tolerancia: float) -> list[dict]:
+    """Caminhos cujo p50 ou p99 piorou mais que `tolerancia` (0.2 = 20%) em relação à base."""
+    regressoes = []
+    for escala, medicao in atual["escalas"].items():
+        anteriores = base.get("escalas", {}).get(escala, {}).get("caminhos", {})
+        for nome, m in medicao["caminhos"].items():
+            antes = anteriores.get(nome)
+            if not antes or "pulado" in m or "pulado" in antes:
+                continue
+            for metrica in ("p50_ms", "p99_ms"):
+                if antes[metrica] > 0 and m[metrica] > antes[metrica] * (1 + tolerancia):
+                    regressoes.append({
+                        "escala": escala, "caminho": nome, "metrica": metrica,
+                        "base": antes[metrica], "atual": m[metrica],
+                        "razao": round(m[metrica] / antes[metrica], 3),
+                    })
+    return regressoes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark dos endpoints com dados sintéticos.")
+    parser.add_argument("--escalas", default="1k,100k,1M", help="número de avaliações por escala (ex.: 1k,100k,1M)")
+    parser.add_argument("--caminhos", default=",".join(CAMINHOS), help="caminhos medidos, separados por vírgula")
+    parser.add_argument("--repeticoes", type=int, default=200, help="chamadas medidas por caminho")
+    parser.add_argument("--orcamento", type=float, default=30.0, help="segundos no máximo por caminho")
+    parser.add_argument("--acuracia-ate", type=ler_escala, default=100_000,
+                        help="pula /acuracia completo acima deste número de avaliações")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", default=None, help="arquivo JSON do resultado")
+    parser.add_argument("--comparar", default=None, help="JSON de uma execução anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="piora relativa aceita no --comparar")
+    parser.add_argument("--_filho", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    caminhos = [c for c in args.caminhos.split(",") if c]
+    desconhecidos = sorted(set(caminhos) - set(CAMINHOS))
+    if desconhecidos:
+        parser.error(f"caminhos desconhecidos: {', '.join(desconhecidos)}")
+    caminhos = [c for c in CAMINHOS if c in caminhos]
+
+    if args._filho:
+        medicao = executar_escala(args._filho, caminhos, args.repeticoes, args.orcamento, args.acuracia_ate, args.seed)
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(medicao, f)
+        sys.exit(0)
+
+    escalas = [ler_escala(e) for e in args.escalas.split(",") if e]
+    resultado = rodar(escalas, caminhos, args.repeticoes, args.orcamento, args.acuracia_ate, args.seed)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        resultado["comparacao"] = {
+            "base": base.get("commit"),
+            "tolerancia": args.tolerancia,
+            "regressoes": comparar(base, resultado, args.tolerancia),
+        }
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=1)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    else:
+        print(texto)
+
+    if args.comparar:
+        regressoes = resultado["comparacao"]["regressoes"]
+        for r in regressoes:
+            print(f"REGRESSÃO [{r['escala']}] {r['caminho']} {r['metrica']}: "
+                  f"{r['base']} -> {r['atual']} ms (x{r['razao']})", file=sys.stderr)
+        sys.exit(1 if regressoes else 0)
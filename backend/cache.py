@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheRecomendacoes:
+    """Cache LRU de respostas do /recomendar, invalidado por versão.
+
+    Cada entrada guarda a versão global e a versão do usuário de quando foi
+    calculada; se alguma delas mudou (ou a entrada passou do `ttl`), ela não
+    vale mais. O `/avaliar` só incrementa a versão dos usuários cuja
+    recomendação pode ter mudado, então as demais entradas continuam válidas.
+    """
+
+    def __init__(self, capacidade: int = 10_000, ttl: float | None = 300.0):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._entradas: OrderedDict = OrderedDict()
+        self.versao_global = 0
+        self._versoes: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+        self.acertos = 0
+        self.faltas = 0
+        self.expulsoes = 0
+        self.expiradas = 0
+        self.invalidadas = 0
+
+    def marca(self, usuario_id: int) -> tuple[int, int]:
+        """Versões atuais; pegue antes de calcular e passe para `guardar`."""
+        with self._lock:
+            return self.versao_global, self._versoes.get(usuario_id, 0)
+
+    def obter(self, chave, usuario_id: int):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.faltas += 1
+                return None
+
+            marca, criada_em, valor = entrada
+            if marca != (self.versao_global, self._versoes.get(usuario_id, 0)):
+                del self._entradas[chave]
+                self.invalidadas += 1
+                self.faltas += 1
+                return None
+            if self.ttl is not None and time.monotonic() - criada_em > self.ttl:
+                del self._entradas[chave]
+                self.expiradas += 1
+                self.faltas += 1
+                return None
+
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def guardar(self, chave, marca: tuple[int, int], valor):
+        if self.capacidade <= 0:
+            return
+        with self._lock:
+            self._entradas[chave] = (marca, time.monotonic(), valor)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.capacidade:
+                self._entradas.popitem(last=False)
+                self.expulsoes += 1
+
+    def invalidar_usuarios(self, usuario_ids):
+        with self._lock:
+            for u in usuario_ids:
+                self._versoes[u] = self._versoes.get(u, 0) + 1
+
+    def invalidar_tudo(self):
+        with self._lock:
+            self.versao_global += 1
+
+    def estado(self) -> dict:
+        with self._lock:
+            consultas = self.acertos + self.faltas
+            return {
+                "capacidade": self.capacidade,
+                "ttl_segundos": self.ttl,
+                "entradas": len(self._entradas),
+                "acertos": self.acertos,
+                "faltas": self.faltas,
+                "taxa_acerto": round(self.acertos / consultas, 4) if consultas else None,
+                "expulsoes": self.expulsoes,
+                "expiradas": self.expiradas,
+                "invalidadas": self.invalidadas,
+                "versao_global": self.versao_global,
+            }
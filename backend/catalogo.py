@@ -0,0 +1,140 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from indice_geografico import IndiceGeografico
+
+
+class CatalogoItens:
+    """Índice do `itens.csv` montado uma vez na carga.
+
+    Guarda id → linha em um array, os registros prontos para a resposta e,
+    para `localizacao`, `preco_estimado` e `categoria`, uma máscara booleana
+    por valor distinto. Filtrar candidatos vira um AND de máscaras. As
+    coordenadas vão para um `IndiceGeografico` (busca por raio, k mais
+    próximos e retângulo).
+    """
+
+    COLUNAS_FILTRO = ("localizacao", "preco_estimado", "categoria")
+
+    def __init__(self, itens: pd.DataFrame):
+        self.df = itens
+        self.ids = itens["id"].to_numpy(dtype=np.int64)
+        self.registros = itens.to_dict(orient="records")
+
+        self._linha_por_id = np.full(int(self.ids.max()) + 1 if len(self.ids) else 0, -1, dtype=np.int64)
+        # em id repetido vale a primeira linha, como no `nome_do_item` antigo
+        self._linha_por_id[self.ids[::-1]] = np.arange(len(self.ids))[::-1]
+
+        if "nome" in itens.columns:
+            self.nomes = {int(i): str(n) for i, n in zip(self.ids[::-1], itens["nome"].to_numpy()[::-1])}
+        else:
+            self.nomes = {}
+
+        # coluna -> valor (como está no CSV, NaN vira "") -> máscara das linhas
+        self._indices: dict[str, dict[str, np.ndarray]] = {}
+        for coluna in self.COLUNAS_FILTRO:
+            if coluna not in itens.columns:
+                continue
+            valores = itens[coluna].fillna("").astype(str)
+            self._indices[coluna] = {
+                valor: (valores == valor).to_numpy() for valor in valores.unique()
+            }
+
+        # o itens.csv tem espaço antes de "longitude"
+        colunas = {str(c).strip(): c for c in itens.columns}
+        if "latitude" in colunas and "longitude" in colunas:
+            self.geo = IndiceGeografico(
+                pd.to_numeric(itens[colunas["latitude"]], errors="coerce"),
+                pd.to_numeric(itens[colunas["longitude"]], errors="coerce"),
+            )
+        else:
+            self.geo = IndiceGeografico([], [])
+
+        self.mascara_contem = lru_cache(maxsize=256)(self._mascara_contem)
+        self.mascara_igual = lru_cache(maxsize=256)(self._mascara_igual)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def nome(self, item_id: int) -> str:
+        return self.nomes.get(item_id, f"Item {item_id}")
+
+    def linhas(self, item_ids) -> np.ndarray:
+        """Linha de cada id no catálogo (-1 para id desconhecido)."""
+        ids = np.asarray(item_ids, dtype=np.int64)
+        resultado = np.full(len(ids), -1, dtype=np.int64)
+        validos = (ids >= 0) & (ids < len(self._linha_por_id))
+        resultado[validos] = self._linha_por_id[ids[validos]]
+        return resultado
+
+    def tem_coluna(self, coluna: str) -> bool:
+        return coluna in self._indices
+
+    def _mascara_contem(self, coluna: str, texto: str) -> np.ndarray:
+        # mesmo critério de `str.contains(texto, case=False)`, mas só nos valores distintos
+        padrao = re.compile(texto, flags=re.IGNORECASE)
+        mascara = np.zeros(len(self.ids), dtype=bool)
+        for valor, linhas in self._indices[coluna].items():
+            if padrao.search(valor):
+                mascara |= linhas
+        return mascara
+
+    def _mascara_igual(self, coluna: str, texto: str) -> np.ndarray:
+        # igualdade sem diferenciar maiúsculas, como `str.lower() == texto.lower()`
+        mascara = np.zeros(len(self.ids), dtype=bool)
+        for valor, linhas in self._indices[coluna].items():
+            if valor.lower() == texto.lower():
+                mascara |= linhas
+        return mascara
+
+    def proximidade(self, latitude: float, longitude: float, raio_km: float | None = None,
+                    k: int | None = None) -> np.ndarray:
+        """Distância em km por linha do catálogo; NaN nas linhas fora do raio / dos `k` mais próximos."""
+        if k is not None:
+            linhas, distancias = self.geo.mais_proximos(latitude, longitude, k, raio_km=raio_km)
+        else:
+            linhas, distancias = self.geo.no_raio(latitude, longitude, raio_km)
+        resultado = np.full(len(self.ids), np.nan)
+        resultado[linhas] = distancias
+        return resultado
+
+    def registros_com_distancia(self, linhas, distancias) -> list[dict]:
+        return [
+            {**self.registros[r], "distancia_km": round(float(d), 3)}
+            for r, d in zip(np.asarray(linhas).tolist(), np.asarray(distancias).tolist())
+        ]
+
+    def filtrar(self, item_ids: list[int], localizacao: str | None = None, preco_estimado: str | None = None,
+                categoria: str | None = None, limite: int | None = None,
+                distancias: np.ndarray | None = None) -> list[dict]:
+        """Registros dos itens, na ordem de `item_ids`, que passam pelos filtros.
+
+        Com `distancias` (de `proximidade`), só entram as linhas com distância,
+        e ela vai junto no registro.
+        """
+        mascara = np.ones(len(self.ids), dtype=bool)
+        if distancias is not None:
+            mascara &= ~np.isnan(distancias)
+        if localizacao and self.tem_coluna("localizacao"):
+            mascara &= self.mascara_contem("localizacao", localizacao)
+        if preco_estimado and self.tem_coluna("preco_estimado"):
+            mascara &= self.mascara_igual("preco_estimado", preco_estimado)
+        if categoria and self.tem_coluna("categoria"):
+            mascara &= self.mascara_igual("categoria", categoria)
+
+        linhas = self.linhas(item_ids)
+        linhas = linhas[linhas >= 0]
+        linhas = linhas[mascara[linhas]]
+        if limite is not None:
+            linhas = linhas[:limite]
+        if distancias is not None:
+            return self.registros_com_distancia(linhas, distancias[linhas])
+        return [dict(self.registros[r]) for r in linhas]
+
+    def contagem(self, coluna: str) -> dict[str, int]:
+        """Quantos itens há em cada valor da coluna (sem os vazios)."""
+        contagem = self.df[coluna].dropna().value_counts(sort=False)
+        return {k: int(v) for k, v in contagem.items()}
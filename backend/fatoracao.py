@@ -0,0 +1,248 @@
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+
+from matriz_avaliacoes import MatrizAvaliacoes, VersaoMatriz
+
+
+def _resolver(notas: sparse.csr_matrix, fixos: np.ndarray, regularizacao: float, bloco: int) -> np.ndarray:
+    """Um meio-passo do ALS: resolve todas as linhas de `notas` contra os fatores `fixos`.
+
+    Para cada linha u: (Yᵤᵀ Yᵤ + λ nᵤ I) xᵤ = Yᵤᵀ rᵤ, com Yᵤ = fatores dos itens
+    observados. As matrizes f × f de um bloco de linhas saem de um único produto
+    esparso (indicador × vec(y yᵀ)) e são resolvidas em lote.
+    """
+    n, f = notas.shape[0], fixos.shape[1]
+    externos = np.einsum("if,ig->ifg", fixos, fixos).reshape(len(fixos), f * f)
+    indicador = notas.copy()
+    indicador.data = np.ones_like(indicador.data)
+    contagem = np.diff(notas.indptr)
+    identidade = np.eye(f)
+
+    resultado = np.zeros((n, f), dtype=np.float64)
+    for ini in range(0, n, bloco):
+        fim = min(n, ini + bloco)
+        a = np.asarray(indicador[ini:fim] @ externos).reshape(-1, f, f)
+        a += regularizacao * np.maximum(contagem[ini:fim], 1)[:, None, None] * identidade
+        b = np.asarray(notas[ini:fim] @ fixos)
+        resultado[ini:fim] = np.linalg.solve(a, b[..., None])[..., 0]
+    return resultado
+
+
+def treinar_als(csr: sparse.csr_matrix, fatores: int = 10, regularizacao: float = 0.1,
+                iteracoes: int = 15, seed: int = 42, bloco: int = 4096) -> tuple[np.ndarray, np.ndarray, float]:
+    """ALS explícito (ALS-WR) sobre as células observadas; retorna `(P, Q, media)`.
+
+    A nota prevista é `media + P[u] · Q[i]`.
+    """
+    media = float(csr.data.mean()) if csr.nnz else 0.0
+    centradas = csr.copy()
+    centradas.data = centradas.data - media
+    transpostas = centradas.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    P = np.zeros((csr.shape[0], fatores), dtype=np.float64)
+    Q = rng.normal(scale=0.1, size=(csr.shape[1], fatores))
+    for _ in range(iteracoes):
+        P = _resolver(centradas, Q, regularizacao, bloco)
+        Q = _resolver(transpostas, P, regularizacao, bloco)
+    return P, Q, media
+
+
+class ModeloFatores:
+    """Fatores latentes de um treino; não muda depois de pronto.
+
+    Só `dobrados` cresce: vetores de usuários recalculados (fold-in) contra os
+    fatores de itens fixos, para notas que chegaram depois do treino.
+    """
+
+    def __init__(self, P: np.ndarray, Q: np.ndarray, media: float, ids_usuarios: list[int],
+                 ids_itens: list[int], regularizacao: float, versao_matriz: int, duracao: float = 0.0):
+        self.P = P
+        self.Q = Q
+        self.media = media
+        self.regularizacao = regularizacao
+        self.versao_matriz = versao_matriz
+        self.duracao = duracao
+        self.usuarios = {u: k for k, u in enumerate(ids_usuarios)}
+        self.colunas = {i: k for k, i in enumerate(ids_itens)}
+        self.ids_itens = np.asarray(ids_itens, dtype=np.int64)
+        # usuario_id -> (versão da matriz, vetor)
+        self.dobrados: dict[int, tuple[int, np.ndarray]] = {}
+
+    @classmethod
+    def treinar(cls, matriz: MatrizAvaliacoes, fatores: int = 10, regularizacao: float = 0.1,
+                iteracoes: int = 15, seed: int = 42) -> "ModeloFatores":
+        inicio = time.perf_counter()
+        csr, ids_usuarios, ids_itens, versao = matriz.instantanea()
+        P, Q, media = treinar_als(csr, fatores=fatores, regularizacao=regularizacao, iteracoes=iteracoes, seed=seed)
+        return cls(P, Q, media, ids_usuarios, ids_itens, regularizacao, versao, time.perf_counter() - inicio)
+
+    def dobrar(self, item_ids, notas) -> np.ndarray:
+        """Vetor de um usuário a partir das notas dele, com os fatores de itens fixos."""
+        pares = [(self.colunas[int(i)], float(n)) for i, n in zip(item_ids, notas) if int(i) in self.colunas]
+        f = self.Q.shape[1]
+        if not pares:
+            return np.zeros(f, dtype=np.float64)
+        colunas = np.array([c for c, _ in pares], dtype=np.int64)
+        valores = np.array([n for _, n in pares], dtype=np.float64)
+        Y = self.Q[colunas]
+        a = Y.T @ Y + self.regularizacao * len(colunas) * np.eye(f)
+        return np.linalg.solve(a, Y.T @ (valores - self.media))
+
+    def vetor(self, usuario_id: int) -> np.ndarray | None:
+        dobrado = self.dobrados.get(usuario_id)
+        if dobrado is not None:
+            return dobrado[1]
+        r = self.usuarios.get(usuario_id)
+        return None if r is None else self.P[r]
+
+    def notas(self, vetor: np.ndarray) -> np.ndarray:
+        """Nota prevista de cada item do modelo (na ordem de `ids_itens`)."""
+        return self.media + self.Q @ vetor
+
+    def ordenar(self, vetor: np.ndarray, avaliados: set[int]) -> list[int]:
+        """Itens do modelo que o usuário não avaliou, da maior nota prevista para a menor."""
+        notas = self.notas(vetor)
+        livres = np.array([int(i) not in avaliados for i in self.ids_itens], dtype=bool)
+        idx = np.flatnonzero(livres)
+        ordem = np.lexsort((self.ids_itens[idx], -np.round(notas[idx], 9)))
+        return [int(i) for i in self.ids_itens[idx[ordem]]]
+
+
+class RecomendadorFatores:
+    """Serve um `ModeloFatores` e o retreina em segundo plano.
+
+    O treino roda em uma thread separada sobre uma cópia da matriz; quando
+    termina, o modelo novo entra no lugar do antigo numa troca de referência.
+    Entre um treino e outro, cada `/avaliar` só refaz o vetor do usuário
+    (fold-in), então a nota entra na recomendação dele na hora. Com
+    `intervalo=None` não há retreino periódico: a thread treina ao subir e
+    depois quando `solicitar_treino` pede ou quando o fold-in não basta (nota
+    em item que o modelo não conhece, usuário sem vetor) e a matriz já passou
+    da versão do modelo.
+    """
+
+    def __init__(self, matriz: MatrizAvaliacoes, fatores: int = 10, regularizacao: float = 0.1,
+                 iteracoes: int = 15, intervalo: float | None = 60.0, seed: int = 42):
+        self.matriz = matriz
+        self.fatores = fatores
+        self.regularizacao = regularizacao
+        self.iteracoes = iteracoes
+        self.intervalo = intervalo
+        self.seed = seed
+
+        self.modelo: ModeloFatores | None = None
+        # muda a cada troca de modelo ou fold-in (entra na chave do cache)
+        self.versao = 0
+        self.treinos = 0
+        self.erro: str | None = None
+        # usuario_id -> versão da matriz na última nota dele; as que o treino
+        # em curso não viu entram por fold-in quando ele termina
+        self._alterados: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._lock_thread = threading.Lock()
+        self._acordar = threading.Event()
+        self._forcar = False
+        self._parar = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def treinar(self) -> ModeloFatores:
+        """Treina um modelo novo e troca pelo atual."""
+        novo = ModeloFatores.treinar(
+            self.matriz, fatores=self.fatores, regularizacao=self.regularizacao,
+            iteracoes=self.iteracoes, seed=self.seed,
+        )
+        with self._lock:
+            # notas que chegaram durante o treino ficaram fora da cópia
+            self._alterados = {u: v for u, v in self._alterados.items() if v > novo.versao_matriz}
+            for u in self._alterados:
+                self._dobrar(novo, u)
+            self.modelo = novo
+            self.versao += 1
+            self.treinos += 1
+        return novo
+
+    def _dobrar(self, modelo: ModeloFatores, usuario_id: int) -> bool:
+        """Refaz o vetor do usuário; False se ele avaliou item que o modelo não conhece."""
+        avaliados = sorted(self.matriz.avaliados(usuario_id))
+        linha = self.matriz.linha(usuario_id)
+        notas = [linha[self.matriz.itens[i]] for i in avaliados]
+        modelo.dobrados[usuario_id] = (self.matriz.versao, modelo.dobrar(avaliados, notas))
+        return all(i in modelo.colunas for i in avaliados)
+
+    def atualizar(self, usuario_id: int):
+        """Fold-in do usuário depois de uma nota nova dele."""
+        with self._lock:
+            self._alterados[usuario_id] = self.matriz.versao
+            if self.modelo is None:
+                return
+            cobertos = self._dobrar(self.modelo, usuario_id)
+            self.versao += 1
+        if not cobertos:
+            self._pedir_treino()
+
+    def _pedir_treino(self):
+        """Sem retreino periódico, acorda a thread se a matriz já passou da versão do modelo."""
+        modelo = self.modelo
+        if self.intervalo is None and modelo is not None and modelo.versao_matriz != self.matriz.versao:
+            self._acordar.set()
+
+    def _executar(self):
+        while not self._parar.is_set():
+            self._acordar.clear()
+            forcar, self._forcar = self._forcar, False
+            modelo = self.modelo
+            if forcar or modelo is None or modelo.versao_matriz != self.matriz.versao:
+                try:
+                    self.treinar()
+                    self.erro = None
+                except Exception as e:  # mantém o modelo anterior no ar
+                    self.erro = repr(e)
+            self._acordar.wait(self.intervalo)
+
+    def iniciar(self):
+        """Sobe a thread de treino (o primeiro treino começa na hora); chamadas seguintes não fazem nada."""
+        with self._lock_thread:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name="treino-fatores", daemon=True)
+                self._thread.start()
+
+    def solicitar_treino(self):
+        self._forcar = True
+        self._acordar.set()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+
+    def recomendar(self, usuario_id: int, matriz: VersaoMatriz | None = None) -> list[int] | None:
+        """Ids dos itens em ordem de nota prevista; None se ainda não há modelo/vetor."""
+        modelo = self.modelo
+        if modelo is None:
+            return None
+        vetor = modelo.vetor(usuario_id)
+        if vetor is None:
+            self._pedir_treino()
+            return None
+        fonte = self.matriz if matriz is None else matriz
+        return modelo.ordenar(vetor, fonte.avaliados(usuario_id))
+
+    def estado(self) -> dict:
+        modelo = self.modelo
+        return {
+            "pronto": modelo is not None,
+            "fatores": self.fatores,
+            "regularizacao": self.regularizacao,
+            "iteracoes": self.iteracoes,
+            "intervalo_segundos": self.intervalo,
+            "thread_ativa": self._thread is not None,
+            "treinos": self.treinos,
+            "versao_matriz_treino": modelo.versao_matriz if modelo else None,
+            "versao_matriz_atual": self.matriz.versao,
+            "duracao_ultimo_treino_s": round(modelo.duracao, 4) if modelo else None,
+            "usuarios_dobrados": len(modelo.dobrados) if modelo else 0,
+            "erro": self.erro,
+        }
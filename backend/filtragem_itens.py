@@ -0,0 +1,214 @@
+import threading
+
+import numpy as np
+from scipy import sparse
+
+from matriz_avaliacoes import MatrizAvaliacoes, VersaoMatriz
+
+
+class RecomendadorPorItens:
+    """Filtragem colaborativa baseada em itens.
+
+    Mantém a matriz de produtos internos item × item (G = Mᵀ M) e, a partir
+    dela, os `k` itens mais similares (cosseno) de cada item. A nota prevista
+    de um item j para o usuário é a média das notas que ele deu aos vizinhos
+    de j, ponderada pela similaridade, então o pedido não varre os outros
+    usuários. Uma nota nova só muda a linha/coluna do item avaliado em G; a
+    lista dele é recalculada e, nas dos outros itens, só a entrada dele muda.
+    """
+
+    def __init__(self, matriz: MatrizAvaliacoes, k: int = 20):
+        self.matriz = matriz
+        self.k = k
+        self.gram = np.zeros((0, 0), dtype=np.float64)
+        # vizinhos de cada item: colunas (-1 = vago) e similaridades, n × k
+        self._colunas = np.zeros((0, k), dtype=np.int64)
+        self._sims = np.zeros((0, k), dtype=np.float64)
+        self.vizinhos = sparse.csr_matrix((0, 0), dtype=np.float64)
+        self.atualizacoes = 0
+        self._lock = threading.RLock()
+
+    def construir(self):
+        with self._lock:
+            csr = self.matriz.csr()
+            self.gram = (csr.T @ csr).toarray()
+            self._colunas, self._sims = self.listas(self.gram, self.k)
+            self.vizinhos = self.montar(self._colunas, self._sims)
+
+    @staticmethod
+    def listas(gram: np.ndarray, k: int, linhas: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Os `k` vizinhos (cosseno > 0) de cada item em `linhas` (todos, se None).
+
+        Empates ficam com o menor item (menor coluna).
+        """
+        n = gram.shape[0]
+        linhas = np.arange(n) if linhas is None else np.asarray(linhas, dtype=np.int64)
+        normas = np.sqrt(np.clip(np.diag(gram), 0, None))
+
+        den = np.outer(normas[linhas], normas)
+        sims = np.zeros((len(linhas), n), dtype=np.float64)
+        np.divide(gram[linhas], den, out=sims, where=den != 0)
+        sims[np.arange(len(linhas)), linhas] = 0.0
+
+        colunas = np.full((len(linhas), k), -1, dtype=np.int64)
+        valores = np.zeros((len(linhas), k), dtype=np.float64)
+        ordem = np.argsort(-np.round(sims, 9), axis=1, kind="stable")[:, :k]
+        escolhidas = np.take_along_axis(sims, ordem, axis=1)
+        positivas = escolhidas > 0
+        colunas[:, :ordem.shape[1]] = np.where(positivas, ordem, -1)
+        valores[:, :ordem.shape[1]] = np.where(positivas, escolhidas, 0.0)
+        return colunas, valores
+
+    @staticmethod
+    def montar(colunas: np.ndarray, sims: np.ndarray) -> sparse.csr_matrix:
+        # S[j, i] = cos(i, j) para cada vizinho i de j; k posições por linha,
+        # as vagas ficam na coluna 0 com valor 0 (não somam nada no produto)
+        n, k = colunas.shape
+        indptr = np.arange(n + 1, dtype=np.int64) * k
+        dados = np.where(colunas >= 0, sims, 0.0).ravel()
+        return sparse.csr_matrix((dados, np.maximum(colunas, 0).ravel(), indptr), shape=(n, n))
+
+    def atualizar(self, usuario_id: int, coluna: int, antigo: float, novo: float):
+        """Aplica a mudança de uma célula (usuário, item) devolvida por `MatrizAvaliacoes.adicionar`."""
+        with self._lock:
+            self._crescer()
+            linha = self.matriz.linha(usuario_id)
+            delta = (novo - antigo) * linha
+            delta[coluna] = 0.0
+            self.gram[coluna] += delta
+            self.gram[:, coluna] += delta
+            self.gram[coluna, coluna] += novo ** 2 - antigo ** 2
+
+            self._corrigir(np.array([coluna], dtype=np.int64))
+            self.vizinhos = self.montar(self._colunas, self._sims)
+            self.atualizacoes += 1
+
+    def atualizar_lote(self, antes: VersaoMatriz, usuario_ids):
+        """Aplica de uma vez as notas de um lote, comparando a linha de cada usuário em `antes` e agora.
+
+        G muda em `novaᵀ nova − antigaᵀ antiga` por usuário, só nas linhas e
+        colunas dos itens cuja nota mudou; as listas são acertadas uma vez só
+        no fim.
+        """
+        with self._lock:
+            self._crescer()
+            n = self.gram.shape[0]
+            alterados = []
+            for u in usuario_ids:
+                nova = self.matriz.linha(u)
+                antiga = np.zeros(n, dtype=np.float64)
+                r = antes.usuarios.get(u)
+                if r is not None and r < antes.n_usuarios:
+                    antiga[:antes.n_itens] = antes.linha(u)
+                suporte = np.union1d(np.flatnonzero(antiga), np.flatnonzero(nova))
+                vn, va = nova[suporte], antiga[suporte]
+                self.gram[np.ix_(suporte, suporte)] += np.outer(vn, vn) - np.outer(va, va)
+                alterados.append(suporte[vn != va])
+            if not alterados:
+                return
+
+            self._corrigir(np.unique(np.concatenate(alterados)))
+            self.vizinhos = self.montar(self._colunas, self._sims)
+            self.atualizacoes += 1
+
+    def _corrigir(self, alterados: np.ndarray):
+        """Acerta as listas depois que G mudou só nas linhas/colunas `alterados`; chamar com `_lock`.
+
+        Nos outros itens só muda o cosseno com os alterados: a lista antiga
+        sem eles, mais eles com o valor novo, já é a lista certa se o k-ésimo
+        dela não ficou atrás do k-ésimo antigo (quem estava fora continua
+        atrás dele). Fora isso, e para os próprios alterados, a lista é
+        recalculada inteira com `listas`.
+        """
+        n, k = self.gram.shape[0], self.k
+        normas = np.sqrt(np.clip(np.diag(self.gram), 0, None))
+        den = np.outer(normas[alterados], normas)
+        novas = np.zeros((len(alterados), n), dtype=np.float64)
+        np.divide(self.gram[alterados], den, out=novas, where=den != 0)
+
+        # itens com cosseno > 0 com algum alterado, ou que tinham um deles na lista
+        tinham = np.isin(self._colunas, alterados)
+        tocados = np.any(novas > 0, axis=0) | np.any(tinham, axis=1)
+        tocados[alterados] = False
+        linhas = np.flatnonzero(tocados)
+
+        colunas = np.concatenate([
+            np.where(tinham[linhas], -1, self._colunas[linhas]),
+            np.broadcast_to(alterados, (len(linhas), len(alterados))),
+        ], axis=1)
+        sims = np.concatenate([self._sims[linhas], novas[:, linhas].T], axis=1)
+        validas = (colunas >= 0) & (sims > 0)
+        # mesma ordem de `listas`: similaridade arredondada, empate para a menor coluna
+        arredondadas = np.where(validas, np.round(sims, 9), -np.inf)
+        ordem = np.lexsort((np.where(validas, colunas, n), -arredondadas))[:, :k]
+        colunas = np.take_along_axis(np.where(validas, colunas, -1), ordem, axis=1)
+        sims = np.take_along_axis(np.where(validas, sims, 0.0), ordem, axis=1)
+
+        cheia = self._colunas[linhas, -1] >= 0
+        limite, coluna_limite = np.round(self._sims[linhas, -1], 9), self._colunas[linhas, -1]
+        ultima, coluna_ultima = np.round(sims[:, -1], 9), colunas[:, -1]
+        certas = ~cheia | ((coluna_ultima >= 0) & (
+            (ultima > limite) | ((ultima == limite) & (coluna_ultima <= coluna_limite))))
+        self._colunas[linhas[certas]] = colunas[certas]
+        self._sims[linhas[certas]] = sims[certas]
+
+        refazer = np.concatenate([alterados, linhas[~certas]])
+        colunas, sims = self.listas(self.gram, k, refazer)
+        self._colunas[refazer] = colunas
+        self._sims[refazer] = sims
+
+    def _crescer(self):
+        """Abre espaço em G e nas listas para itens novos; chamar com `_lock`."""
+        n = self.matriz.n_itens
+        if n > self.gram.shape[0]:
+            m = self.gram.shape[0]
+            maior = np.zeros((n, n), dtype=np.float64)
+            maior[:m, :m] = self.gram
+            self.gram = maior
+            self._colunas = np.vstack([self._colunas, np.full((n - m, self.k), -1, dtype=np.int64)])
+            self._sims = np.vstack([self._sims, np.zeros((n - m, self.k), dtype=np.float64)])
+
+    @staticmethod
+    def pontuar(vizinhos: sparse.csr_matrix, alvo: np.ndarray, avaliados: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Nota prevista de cada item e o peso (soma das similaridades) que a sustenta."""
+        n = vizinhos.shape[0]
+        indicador = np.zeros(n, dtype=np.float64)
+        indicador[avaliados[avaliados < n]] = 1.0
+        if len(alvo) < n:
+            # item que entrou depois da versão fixada: o usuário não tem nota nele
+            alvo = np.concatenate([alvo, np.zeros(n - len(alvo))])
+        num = vizinhos @ alvo[:n]
+        den = vizinhos @ indicador
+        notas = np.zeros(n, dtype=np.float64)
+        np.divide(num, den, out=notas, where=den > 0)
+        return notas, den
+
+    @staticmethod
+    def ordenar(ids_itens: np.ndarray, notas: np.ndarray, den: np.ndarray, avaliados: np.ndarray) -> list[int]:
+        """Itens não avaliados com algum vizinho avaliado, da maior nota para a menor."""
+        candidatos = den > 0
+        candidatos[avaliados[avaliados < len(candidatos)]] = False
+        idx = np.flatnonzero(candidatos)
+        # arredonda para que empates não dependam da ordem em que G foi acumulada
+        ordem = np.lexsort((ids_itens[idx], -np.round(notas[idx], 9)))
+        return [int(i) for i in ids_itens[idx[ordem]]]
+
+    def recomendar(self, usuario_id: int, matriz: VersaoMatriz | None = None) -> list[int]:
+        """Ids dos itens candidatos para o usuário, em ordem de nota prevista."""
+        # `vizinhos` é trocado inteiro a cada atualização, então dá para ler sem lock
+        vizinhos = self.vizinhos
+        fonte = self.matriz.fixar() if matriz is None else matriz
+        alvo = fonte.linha(usuario_id)
+        avaliados = np.array([fonte.itens[i] for i in fonte.avaliados(usuario_id)], dtype=np.int64)
+        ids_itens = np.asarray(fonte.ids_itens[:vizinhos.shape[0]], dtype=np.int64)
+        notas, den = self.pontuar(vizinhos, alvo, avaliados)
+        return self.ordenar(ids_itens, notas, den, avaliados)
+
+    def estado(self) -> dict:
+        with self._lock:
+            return {
+                "itens": int(self.gram.shape[0]),
+                "k": self.k,
+                "pares": int((self._colunas >= 0).sum()),
+                "atualizacoes": self.atualizacoes,
+            }
@@ -0,0 +1,101 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+RAIO_TERRA_KM = 6371.0088
+
+
+class IndiceGeografico:
+    """KD-tree sobre as coordenadas dos itens, montada uma vez na carga.
+
+    Os pontos vão para a esfera unitária (x, y, z): a distância em linha reta
+    entre dois pontos cresce junto com a distância pelo globo, então busca por
+    raio e k mais próximos na árvore dão o mesmo resultado que o haversine,
+    sem percorrer o catálogo. Itens sem coordenada válida ficam de fora.
+    """
+
+    def __init__(self, latitudes, longitudes):
+        lat = np.asarray(latitudes, dtype=np.float64)
+        lon = np.asarray(longitudes, dtype=np.float64)
+        validos = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+        # posição no índice -> linha do catálogo
+        self.linhas = np.flatnonzero(validos)
+        self.latitudes = lat[self.linhas]
+        self.longitudes = lon[self.linhas]
+        self._arvore = cKDTree(self._unitarios(self.latitudes, self.longitudes)) if len(self.linhas) else None
+
+    def __len__(self) -> int:
+        return len(self.linhas)
+
+    @staticmethod
+    def _unitarios(lat, lon) -> np.ndarray:
+        lat, lon = np.radians(lat), np.radians(lon)
+        return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+    @staticmethod
+    def _corda(km: float) -> float:
+        return 2.0 * np.sin(min(km / RAIO_TERRA_KM, np.pi) / 2.0)
+
+    @staticmethod
+    def haversine(lat, lon, lats, lons) -> np.ndarray:
+        """Distância em km de (lat, lon) até cada ponto."""
+        lat, lon, lats, lons = map(np.radians, (lat, lon, np.asarray(lats), np.asarray(lons)))
+        a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+        return 2.0 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def _ordenar(self, posicoes: np.ndarray, distancias: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # mais perto primeiro; empate pela ordem do catálogo
+        ordem = np.lexsort((self.linhas[posicoes], distancias))
+        return self.linhas[posicoes[ordem]], distancias[ordem]
+
+    def no_raio(self, lat: float, lon: float, raio_km: float) -> tuple[np.ndarray, np.ndarray]:
+        """`(linhas, distancias_km)` dos itens a até `raio_km`, do mais perto ao mais longe."""
+        if self._arvore is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        centro = self._unitarios([lat], [lon])[0]
+        # folga na corda para não perder ponto da borda por arredondamento; o haversine corta o excesso
+        posicoes = np.asarray(
+            self._arvore.query_ball_point(centro, self._corda(raio_km) * (1 + 1e-9)), dtype=np.int64
+        )
+        distancias = self.haversine(lat, lon, self.latitudes[posicoes], self.longitudes[posicoes])
+        dentro = distancias <= raio_km
+        return self._ordenar(posicoes[dentro], distancias[dentro])
+
+    def mais_proximos(self, lat: float, lon: float, k: int,
+                      raio_km: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """`(linhas, distancias_km)` dos `k` itens mais perto (opcionalmente só dentro de `raio_km`)."""
+        if self._arvore is None or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        k = min(k, len(self.linhas))
+        centro = self._unitarios([lat], [lon])[0]
+        limite = np.inf if raio_km is None else self._corda(raio_km) * (1 + 1e-9)
+        cordas, posicoes = self._arvore.query(centro, k=k, distance_upper_bound=limite)
+        cordas, posicoes = np.atleast_1d(cordas), np.atleast_1d(posicoes)
+        posicoes = posicoes[np.isfinite(cordas)].astype(np.int64)
+        distancias = self.haversine(lat, lon, self.latitudes[posicoes], self.longitudes[posicoes])
+        if raio_km is not None:
+            dentro = distancias <= raio_km
+            posicoes, distancias = posicoes[dentro], distancias[dentro]
+        return self._ordenar(posicoes, distancias)
+
+    def na_caixa(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> np.ndarray:
+        """Linhas (na ordem do catálogo) dos itens dentro do retângulo; `lon_min > lon_max` cruza o antimeridiano."""
+        if self._arvore is None or lat_min > lat_max:
+            return np.empty(0, dtype=np.int64)
+        largura = lon_max - lon_min if lon_max >= lon_min else lon_max - lon_min + 360
+        if largura <= 180:
+            # com até 180° de largura, os cantos são os pontos da caixa mais longe do
+            # centro; o círculo por eles (com folga) contém a caixa inteira
+            lat_c = (lat_min + lat_max) / 2
+            lon_c = lon_min + largura / 2
+            cantos_lat = np.array([lat_min, lat_min, lat_max, lat_max])
+            cantos_lon = np.array([lon_min, lon_max, lon_min, lon_max])
+            raio = float(self.haversine(lat_c, lon_c, cantos_lat, cantos_lon).max()) * 1.01 + 1e-6
+            centro = self._unitarios([lat_c], [lon_c])[0]
+            posicoes = np.asarray(self._arvore.query_ball_point(centro, self._corda(raio)), dtype=np.int64)
+        else:
+            # caixa de meio globo ou mais: a resposta já é boa parte do catálogo
+            posicoes = np.arange(len(self.linhas))
+
+        lats, lons = self.latitudes[posicoes], self.longitudes[posicoes]
+        dentro = (lats >= lat_min) & (lats <= lat_max) & ((lons - lon_min) % 360 <= largura)
+        return np.sort(self.linhas[posicoes[dentro]])
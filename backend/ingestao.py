@@ -0,0 +1,101 @@
+import codecs
+import csv
+import json
+
+from pydantic import BaseModel, ValidationError
+
+CAMPOS = ("usuario_id", "item_id", "nota")
+
+
+class LoteAvaliacoes:
+    """Lê um corpo CSV ou NDJSON em pedaços e valida as linhas em blocos.
+
+    `alimentar` recebe os bytes como chegam da rede (linha cortada entre dois
+    pedaços fica guardada até o próximo) e `fechar` processa o resto. Cada
+    linha vira um registro do `modelo` (pydantic) ou um erro com o número da
+    linha no corpo; os erros guardados param em `limite_erros`, mas todos
+    são contados.
+    """
+
+    def __init__(self, formato: str, modelo: type[BaseModel], bloco: int = 1000, limite_erros: int = 1000):
+        if formato not in ("csv", "ndjson"):
+            raise ValueError(f"formato desconhecido: {formato}")
+        self.formato = formato
+        self.modelo = modelo
+        self.bloco = bloco
+        self.limite_erros = limite_erros
+
+        self.validos: list[BaseModel] = []
+        self.erros: list[dict] = []
+        self.total_erros = 0
+        self.recebidas = 0
+
+        self._decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+        self._resto = ""
+        self._numero = 0
+        self._cabecalho: list[str] | None = None
+        # (número da linha, texto) ainda não validadas
+        self._fila: list[tuple[int, str]] = []
+
+    def alimentar(self, pedaco: bytes):
+        texto = self._resto + self._decodificador.decode(pedaco)
+        linhas = texto.split("\n")
+        self._resto = linhas.pop()
+        for linha in linhas:
+            self._linha(linha)
+
+    def fechar(self):
+        texto = self._resto + self._decodificador.decode(b"", final=True)
+        self._resto = ""
+        if texto:
+            self._linha(texto)
+        self._validar()
+
+    def _linha(self, linha: str):
+        self._numero += 1
+        linha = linha.rstrip("\r")
+        if not linha.strip():
+            return
+        if self.formato == "csv" and self._cabecalho is None:
+            self._cabecalho = [c.strip() for c in next(csv.reader([linha]))]
+            faltando = [c for c in CAMPOS if c not in self._cabecalho]
+            if faltando:
+                raise ValueError(f"cabeçalho CSV sem as colunas: {', '.join(faltando)}")
+            return
+        self.recebidas += 1
+        self._fila.append((self._numero, linha))
+        if len(self._fila) >= self.bloco:
+            self._validar()
+
+    def _erro(self, numero: int, mensagem: str):
+        self.total_erros += 1
+        if len(self.erros) < self.limite_erros:
+            self.erros.append({"linha": numero, "erro": mensagem})
+
+    def _validar(self):
+        fila, self._fila = self._fila, []
+        if self.formato == "csv":
+            textos = csv.reader(texto for _, texto in fila)
+        else:
+            textos = (texto for _, texto in fila)
+
+        for (numero, _), conteudo in zip(fila, textos):
+            if self.formato == "csv":
+                if len(conteudo) != len(self._cabecalho):
+                    self._erro(numero, f"esperava {len(self._cabecalho)} colunas, veio {len(conteudo)}")
+                    continue
+                dados = dict(zip(self._cabecalho, (v.strip() for v in conteudo)))
+            else:
+                try:
+                    dados = json.loads(conteudo)
+                except json.JSONDecodeError as e:
+                    self._erro(numero, f"JSON inválido: {e.msg}")
+                    continue
+                if not isinstance(dados, dict):
+                    self._erro(numero, "esperava um objeto JSON")
+                    continue
+            try:
+                self.validos.append(self.modelo.model_validate(dados))
+            except ValidationError as e:
+                self._erro(numero, "; ".join(
+                    f"{'.'.join(str(p) for p in d['loc']) or 'registro'}: {d['msg']}" for d in e.errors()))
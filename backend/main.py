@@ -1,47 +1,227 @@
-from fastapi import FastAPI, Query
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+from starlette.concurrency import run_in_threadpool
+from contextlib import contextmanager, nullcontext
+from typing import Annotated, Literal
 import pandas as pd
-import numpy as np
+import json
 import os
-import math
-from collections import Counter
+import threading
+import time
+
+from matriz_avaliacoes import MatrizAvaliacoes, VersaoMatriz
+from similaridade import MotorSimilaridade, IndiceVizinhos, medir_recall
+from lsh import IndiceLSH
+from avaliacao import MotorAvaliacao
+from registro import RegistroAvaliacoes
+from cache import CacheRecomendacoes
+from catalogo import CatalogoItens
+from snapshot_binario import SnapshotBinario
+from filtragem_itens import RecomendadorPorItens
+from fatoracao import RecomendadorFatores
+from materializacao import RecomendacoesMaterializadas, ranquear_candidatos
+from metricas import Metricas, MiddlewareMetricas
+from ingestao import LoteAvaliacoes
+from armazem_compartilhado import ArmazemAvaliacoes, MiddlewareSincronizacao
 
 app = FastAPI()
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-ITENS_PATH = os.path.join(BASE_DIR, "itens.csv")
-AVALIACOES_PATH = os.path.join(BASE_DIR, "avaliacoes.csv")
-AVALIACOES_TEMP_PATH = os.path.join(BASE_DIR, "avaliacoes_temp.csv")
-
-itens = pd.read_csv(ITENS_PATH)
-avaliacoes = pd.read_csv(AVALIACOES_PATH)
+# histogramas por etapa e por requisição, expostos em /metrics (formato Prometheus)
+metricas = Metricas()
+app.add_middleware(MiddlewareMetricas, metricas=metricas)
 
-if os.path.exists(AVALIACOES_TEMP_PATH):
-    avaliacoes_temp = pd.read_csv(AVALIACOES_TEMP_PATH)
-else:
-    avaliacoes_temp = pd.DataFrame(columns=avaliacoes.columns)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# pasta dos CSVs (o benchmark aponta para dados sintéticos)
+DADOS_DIR = os.environ.get("DADOS_DIR", BASE_DIR)
+ITENS_PATH = os.path.join(DADOS_DIR, "itens.csv")
+AVALIACOES_PATH = os.path.join(DADOS_DIR, "avaliacoes.csv")
+AVALIACOES_TEMP_PATH = os.path.join(DADOS_DIR, "avaliacoes_temp.csv")
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", os.path.join(DADOS_DIR, "dados_binarios"))
+
+# "exata": similaridade contra todos a cada pedido; "indice": vizinhos pré-calculados;
+# "lsh": busca aproximada por LSH (ajustável por LSH_TABELAS, LSH_BITS, LSH_SONDAS,
+# LSH_MAX_CANDIDATOS; 0 = sem limite de candidatos)
+BUSCA_VIZINHOS = os.environ.get("BUSCA_VIZINHOS", "exata")
+
+# itens.csv e avaliacoes.csv em colunas .npy mapeadas em memória; refeito se um CSV mudar
+snapshot_binario = SnapshotBinario(SNAPSHOT_DIR, {"itens": ITENS_PATH, "avaliacoes": AVALIACOES_PATH}).abrir()
+
+itens = snapshot_binario.tabela("itens")
+catalogo = CatalogoItens(itens)
+avaliacoes = snapshot_binario.tabela("avaliacoes")
+
+# com vários workers (uvicorn --workers N) as avaliações simuladas também ficam num
+# arquivo mapeado em memória, lido por todos (ex.: ARMAZEM_COMPARTILHADO=/dev/shm/manaus-explorer)
+ARMAZEM_COMPARTILHADO = os.environ.get("ARMAZEM_COMPARTILHADO")
+armazem = (
+    ArmazemAvaliacoes(os.path.join(ARMAZEM_COMPARTILHADO, "avaliacoes.bin")) if ARMAZEM_COMPARTILHADO else None
+)
+
+# avaliações simuladas: snapshot avaliacoes_temp.csv + log append-only (avaliacoes_temp.log)
+with armazem.trava() if armazem is not None else nullcontext():
+    registro_avaliacoes = RegistroAvaliacoes(
+        AVALIACOES_TEMP_PATH,
+        colunas=list(avaliacoes.columns),
+        fsync=os.environ.get("REGISTRO_FSYNC", "sempre"),
+    )
+    if armazem is not None:
+        # o log é a cópia durável; o armazém começa igual a ele
+        armazem.alinhar(registro_avaliacoes.registros)
+
+# matriz usuário × item montada uma vez (direto do snapshot) e atualizada a cada /avaliar
+matriz_avaliacoes = snapshot_binario.matriz("avaliacoes")
+# só as avaliações originais, para a avaliação offline; as do log entram por cima como delta
+versao_original = matriz_avaliacoes.fixar()
+if registro_avaliacoes.registros:
+    matriz_avaliacoes.adicionar_lote(
+        [(r["usuario_id"], r["item_id"], r["nota"]) for r in registro_avaliacoes.registros]
+    )
+motor_similaridade = MotorSimilaridade(matriz_avaliacoes)
+
+indice_vizinhos = None
+busca_vizinhos = motor_similaridade
+if BUSCA_VIZINHOS == "indice":
+    indice_vizinhos = IndiceVizinhos(motor_similaridade)
+    indice_vizinhos.construir()
+    busca_vizinhos = indice_vizinhos
+elif BUSCA_VIZINHOS == "lsh":
+    indice_vizinhos = IndiceLSH(
+        motor_similaridade,
+        n_tabelas=int(os.environ.get("LSH_TABELAS", 32)),
+        n_bits=int(os.environ.get("LSH_BITS", 9)),
+        sondas=int(os.environ.get("LSH_SONDAS", 3)),
+        max_candidatos=int(os.environ.get("LSH_MAX_CANDIDATOS", 1500)) or None,
+    )
+    indice_vizinhos.construir()
+    busca_vizinhos = indice_vizinhos
+
+# filtragem por itens: k itens mais parecidos de cada item, atualizados a cada /avaliar
+recomendador_itens = RecomendadorPorItens(matriz_avaliacoes, k=int(os.environ.get("ITENS_VIZINHOS", 20)))
+recomendador_itens.construir()
+
+# fatores latentes (ALS): treinados em segundo plano e trocados quando prontos;
+# cada /avaliar faz o fold-in do vetor do usuário sem retreinar. A thread de treino
+# só sobe no primeiro pedido que precisa do modelo; com FATORES_TREINO_PERIODICO=1
+# ela sobe junto com o app e retreina a cada FATORES_INTERVALO segundos
+TREINO_PERIODICO = os.environ.get("FATORES_TREINO_PERIODICO", "0") == "1"
+PARAMETROS_FATORES = {
+    "fatores": int(os.environ.get("FATORES_DIMENSAO", 10)),
+    "regularizacao": float(os.environ.get("FATORES_REGULARIZACAO", 0.1)),
+    "iteracoes": int(os.environ.get("FATORES_ITERACOES", 15)),
+}
+recomendador_fatores = RecomendadorFatores(
+    matriz_avaliacoes,
+    intervalo=float(os.environ.get("FATORES_INTERVALO", 60)) if TREINO_PERIODICO else None,
+    **PARAMETROS_FATORES,
+)
+if TREINO_PERIODICO:
+    recomendador_fatores.iniciar()
+
+# candidatos da filtragem por usuários pré-calculados para todos, em segundo plano;
+# o /avaliar marca só os usuários afetados (MATERIALIZAR=0 desliga)
+materializacao = None
+if os.environ.get("MATERIALIZAR", "1") != "0":
+    materializacao = RecomendacoesMaterializadas(
+        matriz_avaliacoes, busca_vizinhos, largura=int(os.environ.get("MATERIALIZAR_CANDIDATOS", 50))
+    )
+    materializacao.iniciar()
+
+cache_recomendacoes = CacheRecomendacoes(
+    capacidade=int(os.environ.get("CACHE_CAPACIDADE", 10_000)),
+    ttl=float(os.environ.get("CACHE_TTL", 300)),
+)
+
+# leituras usam versões imutáveis da matriz (sem lock); só as escritas do /avaliar
+# nas estruturas derivadas passam por aqui, uma de cada vez
+escrita_avaliacoes = threading.Lock()
+
+@contextmanager
+def escrita():
+    """`escrita_avaliacoes` e, com vários workers, a trava do armazém com as notas dos outros já aplicadas."""
+    with escrita_avaliacoes:
+        if armazem is None:
+            yield
+            return
+        with armazem.trava():
+            _sincronizar()
+            yield
+
+# avaliação offline (/acuracia) sobre as avaliações originais, que não mudam
+motor_avaliacao = MotorAvaliacao(
+    avaliacoes,
+    nomes=catalogo.nomes,
+    parametros_fatores=PARAMETROS_FATORES,
+    matriz=versao_original,
+    metricas=metricas,
+)
+
+def _numericos(estado: dict) -> dict:
+    return {campo: float(v) for campo, v in estado.items() if isinstance(v, (int, float))}
+
+# lidos na hora da coleta do /metrics
+metricas.coletor("matriz_usuarios", "Usuários na matriz de avaliações", lambda: matriz_avaliacoes.n_usuarios)
+metricas.coletor("matriz_itens", "Itens na matriz de avaliações", lambda: matriz_avaliacoes.n_itens)
+metricas.coletor("matriz_avaliacoes", "Células preenchidas da matriz de avaliações", lambda: matriz_avaliacoes.nnz)
+metricas.coletor("matriz_versao", "Versão publicada da matriz de avaliações", lambda: matriz_avaliacoes.versao)
+metricas.coletor("matriz_delta", "Células no delta ainda não compactado", lambda: matriz_avaliacoes.fixar().tamanho_delta)
+metricas.coletor("avaliacoes_simuladas", "Avaliações recebidas pelo /avaliar", lambda: len(registro_avaliacoes.registros))
+metricas.coletor("cache_entradas", "Entradas no cache de recomendações", lambda: cache_recomendacoes.estado()["entradas"])
+metricas.coletor(
+    "cache_eventos_total", "Eventos do cache de recomendações",
+    lambda: {e: cache_recomendacoes.estado()[e] for e in ("acertos", "faltas", "expulsoes", "expiradas", "invalidadas")},
+    rotulos=("evento",), tipo="counter",
+)
+metricas.coletor(
+    "indice_vizinhos", "Estado do índice de vizinhos (BUSCA_VIZINHOS=indice ou lsh)",
+    lambda: _numericos(indice_vizinhos.estado()) if indice_vizinhos is not None else None,
+    rotulos=("campo",),
+)
+metricas.coletor("filtragem_itens", "Estado da filtragem por itens", lambda: _numericos(recomendador_itens.estado()), rotulos=("campo",))
+metricas.coletor("modelo_fatores", "Estado do modelo de fatores", lambda: _numericos(recomendador_fatores.estado()), rotulos=("campo",))
+metricas.coletor(
+    "armazem", "Estado do armazém compartilhado entre workers (ARMAZEM_COMPARTILHADO)",
+    lambda: _numericos(armazem.estado()) if armazem is not None else None,
+    rotulos=("campo",),
+)
+metricas.coletor(
+    "materializacao", "Estado da tabela de recomendações materializadas",
+    lambda: _numericos(materializacao.estado()) if materializacao is not None else None,
+    rotulos=("campo",),
+)
 
 class RecomendacaoRequest(BaseModel):
     usuario_id: int
     top_n: int = 5
     localizacao: str | None = None
     preco_estimado: str | None = None
+    categoria: str | None = None
+    # "usuarios": vizinhos do usuário; "itens": itens parecidos com os que ele avaliou;
+    # "fatores": modelo de fatores latentes (ALS)
+    metodo: Literal["usuarios", "itens", "fatores"] = "usuarios"
+    # "perto de mim": só itens a até `raio_km` do ponto e/ou os `k_proximos` mais perto
+    latitude: float | None = Field(None, ge=-90, le=90)
+    longitude: float | None = Field(None, ge=-180, le=180)
+    raio_km: float | None = Field(None, gt=0)
+    k_proximos: int | None = Field(None, ge=1)
+
+    @model_validator(mode="after")
+    def _validar_ponto(self):
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValueError("latitude e longitude devem ser informadas juntas")
+        if self.latitude is not None and self.raio_km is None and self.k_proximos is None:
+            raise ValueError("com latitude/longitude, informe raio_km e/ou k_proximos")
+        if self.latitude is None and (self.raio_km is not None or self.k_proximos is not None):
+            raise ValueError("raio_km e k_proximos exigem latitude e longitude")
+        return self
 
 class AvaliacaoSimulada(BaseModel):
     usuario_id: int
     item_id: int
     nota: float
 
-def cosine_similarity(u, v):
-    num = np.dot(u, v)
-    den = np.linalg.norm(u) * np.linalg.norm(v)
-    return num / den if den != 0 else 0
-
 def nome_do_item(item_id: int) -> str:
-    row = itens.loc[itens["id"] == item_id]
-    if not row.empty:
-        return str(row.iloc[0].get("nome", f"Item {item_id}"))
-    return f"Item {item_id}"
+    return catalogo.nome(item_id)
 
 
 @app.get("/")
@@ -49,73 +229,400 @@ def root():
     return {"mensagem": "API do Manaus Explorer está rodando 🚀. Use /docs para ver os endpoints."}
 
 @app.post("/avaliar")
+@metricas.cronometrar("avaliar")
 def avaliar(av: AvaliacaoSimulada):
-    global avaliacoes_temp
-    nova_av = pd.DataFrame([av.dict()])
-    avaliacoes_temp = pd.concat([avaliacoes_temp, nova_av], ignore_index=True)
-    # salva sempre que adicionar
-    avaliacoes_temp.to_csv(AVALIACOES_TEMP_PATH, index=False)
+    etapas = metricas.etapas("avaliar")
+    if armazem is None:
+        # grava no log antes de confirmar; depois atualiza as estruturas em memória
+        registro_avaliacoes.anexar(av.dict())
+        etapas.marcar("registro")
+    with escrita():
+        etapas.marcar("espera_escrita")
+        if armazem is not None:
+            # com vários workers, log e armazém recebem as notas na mesma ordem, sob a trava;
+            # o fsync do log fica para depois dela, agrupado com o dos outros pedidos
+            seq = registro_avaliacoes.escrever([av.dict()])
+            armazem.anexar([(av.usuario_id, av.item_id, av.nota)])
+            etapas.marcar("registro")
+        item_novo = av.item_id not in matriz_avaliacoes.itens
+        _, coluna, antigo, novo = matriz_avaliacoes.adicionar(av.usuario_id, av.item_id, av.nota)
+        etapas.marcar("matriz")
+        alterados = busca_vizinhos.atualizar(av.usuario_id)
+        etapas.marcar("busca_vizinhos")
+        recomendador_itens.atualizar(av.usuario_id, coluna, antigo, novo)
+        etapas.marcar("filtragem_itens")
+        recomendador_fatores.atualizar(av.usuario_id)
+        etapas.marcar("fatores")
+        # só muda a resposta do próprio usuário e de quem pode ganhar ou perder vizinho
+        afetados = _afetados([av.usuario_id], alterados, item_novo)
+        if materializacao is not None:
+            materializacao.marcar(afetados, matriz_avaliacoes.versao)
+        etapas.marcar("materializacao")
+
+    _invalidar_cache(afetados, item_novo)
+    etapas.marcar("invalidacao_cache")
+    if armazem is not None:
+        registro_avaliacoes.aguardar(seq)
+        etapas.marcar("fsync")
     return {"mensagem": f"Avaliação do usuário {av.usuario_id} para item {av.item_id} adicionada."}
 
-@app.get("/avaliacoes")
-def listar_avaliacoes():
-    global avaliacoes_temp
+# linhas validadas por vez no /avaliar/lote e erros devolvidos na resposta
+BLOCO_LOTE = 1000
+LIMITE_ERROS_LOTE = 1000
+
+def _aplicar_na_memoria(triplas: list[tuple[int, int, float]], etapas) -> tuple[list[int], list[int], set[int]]:
+    """Notas já gravadas -> matriz e estruturas derivadas, uma vez por usuário; chamar com `escrita_avaliacoes`.
+
+    Retorna `(usuarios, afetados, itens_novos)`.
+    """
+    itens_novos = {i for _, i, _ in triplas if i not in matriz_avaliacoes.itens}
+    antes = matriz_avaliacoes.fixar()
+    matriz_avaliacoes.adicionar_lote(triplas)
+    etapas.marcar("matriz")
+    usuarios = list(dict.fromkeys(u for u, _, _ in triplas))
+    mudancas = [busca_vizinhos.atualizar(u) for u in usuarios]
+    # só o IndiceVizinhos devolve de quem a lista mudou
+    alterados = None if None in mudancas else set().union(*mudancas)
+    etapas.marcar("busca_vizinhos")
+    recomendador_itens.atualizar_lote(antes, usuarios)
+    etapas.marcar("filtragem_itens")
+    for u in usuarios:
+        recomendador_fatores.atualizar(u)
+    etapas.marcar("fatores")
+    afetados = _afetados(usuarios, alterados, bool(itens_novos))
+    if materializacao is not None:
+        materializacao.marcar(afetados, matriz_avaliacoes.versao)
+    etapas.marcar("materializacao")
+    return usuarios, afetados, itens_novos
+
+def _afetados(usuarios: list[int], alterados: set[int] | None, itens_novos: bool) -> list[int]:
+    """Quem avaliou e os usuários cujos 3 vizinhos (e daí os candidatos) podem ter mudado.
+
+    `alterados` vem do `IndiceVizinhos.atualizar`, que já sabe de quem a lista
+    mudou; sem índice, a tabela materializada decide pelos vizinhos e pelo
+    cosseno do último vizinho de cada linha. Vale para a tabela e para o
+    cache do /recomendar (a resposta por usuários só depende disso).
+    """
+    matriz = matriz_avaliacoes.fixar()
+    if itens_novos:
+        # item novo entra na lista de candidatos de todo mundo (com nota 0)
+        return matriz.ids_usuarios[:matriz.n_usuarios]
+    if alterados is None and materializacao is None:
+        # sem a tabela não há o limiar de cada linha: entra quem tem similaridade com eles
+        return list(dict.fromkeys(usuarios + matriz.relacionados_lote(usuarios)))
+    if alterados is None:
+        similaridades = [motor_similaridade.similaridades(matriz.linha(u), matriz) for u in usuarios]
+        alterados = materializacao.afetados(usuarios, similaridades, matriz.relacionados_mascara(usuarios))
+    return list(dict.fromkeys([*usuarios, *alterados]))
+
+def _invalidar_cache(afetados: list[int], itens_novos):
+    # item novo vira candidato para todo mundo
+    if itens_novos:
+        cache_recomendacoes.invalidar_tudo()
+    else:
+        cache_recomendacoes.invalidar_usuarios(afetados)
+
+def _sincronizar():
+    """Aplica as notas que outros workers publicaram no armazém; chamar com `escrita_avaliacoes`."""
+    novos = armazem.novos()
+    if not novos:
+        return
+    etapas = metricas.etapas("sincronizacao")
+    registro_avaliacoes.incorporar([{"usuario_id": u, "item_id": i, "nota": n} for u, i, n in novos])
+    _, afetados, itens_novos = _aplicar_na_memoria(novos, etapas)
+    _invalidar_cache(afetados, itens_novos)
+    etapas.marcar("invalidacao_cache")
+
+def sincronizar_armazem():
+    with escrita_avaliacoes:
+        _sincronizar()
+
+if armazem is not None:
+    app.add_middleware(MiddlewareSincronizacao, armazem=armazem, sincronizar=sincronizar_armazem)
+
+@metricas.cronometrar("avaliar_lote")
+def aplicar_lote(lote: list[AvaliacaoSimulada]) -> dict:
+    """Aplica um lote já validado: um append no log, uma versão nova da matriz
+    e as estruturas derivadas atualizadas uma vez por usuário, não por linha."""
+    etapas = metricas.etapas("avaliar_lote")
+    registros = [av.dict() for av in lote]
+    triplas = [(av.usuario_id, av.item_id, av.nota) for av in lote]
+    if armazem is None:
+        registro_avaliacoes.anexar_lote(registros)
+        etapas.marcar("registro")
+    with escrita():
+        etapas.marcar("espera_escrita")
+        if armazem is not None:
+            seq = registro_avaliacoes.escrever(registros)
+            armazem.anexar(triplas)
+            etapas.marcar("registro")
+        usuarios, afetados, itens_novos = _aplicar_na_memoria(triplas, etapas)
+
+    _invalidar_cache(afetados, itens_novos)
+    etapas.marcar("invalidacao_cache")
+    if armazem is not None:
+        registro_avaliacoes.aguardar(seq)
+        etapas.marcar("fsync")
+    return {"usuarios_afetados": len(usuarios), "itens_novos": len(itens_novos)}
+
+@app.post("/avaliar/lote")
+async def avaliar_lote(request: Request, formato: Literal["csv", "ndjson"] | None = None):
+    """Recebe muitas avaliações num corpo CSV (cabeçalho usuario_id,item_id,nota) ou NDJSON.
+
+    O formato vem do parâmetro `formato` ou do Content-Type. Linhas inválidas
+    são rejeitadas com o número da linha; as válidas entram todas juntas.
+    """
+    if formato is None:
+        tipo = request.headers.get("content-type", "")
+        formato = "csv" if "csv" in tipo else "ndjson"
+    leitor = LoteAvaliacoes(formato, AvaliacaoSimulada, bloco=BLOCO_LOTE, limite_erros=LIMITE_ERROS_LOTE)
+    # só a leitura do corpo fica no event loop; decodificar, validar (pydantic) e
+    # aplicar (que segura o lock de escrita) vão para o threadpool
+    try:
+        async for pedaco in request.stream():
+            await run_in_threadpool(leitor.alimentar, pedaco)
+        await run_in_threadpool(leitor.fechar)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+
+    resultado = {"usuarios_afetados": 0, "itens_novos": 0}
+    if leitor.validos:
+        resultado = await run_in_threadpool(aplicar_lote, leitor.validos)
     return {
-        "avaliacoes_originais": len(avaliacoes),
-        "avaliacoes_simuladas": avaliacoes_temp.to_dict(orient="records")
+        "recebidas": leitor.recebidas,
+        "aplicadas": len(leitor.validos),
+        "rejeitadas": leitor.total_erros,
+        **resultado,
+        "erros": leitor.erros,
+        "erros_omitidos": leitor.total_erros - len(leitor.erros),
     }
 
+# paginação por cursor (posição do próximo registro) e NDJSON para as listas longas
+Cursor = Annotated[int, Query(ge=0)]
+Limite = Annotated[int | None, Query(ge=1)]
+Formato = Literal["json", "ndjson"]
+# linhas por pedaço enviado no modo NDJSON
+BLOCO_NDJSON = 500
+BLOCO_ACURACIA = 64
+
+def pagina(total: int, cursor: int, limite: int | None) -> tuple[int, int, int | None]:
+    """`(inicio, fim, proximo_cursor)`; `proximo_cursor` é None na última página."""
+    inicio = min(cursor, total)
+    fim = total if limite is None else min(total, inicio + limite)
+    return inicio, fim, (fim if fim < total else None)
+
+def resposta_ndjson(cabecalho: dict, blocos) -> StreamingResponse:
+    """Primeira linha com o cabeçalho (totais, parâmetros, cursor); depois uma linha por registro."""
+    def gerar():
+        yield json.dumps(cabecalho, ensure_ascii=False) + "\n"
+        for bloco in blocos:
+            if bloco:
+                yield "".join(json.dumps(linha, ensure_ascii=False) + "\n" for linha in bloco)
+    return StreamingResponse(gerar(), media_type="application/x-ndjson")
 
-def recomendar(req: RecomendacaoRequest):
-    matriz_av = pd.concat([avaliacoes, avaliacoes_temp], ignore_index=True)
+@app.get("/avaliacoes")
+def listar_avaliacoes(cursor: Cursor = 0, limite: Limite = None, formato: Formato = "json"):
+    # o registro só cresce: a posição é um cursor estável
+    registros = registro_avaliacoes.registros
+    inicio, fim, proximo = pagina(len(registros), cursor, limite)
+    cabecalho = {
+        "avaliacoes_originais": len(avaliacoes),
+        "total_simuladas": len(registros),
+        "cursor": inicio,
+        "proximo_cursor": proximo,
+    }
+    if formato == "ndjson":
+        return resposta_ndjson(cabecalho, (
+            registros[i:min(i + BLOCO_NDJSON, fim)] for i in range(inicio, fim, BLOCO_NDJSON)
+        ))
+    return {**cabecalho, "avaliacoes_simuladas": registros[inicio:fim]}
+
+
+def filtrar_candidatos(req: RecomendacaoRequest, candidatos: list[int]) -> list[dict]:
+    # na ordem da nota prevista; os filtros são máscaras pré-calculadas do catálogo
+    # e a restrição geográfica sai do índice espacial
+    distancias = None
+    if req.latitude is not None:
+        distancias = catalogo.proximidade(req.latitude, req.longitude, raio_km=req.raio_km, k=req.k_proximos)
+    return catalogo.filtrar(
+        candidatos,
+        localizacao=req.localizacao,
+        preco_estimado=req.preco_estimado,
+        categoria=req.categoria,
+        limite=req.top_n,
+        distancias=distancias,
+    )
 
-    matriz = matriz_av.pivot_table(index="usuario_id", columns="item_id", values="nota").fillna(0)
+@metricas.cronometrar("recomendar")
+def recomendar(req: RecomendacaoRequest, vizinhos: list[int] | None = None, matriz: VersaoMatriz | None = None):
+    etapas = metricas.etapas("recomendar")
+    # a requisição inteira lê uma só versão da matriz, mesmo com /avaliar em paralelo
+    if matriz is None:
+        matriz = matriz_avaliacoes.fixar()
+    etapas.marcar("versao_matriz")
 
-    if req.usuario_id not in matriz.index:
+    if req.usuario_id not in matriz:
         return {"recomendacoes": [], "explicacao": f"Usuário {req.usuario_id} não encontrado."}
 
-    alvo = matriz.loc[req.usuario_id].values
+    if req.metodo == "itens":
+        return recomendar_por_itens(req, matriz)
+    if req.metodo == "fatores":
+        return recomendar_por_fatores(req, matriz)
+
+    # primeiro a tabela materializada; só calcula se a linha do usuário está defasada
+    top_itens = None
+    frescor = {"fonte": "calculo"}
+    if vizinhos is None and materializacao is not None:
+        materializado = materializacao.consultar(req.usuario_id, matriz)
+        if materializado is not None:
+            vizinhos, candidatos, completa, frescor_tabela = materializado
+            top_itens = filtrar_candidatos(req, candidatos)
+            if completa or len(top_itens) >= req.top_n:
+                frescor = frescor_tabela
+            else:
+                # a lista foi cortada na largura da tabela e os filtros deixaram poucos
+                top_itens = None
+        etapas.marcar("tabela")
+
+    if vizinhos is None:
+        vizinhos = busca_vizinhos.vizinhos(req.usuario_id, k=3, matriz=matriz)
+        etapas.marcar("vizinhos")
+    if not vizinhos:
+        return {"recomendacoes": [], "explicacao": "Não encontramos usuários semelhantes.", "materializacao": frescor}
 
-    similaridades = {}
-    for u in matriz.index:
-        if u != req.usuario_id:
-            similaridades[u] = cosine_similarity(alvo, matriz.loc[u].values)
+    if top_itens is None:
+        candidatos = ranquear_candidatos(req.usuario_id, vizinhos, matriz, etapas)
+        top_itens = filtrar_candidatos(req, candidatos)
+        etapas.marcar("filtros")
 
-    vizinhos = [u for u, s in sorted(similaridades.items(), key=lambda x: x[1], reverse=True)[:3] if s > 0]
-    if not vizinhos:
-        return {"recomendacoes": [], "explicacao": "Não encontramos usuários semelhantes."}
+    return {
+        "recomendacoes": top_itens,
+        "explicacao": f"Recomendamos estes itens porque você é semelhante aos usuários {vizinhos}",
+        "materializacao": frescor,
+    }
 
-    notas_preditas = matriz.loc[vizinhos].mean().sort_values(ascending=False)
+def recomendar_por_itens(req: RecomendacaoRequest, matriz: VersaoMatriz):
+    etapas = metricas.etapas("recomendar_por_itens")
+    candidatos = recomendador_itens.recomendar(req.usuario_id, matriz=matriz)
+    etapas.marcar("pontuacao")
+    if not candidatos:
+        return {"recomendacoes": [], "explicacao": "Não encontramos itens parecidos com os que você avaliou."}
 
-    avaliados = set(matriz_av[matriz_av.usuario_id == req.usuario_id].item_id)
-    candidatos = [i for i in notas_preditas.index if i not in avaliados]
+    top_itens = filtrar_candidatos(req, candidatos)
+    etapas.marcar("filtros")
 
-    df_candidatos = itens[itens.id.isin(candidatos)]
+    return {
+        "recomendacoes": top_itens,
+        "explicacao": "Recomendamos estes itens porque são parecidos com os que você avaliou bem"
+    }
 
-    if req.localizacao and "localizacao" in df_candidatos.columns:
-        df_candidatos = df_candidatos[
-            df_candidatos.localizacao.fillna("").str.contains(req.localizacao, case=False)
-        ]
-    if req.preco_estimado and "preco_estimado" in df_candidatos.columns:
-        df_candidatos = df_candidatos[
-            df_candidatos.preco_estimado.fillna("").str.lower() == req.preco_estimado.lower()
-        ]
+def recomendar_por_fatores(req: RecomendacaoRequest, matriz: VersaoMatriz):
+    etapas = metricas.etapas("recomendar_por_fatores")
+    # o primeiro pedido sobe o treino; até ele terminar a resposta vem vazia
+    recomendador_fatores.iniciar()
+    candidatos = recomendador_fatores.recomendar(req.usuario_id, matriz=matriz)
+    etapas.marcar("pontuacao")
+    if candidatos is None:
+        return {"recomendacoes": [], "explicacao": "O modelo de fatores ainda está em treinamento."}
 
-    top_itens = df_candidatos.head(req.top_n).to_dict(orient="records")
+    top_itens = filtrar_candidatos(req, candidatos)
+    etapas.marcar("filtros")
 
     return {
         "recomendacoes": top_itens,
-        "explicacao": f"Recomendamos estes itens porque você é semelhante aos usuários {vizinhos}"
+        "explicacao": "Recomendamos estes itens pela afinidade prevista pelo modelo de fatores latentes"
     }
 
 @app.post("/recomendar")
 def recomendar_endpoint(req: RecomendacaoRequest):
-    return recomendar(req)
+    chave = (req.usuario_id, req.top_n, req.localizacao, req.preco_estimado, req.categoria, req.metodo,
+             req.latitude, req.longitude, req.raio_km, req.k_proximos)
+    if req.metodo == "itens":
+        # uma nota muda as listas de vários itens, e daí a resposta de quase todos;
+        # a versão do recomendador na chave descarta as entradas antigas
+        chave += (recomendador_itens.atualizacoes,)
+    elif req.metodo == "fatores":
+        # troca de modelo ou fold-in mudam a versão
+        chave += (recomendador_fatores.versao,)
+    resultado = cache_recomendacoes.obter(chave, req.usuario_id)
+    if resultado is None:
+        marca = cache_recomendacoes.marca(req.usuario_id)
+        resultado = recomendar(req)
+        cache_recomendacoes.guardar(chave, marca, resultado)
+    return _com_idade(resultado)
+
+def _com_idade(resultado: dict) -> dict:
+    """Troca o `momento` da linha da tabela pela idade dela agora, sem mexer no valor em cache."""
+    frescor = dict(resultado.get("materializacao") or {})
+    momento = frescor.pop("momento", None)
+    if momento is None:
+        return resultado
+    frescor["idade_segundos"] = round(time.time() - momento, 3)
+    return {**resultado, "materializacao": frescor}
+
+@app.get("/cache-recomendacoes")
+def estado_cache_recomendacoes():
+    return cache_recomendacoes.estado()
+
+
+def recomendar_lote(reqs: list[RecomendacaoRequest]):
+    # vizinhos de todos os usuários do lote de uma vez; os filtros continuam por pedido
+    matriz = matriz_avaliacoes.fixar()
+    usuarios = list(dict.fromkeys(
+        r.usuario_id for r in reqs if r.metodo == "usuarios" and r.usuario_id in matriz
+    ))
+    if busca_vizinhos is motor_similaridade:
+        vizinhos = dict(zip(usuarios, motor_similaridade.vizinhos_lote(usuarios, k=3, matriz=matriz)))
+    else:
+        vizinhos = {u: busca_vizinhos.vizinhos(u, k=3, matriz=matriz) for u in usuarios}
+
+    return {
+        "total": len(reqs),
+        "resultados": [
+            {"usuario_id": req.usuario_id, **_com_idade(recomendar(req, vizinhos.get(req.usuario_id), matriz))}
+            for req in reqs
+        ]
+    }
+
+@app.post("/recomendar/lote")
+def recomendar_lote_endpoint(reqs: list[RecomendacaoRequest]):
+    return recomendar_lote(reqs)
+
+@app.get("/modelo-fatores")
+def estado_modelo_fatores():
+    return recomendador_fatores.estado()
+
+@app.post("/modelo-fatores/treinar")
+def treinar_modelo_fatores():
+    # pede um retreino agora; a troca acontece quando o treino termina
+    recomendador_fatores.iniciar()
+    recomendador_fatores.solicitar_treino()
+    return {"mensagem": "Treino do modelo de fatores solicitado."}
+
+@app.get("/materializacao")
+def estado_materializacao():
+    if materializacao is None:
+        return {"ativa": False}
+    return {"ativa": True, **materializacao.estado()}
+
+@app.get("/indice-vizinhos")
+def estado_indice_vizinhos():
+    if indice_vizinhos is None:
+        return {"busca_vizinhos": BUSCA_VIZINHOS, "indice": None}
+    return {"busca_vizinhos": BUSCA_VIZINHOS, "indice": indice_vizinhos.estado()}
+
+@app.get("/indice-vizinhos/recall")
+def recall_indice_vizinhos(amostra: int = Query(100, ge=1), k: int = Query(3, ge=1), seed: int = 42):
+    usuarios = pd.Series(matriz_avaliacoes.ids_usuarios)
+    usuarios = usuarios.sample(n=min(amostra, len(usuarios)), random_state=seed).tolist()
+    return {
+        "busca_vizinhos": BUSCA_VIZINHOS,
+        **medir_recall(busca_vizinhos, motor_similaridade, usuarios, k=k)
+    }
 
 
 def usuarios_acuracia(min_avaliacoes: int = 3):
-    av = avaliacoes.copy()
-    av.columns = [c.strip().lower() for c in av.columns]  
+    av = motor_avaliacao.av
 
     contagem = (
         av.groupby("usuario_id")["item_id"]
@@ -130,33 +637,37 @@ def usuarios_acuracia(min_avaliacoes: int = 3):
     return elegiveis_df
 
 @app.get("/usuarios-elegiveis")
-def listar_usuarios_elegiveis(min_avaliacoes: int = Query(3, ge=1)):
+def listar_usuarios_elegiveis(min_avaliacoes: int = Query(3, ge=1), cursor: Cursor = 0,
+                              limite: Limite = None, formato: Formato = "json"):
     df = usuarios_acuracia(min_avaliacoes=min_avaliacoes)
-    usuarios = [
-        {"usuario_id": int(row.usuario_id),
-         "qtd_avaliacoes": int(row.qtd_avaliacoes)}
-        for _, row in df.iterrows()
-    ]
-    return {
+    ids = df["usuario_id"].to_numpy()
+    qtds = df["qtd_avaliacoes"].to_numpy()
+    inicio, fim, proximo = pagina(len(df), cursor, limite)
+
+    def linhas(ini: int, fim: int) -> list[dict]:
+        return [
+            {"usuario_id": u, "qtd_avaliacoes": q}
+            for u, q in zip(ids[ini:fim].tolist(), qtds[ini:fim].tolist())
+        ]
+
+    cabecalho = {
         "min_avaliacoes": min_avaliacoes,
-        "total": len(usuarios),
-        "usuarios": usuarios
+        "total": len(df),
+        "cursor": inicio,
+        "proximo_cursor": proximo,
     }
+    if formato == "ndjson":
+        return resposta_ndjson(cabecalho, (
+            linhas(i, min(i + BLOCO_NDJSON, fim)) for i in range(inicio, fim, BLOCO_NDJSON)
+        ))
+    return {**cabecalho, "usuarios": linhas(inicio, fim)}
 
 def divisao_conjuntos(usuario_id: int, holdout: float = 0.4, min_test: int = 1, seed: int | None = None):
-    av = avaliacoes.copy()
-    av.columns = [c.strip().lower() for c in av.columns]
-
-    A_u = av[av["usuario_id"] == usuario_id]
-    n = len(A_u)
-    if n < 3:
-        return None, None, {"erro": "Usuário com poucas avaliações para holdout (< 3)."}
+    _, teste_df, err = motor_avaliacao.dividir(usuario_id, holdout=holdout, min_test=min_test, seed=seed)
+    if err:
+        return None, None, err
 
-    test_size = max(min_test, math.ceil(n * holdout))
-    teste_idx = set(A_u.sample(n=test_size, random_state=seed).index.tolist())
-
-    treino_df = av.drop(index=teste_idx)
-    teste_df  = A_u.loc[list(teste_idx)]
+    treino_df = motor_avaliacao.av.drop(index=teste_df.index)
     return treino_df, teste_df, None
 
 @app.get("/divisao_dataset")
@@ -172,7 +683,7 @@ def print_divisao_conjuntos():
     resumo = []
     for uid in user_ids:
         seed = SEED_BASE + uid
-        treino_df, teste_df, err = divisao_conjuntos(
+        treino_u, teste_df, err = motor_avaliacao.dividir(
             uid, holdout=HOLDOUT, min_test=MIN_TEST, seed=seed
         )
         if err:
@@ -184,7 +695,7 @@ def print_divisao_conjuntos():
             })
             continue
 
-        qtd_treino_u = int((treino_df["usuario_id"] == uid).sum())
+        qtd_treino_u = int(treino_u.shape[0])
         qtd_teste_u  = int(teste_df.shape[0])  
 
         resumo.append({
@@ -204,35 +715,32 @@ def print_divisao_conjuntos():
         "usuarios": resumo
     }
 
-def topk_RECOMENDACAO(usuario_id: int, av_df: pd.DataFrame, K_top: int = 5, K_viz: int = 3):
-    matriz = av_df.pivot_table(index="usuario_id", columns="item_id", values="nota").fillna(0)
-    if usuario_id not in matriz.index:
+def topk_RECOMENDACAO(usuario_id: int, matriz: MatrizAvaliacoes, K_top: int = 5, K_viz: int = 3):
+    if usuario_id not in matriz:
         return []
 
-    alvo = matriz.loc[usuario_id].values
-
-    similaridades = {}
-    for u in matriz.index:
-        if u != usuario_id:
-            num = np.dot(alvo, matriz.loc[u].values)
-            den = np.linalg.norm(alvo) * np.linalg.norm(matriz.loc[u].values)
-            similaridades[u] = (num / den) if den != 0 else 0.0
-
-    vizinhos = [u for u, s in sorted(similaridades.items(), key=lambda x: x[1], reverse=True)[:K_viz] if s > 0]
+    # o motor do módulo serve a matriz principal; para outra matriz, um motor novo
+    # só monta o array de ids (as normas vêm da versão da matriz)
+    motor = motor_similaridade if matriz is matriz_avaliacoes else MotorSimilaridade(matriz)
+    vizinhos = motor.vizinhos(usuario_id, k=K_viz)
     if not vizinhos:
         return []
 
-    notas_preditas = matriz.loc[vizinhos].mean().sort_values(ascending=False)
+    notas_preditas = matriz.media(vizinhos).sort_values(ascending=False)
 
-    avaliados = set(av_df[av_df.usuario_id == usuario_id].item_id)
+    avaliados = matriz.avaliados(usuario_id)
     candidatos = [int(i) for i in notas_preditas.index if i not in avaliados]
 
     return candidatos[:K_top]
 
 @app.get("/acuracia")
-def calculo_acuracia():
+@metricas.cronometrar("calculo_acuracia")
+def calculo_acuracia(metodo: Literal["usuarios", "itens", "fatores"] = "usuarios", cursor: Cursor = 0,
+                     limite: Limite = None, formato: Formato = "json"):
+    etapas = metricas.etapas("calculo_acuracia")
     K_TOP = 5
-    K_VIZ = 3
+    # vizinhos por usuário, ou itens parecidos por item (não usado em "fatores")
+    K_VIZ = recomendador_itens.k if metodo == "itens" else 3
     HOLDOUT = 0.4
     LIMIAR_PADRAO = 3.0
     MIN_AVALIACOES = 3
@@ -240,56 +748,138 @@ def calculo_acuracia():
 
     eleg = usuarios_acuracia(min_avaliacoes=MIN_AVALIACOES)
     user_ids = eleg["usuario_id"].astype(int).tolist()
+    etapas.marcar("elegiveis")
 
-    usuarios_fmt = []
-
-    for uid in user_ids:
-        seed = SEED_BASE + uid
-        treino_df, teste_df, err = divisao_conjuntos(uid, holdout=HOLDOUT, min_test=1, seed=seed)
-
-        if err:
-            usuarios_fmt.append({
-                "usuario_id": uid,
-                **err,
-                "topK": [],
-                "relevantes": [],
-                "acertos": 0,
-                "acuracia": None
-            })
-            continue
-
-        topK_ids = topk_RECOMENDACAO(uid, treino_df, K_top=K_TOP, K_viz=K_VIZ)
-
-        limiar_usuario = LIMIAR_PADRAO
-
-        relevantes = sorted(set(
-            teste_df[teste_df["nota"] >= limiar_usuario]["item_id"].tolist()
-        ))
-
-        acertos = sum(1 for iid in topK_ids if iid in relevantes)
-        acuracia = round(acertos / K_TOP, 4) if K_TOP > 0 else 0.0
+    # só os usuários da página são avaliados
+    inicio, fim, proximo = pagina(len(user_ids), cursor, limite)
 
-        usuarios_fmt.append({
-            "usuario_id": uid,
-            "top5 recomendações": [{"nome": nome_do_item(iid)} for iid in topK_ids],
-            "relevantes": [{"nome": nome_do_item(iid)} for iid in relevantes],
-            "acertos": acertos,
-            "acuracia": acuracia
-        })
+    def avaliar(ids: list[int]) -> list[dict]:
+        return motor_avaliacao.avaliar(
+            ids, K_top=K_TOP, K_viz=K_VIZ, holdout=HOLDOUT, limiar=LIMIAR_PADRAO, seed_base=SEED_BASE,
+            metodo=metodo
+        )
 
-    return {
+    cabecalho = {
         "parametros": {
+            "metodo": metodo,
             "K_top5 recomendações": K_TOP,
             "K_viz": K_VIZ,
             "holdout": HOLDOUT,
             "limiar": LIMIAR_PADRAO,
-            "min_avaliacoes": MIN_AVALIACOES
+            "min_avaliacoes": MIN_AVALIACOES,
+            **({"fatores": PARAMETROS_FATORES} if metodo == "fatores" else {}),
         },
         "total_usuarios": len(user_ids),
-        "usuarios": usuarios_fmt
+        "cursor": inicio,
+        "proximo_cursor": proximo,
     }
 
+    if formato == "ndjson":
+        def blocos():
+            # blocos menores que nas outras listas: cada usuário custa uma recomendação
+            for i in range(inicio, fim, BLOCO_ACURACIA):
+                etapas_bloco = metricas.etapas("calculo_acuracia")
+                bloco = avaliar(user_ids[i:min(i + BLOCO_ACURACIA, fim)])
+                etapas_bloco.marcar("avaliacao_usuarios")
+                yield bloco
+        return resposta_ndjson(cabecalho, blocos())
+
+    usuarios_fmt = avaliar(user_ids[inicio:fim])
+    etapas.marcar("avaliacao_usuarios")
+    return {**cabecalho, "usuarios": usuarios_fmt}
+
+# a grade de /acuracia/validacao-cruzada fica limitada para o pedido não virar horas
+MAX_COMBINACOES_VALIDACAO = 200
+
+@app.get("/acuracia/validacao-cruzada")
+@metricas.cronometrar("validacao_cruzada")
+def validacao_cruzada(
+    metodo: Literal["usuarios", "itens", "fatores"] = "usuarios",
+    folds: int = Query(5, ge=2, le=20),
+    k_top: list[int] = Query([5]),
+    k_viz: list[int] = Query([3]),
+    limiar: list[float] = Query([3.0]),
+    min_avaliacoes: int = Query(3, ge=1),
+    amostra: int | None = Query(None, ge=2),
+    confianca: float = Query(0.95, gt=0, lt=1),
+    seed_base: int = 42,
+):
+    """precisão@K, recall@K e NDCG@K com k folds para cada combinação de `k_top` × `k_viz` × `limiar`.
+
+    Os parâmetros de lista se repetem na URL (`?k_top=5&k_top=10&k_viz=3&k_viz=5`).
+    `amostra` sorteia (com `seed_base`) só parte dos usuários elegíveis.
+    """
+    if min(k_top) < 1 or min(k_viz) < 1:
+        raise HTTPException(status_code=422, detail="k_top e k_viz precisam ser >= 1")
+    combinacoes = len(set(k_top)) * len(set(k_viz)) * len(set(limiar))
+    if combinacoes > MAX_COMBINACOES_VALIDACAO:
+        raise HTTPException(
+            status_code=422, detail=f"grade com {combinacoes} combinações (máximo {MAX_COMBINACOES_VALIDACAO})")
+    etapas = metricas.etapas("validacao_cruzada")
+
+    eleg = usuarios_acuracia(min_avaliacoes=min_avaliacoes)
+    if amostra is not None and amostra < len(eleg):
+        eleg = eleg.sample(n=amostra, random_state=seed_base)
+    user_ids = eleg["usuario_id"].astype(int).tolist()
+    etapas.marcar("elegiveis")
+
+    resultado = motor_avaliacao.validacao_cruzada(
+        user_ids, folds=folds, K_top=k_top, K_viz=k_viz, limiar=limiar, metodo=metodo,
+        seed_base=seed_base, confianca=confianca, etapas=etapas,
+    )
+    return {
+        "parametros": {
+            "min_avaliacoes": min_avaliacoes,
+            "amostra": amostra,
+            "seed_base": seed_base,
+            **({"fatores": PARAMETROS_FATORES} if metodo == "fatores" else {}),
+        },
+        **resultado,
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def exportar_metricas():
+    # formato texto de exposição do Prometheus
+    return PlainTextResponse(metricas.texto(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/armazem")
+def estado_armazem():
+    if armazem is None:
+        return {"ativo": False}
+    return {"ativo": True, **armazem.estado()}
+
+@app.get("/snapshot-binario")
+def estado_snapshot_binario():
+    return snapshot_binario.estado()
+
+@app.get("/itens/proximos")
+def itens_proximos(
+    latitude: float | None = Query(None, ge=-90, le=90),
+    longitude: float | None = Query(None, ge=-180, le=180),
+    raio_km: float | None = Query(None, gt=0),
+    k: int | None = Query(None, ge=1),
+    lat_min: float | None = Query(None, ge=-90, le=90),
+    lat_max: float | None = Query(None, ge=-90, le=90),
+    lon_min: float | None = Query(None, ge=-180, le=180),
+    lon_max: float | None = Query(None, ge=-180, le=180),
+):
+    # ponto + raio e/ou k: do mais perto ao mais longe; retângulo: na ordem do catálogo
+    caixa = (lat_min, lat_max, lon_min, lon_max)
+    if latitude is not None and longitude is not None and (raio_km is not None or k is not None):
+        if k is not None:
+            linhas, distancias = catalogo.geo.mais_proximos(latitude, longitude, k, raio_km=raio_km)
+        else:
+            linhas, distancias = catalogo.geo.no_raio(latitude, longitude, raio_km)
+        itens_encontrados = catalogo.registros_com_distancia(linhas, distancias)
+    elif all(v is not None for v in caixa):
+        itens_encontrados = [dict(catalogo.registros[r]) for r in catalogo.geo.na_caixa(*caixa)]
+    else:
+        raise HTTPException(
+            status_code=422,
+            detail="Informe latitude, longitude e raio_km e/ou k, ou lat_min, lat_max, lon_min e lon_max.",
+        )
+    return {"total": len(itens_encontrados), "itens": itens_encontrados}
+
 @app.get("/categorias")
 def get_categorias():
-    contagem = Counter(itens["categoria"].dropna())
-    return dict(contagem)
\ No newline at end of file
+    return catalogo.contagem("categoria")
\ No newline at end of file
@@ -0,0 +1,249 @@
+import threading
+import time
+
+import numpy as np
+
+from matriz_avaliacoes import MatrizAvaliacoes, VersaoMatriz
+
+
+def ranquear_candidatos(usuario_id: int, vizinhos: list[int], matriz: VersaoMatriz, etapas=None) -> list[int]:
+    """Itens que o usuário não avaliou, pela média das notas dos vizinhos (maior primeiro)."""
+    notas_preditas = matriz.media(vizinhos).sort_values(ascending=False)
+    if etapas is not None:
+        etapas.marcar("media_vizinhos")
+
+    avaliados = matriz.avaliados(usuario_id)
+    candidatos = [i for i in notas_preditas.index if i not in avaliados]
+    if etapas is not None:
+        etapas.marcar("candidatos")
+    return candidatos
+
+
+class RecomendacoesMaterializadas:
+    """Lista de candidatos da filtragem por usuários pré-calculada para todo mundo.
+
+    Cada linha da matriz tem uma linha na tabela: os `largura` primeiros
+    candidatos (colunas da matriz, -1 no resto), os vizinhos e o cosseno do
+    último deles, a versão da matriz usada e quando foi calculada. Uma thread
+    em segundo plano monta a tabela e recalcula só os usuários marcados por
+    `marcar`; `afetados` diz quem marcar depois de uma nota — quem tinha o
+    autor entre os vizinhos ou passa a tê-lo, os únicos cujos vizinhos ou
+    médias podem mudar.
+
+    A linha só é servida se nenhuma nota que a afeta chegou depois da versão
+    em que foi calculada (`versao_linha >= sujo_em`); senão `consultar`
+    devolve None e o pedido é calculado na hora.
+    """
+
+    def __init__(self, matriz: MatrizAvaliacoes, busca, k_vizinhos: int = 3, largura: int = 50,
+                 bloco: int = 256):
+        self.matriz = matriz
+        self.busca = busca
+        self.k_vizinhos = k_vizinhos
+        self.largura = largura
+        self.bloco = bloco
+
+        self._lock = threading.Lock()
+        self._tabela = self._alocar(max(matriz.n_usuarios, 1))
+        # linhas a recalcular; no começo, todas
+        self._pendentes: set[int] = set(range(matriz.n_usuarios))
+        # toda nota até esta versão já marcou os usuários afetados
+        self.versao_marcada = matriz.versao
+        self.construida_em: float | None = None
+        self.recalculos = 0
+        self.erro: str | None = None
+
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _alocar(self, capacidade: int) -> dict[str, np.ndarray]:
+        return {
+            "candidatos": np.full((capacidade, self.largura), -1, dtype=np.int32),
+            "n_candidatos": np.zeros(capacidade, dtype=np.int32),
+            # a lista toda coube na largura
+            "completa": np.zeros(capacidade, dtype=bool),
+            "vizinhos": np.full((capacidade, self.k_vizinhos), -1, dtype=np.int64),
+            "n_vizinhos": np.zeros(capacidade, dtype=np.int32),
+            # cosseno do último vizinho com a lista cheia (0 se faltam vizinhos)
+            "limiar": np.zeros(capacidade, dtype=np.float64),
+            "versao_linha": np.full(capacidade, -1, dtype=np.int64),
+            "sujo_em": np.zeros(capacidade, dtype=np.int64),
+            "momento": np.zeros(capacidade, dtype=np.float64),
+        }
+
+    def _garantir(self, n: int):
+        """Cresce a tabela (dobrando) para caber `n` linhas; chamar com `_lock`."""
+        tabela = self._tabela
+        capacidade = len(tabela["versao_linha"])
+        if n <= capacidade:
+            return
+        nova = self._alocar(max(n, 2 * capacidade))
+        for nome, array in tabela.items():
+            nova[nome][:capacidade] = array
+        # leitores pegam a referência antiga ou a nova, as duas consistentes
+        self._tabela = nova
+
+    def marcar(self, usuario_ids, versao: int):
+        """Usuários afetados por uma nota que gerou a `versao` da matriz."""
+        with self._lock:
+            self._garantir(self.matriz.n_usuarios)
+            linhas = [self.matriz.usuarios[u] for u in usuario_ids if u in self.matriz.usuarios]
+            self._tabela["sujo_em"][linhas] = versao
+            self._pendentes.update(linhas)
+            self.versao_marcada = max(self.versao_marcada, versao)
+        self._acordar.set()
+
+    def afetados(self, usuario_ids: list[int], similaridades: list[np.ndarray], relacionados: np.ndarray) -> list[int]:
+        """Usuários cujos vizinhos podem ter mudado com as notas novas de `usuario_ids`.
+
+        `similaridades[j]` é o cosseno, já com as notas novas, de cada linha
+        com `usuario_ids[j]`. Numa linha válida só mudam os vizinhos de quem
+        tinha um deles na lista ou passa a alcançá-lo (cosseno >= `limiar`);
+        a linha defasada ou ainda não calculada não diz nada e entra se for
+        `relacionados` (máscara por linha, ver `VersaoMatriz.relacionados_mascara`).
+        """
+        n = len(relacionados)
+        with self._lock:
+            self._garantir(n)
+            tabela = self._tabela
+            versoes = tabela["versao_linha"][:n]
+            validas = (versoes >= 0) & (versoes >= tabela["sujo_em"][:n])
+            vizinhos = tabela["vizinhos"][:n]
+            preenchidos = np.arange(self.k_vizinhos) < tabela["n_vizinhos"][:n, None]
+            # folga para o arredondamento entre o cosseno da tabela e o do produto
+            limiar = tabela["limiar"][:n] - 1e-9
+            marcados = ~validas & relacionados
+            for u, sims in zip(usuario_ids, similaridades):
+                alcancam = (sims[:n] > 0) & (sims[:n] >= limiar)
+                tinham = ((vizinhos == u) & preenchidos).any(axis=1)
+                marcados |= validas & (alcancam | tinham)
+        return [self.matriz.ids_usuarios[r] for r in np.flatnonzero(marcados)]
+
+    def consultar(self, usuario_id: int, matriz: VersaoMatriz) -> tuple[list[int], list[int], bool, dict] | None:
+        """`(vizinhos, candidatos, completa, frescor)` da tabela, ou None se a linha não vale para `matriz`."""
+        if matriz.versao > self.versao_marcada:
+            # nota recém-publicada que ainda não marcou os afetados
+            return None
+        tabela = self._tabela
+        r = matriz.usuarios.get(usuario_id)
+        if r is None or r >= len(tabela["versao_linha"]):
+            return None
+        versao = int(tabela["versao_linha"][r])
+        if versao < 0 or versao < tabela["sujo_em"][r] or versao > matriz.versao:
+            return None
+        n, nv = int(tabela["n_candidatos"][r]), int(tabela["n_vizinhos"][r])
+        colunas = tabela["candidatos"][r, :n].tolist()
+        vizinhos = tabela["vizinhos"][r, :nv].tolist()
+        completa = bool(tabela["completa"][r])
+        momento = float(tabela["momento"][r])
+        # a linha foi reescrita durante a leitura
+        if tabela["versao_linha"][r] != versao:
+            return None
+        # a idade sai de `momento` na hora de responder (a resposta pode ficar em cache)
+        frescor = {"fonte": "tabela", "versao_matriz": versao, "momento": momento}
+        return vizinhos, [matriz.ids_itens[c] for c in colunas], completa, frescor
+
+    def _vizinhos(self, usuario_ids: list[int], matriz: VersaoMatriz) -> list[list[int]]:
+        lote = getattr(self.busca, "vizinhos_lote", None)
+        if lote is not None:
+            return lote(usuario_ids, k=self.k_vizinhos, matriz=matriz)
+        return [self.busca.vizinhos(u, k=self.k_vizinhos, matriz=matriz) for u in usuario_ids]
+
+    def recalcular(self, linhas: list[int]):
+        """Recalcula as linhas sobre a versão atual da matriz."""
+        matriz = self.matriz.fixar()
+        linhas = [r for r in linhas if r < matriz.n_usuarios]
+        usuarios = [matriz.ids_usuarios[r] for r in linhas]
+        resultados = []
+        for u, vizinhos in zip(usuarios, self._vizinhos(usuarios, matriz)):
+            candidatos = ranquear_candidatos(u, vizinhos, matriz) if vizinhos else []
+            limiar = 0.0
+            if len(vizinhos) >= self.k_vizinhos:
+                ultimo = vizinhos[-1]
+                norma_u, norma_ultimo = matriz.normas_de([matriz.usuarios[u], matriz.usuarios[ultimo]])
+                den = norma_u * norma_ultimo
+                limiar = float(matriz.linha(u) @ matriz.linha(ultimo) / den) if den else 0.0
+            resultados.append((vizinhos, limiar, [matriz.itens[i] for i in candidatos[:self.largura]],
+                               len(candidatos) <= self.largura))
+
+        agora = time.time()
+        with self._lock:
+            self._garantir(matriz.n_usuarios)
+            tabela = self._tabela
+            for r, (vizinhos, limiar, colunas, completa) in zip(linhas, resultados):
+                # invalida antes de reescrever, para `consultar` não misturar as duas
+                tabela["versao_linha"][r] = -1
+                tabela["candidatos"][r, :len(colunas)] = colunas
+                tabela["candidatos"][r, len(colunas):] = -1
+                tabela["n_candidatos"][r] = len(colunas)
+                tabela["completa"][r] = completa
+                tabela["vizinhos"][r, :len(vizinhos)] = vizinhos
+                tabela["n_vizinhos"][r] = len(vizinhos)
+                tabela["limiar"][r] = limiar
+                tabela["momento"][r] = agora
+                tabela["versao_linha"][r] = matriz.versao
+                # nota nova durante o cálculo: a linha volta para a fila
+                if tabela["sujo_em"][r] > matriz.versao:
+                    self._pendentes.add(r)
+            self.recalculos += len(linhas)
+
+    def _proximo_bloco(self) -> list[int]:
+        with self._lock:
+            bloco = []
+            while self._pendentes and len(bloco) < self.bloco:
+                bloco.append(self._pendentes.pop())
+            return sorted(bloco)
+
+    def _executar(self):
+        while not self._parar.is_set():
+            self._acordar.clear()
+            linhas = self._proximo_bloco()
+            if not linhas:
+                if self.construida_em is None:
+                    self.construida_em = time.time()
+                self._acordar.wait()
+                continue
+            try:
+                self.recalcular(linhas)
+                self.erro = None
+            except Exception as e:  # devolve à fila e tenta de novo depois
+                self.erro = repr(e)
+                with self._lock:
+                    self._pendentes.update(linhas)
+                self._parar.wait(1.0)
+
+    def iniciar(self):
+        """Sobe a thread que monta e mantém a tabela."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._executar, name="materializacao", daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+
+    @property
+    def pendentes(self) -> int:
+        with self._lock:
+            return len(self._pendentes)
+
+    def estado(self) -> dict:
+        with self._lock:
+            tabela = self._tabela
+            n = self.matriz.n_usuarios
+            versoes = tabela["versao_linha"][:n]
+            validas = int(np.count_nonzero((versoes >= 0) & (versoes >= tabela["sujo_em"][:n])))
+            momentos = tabela["momento"][:n][versoes >= 0]
+            return {
+                "usuarios": n,
+                "linhas_validas": validas,
+                "pendentes": len(self._pendentes),
+                "largura": self.largura,
+                "recalculos": self.recalculos,
+                "versao_marcada": self.versao_marcada,
+                "versao_matriz_atual": self.matriz.versao,
+                "construida": self.construida_em is not None,
+                "linha_mais_antiga_segundos": round(time.time() - float(momentos.min()), 1) if len(momentos) else None,
+                "erro": self.erro,
+            }
@@ -0,0 +1,575 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class VersaoMatriz:
+    """Uma versão imutável da matriz de avaliações.
+
+    Base CSR + delta (linha -> {coluna: (soma, contagem, posicao_na_base)}),
+    em que `posicao_na_base` é -1 para célula nova e, senão, aponta a célula
+    da base que o delta substitui. Nada aqui é alterado depois de publicado:
+    cada nota gera uma versão nova que reaproveita a base e copia só o delta.
+
+    `ids_usuarios`/`ids_itens` (e os dicionários id -> índice) são
+    compartilhados entre as versões e só crescem no fim; cada versão enxerga
+    as primeiras `n_usuarios`/`n_itens` posições.
+
+    As normas das linhas (para o cosseno) também são da versão: um array
+    das linhas da base, dividido entre as versões, e um dicionário com as
+    linhas que mudaram, copiado junto com o delta. `compactada` junta os
+    dois. Quem fixou uma versão nunca mistura normas de outra; leia com
+    `normas()`/`normas_de()`.
+    """
+
+    __slots__ = (
+        "_base", "_soma", "_contagem", "_delta", "tamanho_delta", "versao",
+        "usuarios", "itens", "ids_usuarios", "ids_itens", "n_usuarios", "n_itens", "_csr",
+        "_normas", "_normas_delta", "_normas_indice", "_base_csc",
+    )
+
+    def __init__(self, base, soma, contagem, delta, tamanho_delta, versao,
+                 usuarios, itens, ids_usuarios, ids_itens, n_usuarios, n_itens, normas=None,
+                 base_csc=None, normas_delta=None):
+        self._base = base
+        self._soma = soma
+        self._contagem = contagem
+        self._delta = delta
+        self.tamanho_delta = tamanho_delta
+        self.versao = versao
+        self.usuarios = usuarios
+        self.itens = itens
+        self.ids_usuarios = ids_usuarios
+        self.ids_itens = ids_itens
+        self.n_usuarios = n_usuarios
+        self.n_itens = n_itens
+        self._csr = base if self.compacta else None
+        self._normas = np.sqrt(self.quadrados()) if normas is None else normas
+        # linha -> norma, para as linhas que mudaram depois de `_normas`
+        self._normas_delta = {} if normas_delta is None else normas_delta
+        self._normas_indice = None
+        # a base em CSC, montada na primeira leitura por coluna e dividida entre
+        # as versões que usam a mesma base
+        self._base_csc = [None] if base_csc is None else base_csc
+
+    def fixar(self) -> "VersaoMatriz":
+        """A própria versão (já é imutável); aceita onde se espera uma `MatrizAvaliacoes`."""
+        return self
+
+    @property
+    def nnz(self) -> int:
+        novas = sum(1 for celulas in self._delta.values() for c in celulas.values() if c[2] < 0)
+        return self._base.nnz + novas
+
+    def __contains__(self, usuario_id) -> bool:
+        r = self.usuarios.get(usuario_id)
+        return r is not None and r < self.n_usuarios
+
+    def _linha_de(self, usuario_id: int) -> int:
+        r = self.usuarios[usuario_id]
+        if r >= self.n_usuarios:
+            raise KeyError(usuario_id)
+        return r
+
+    def _posicao_base(self, linha: int, coluna: int) -> int:
+        if linha >= self._base.shape[0]:
+            return -1
+        ini, fim = self._base.indptr[linha], self._base.indptr[linha + 1]
+        k = ini + np.searchsorted(self._base.indices[ini:fim], coluna)
+        if k < fim and self._base.indices[k] == coluna:
+            return int(k)
+        return -1
+
+    def _valor_base(self, celula) -> float:
+        return float(self._base.data[celula[2]]) if celula[2] >= 0 else 0.0
+
+    def celula(self, linha: int, coluna: int) -> tuple[float, int, int]:
+        """`(soma, contagem, posicao_na_base)` da célula; (0, 0, -1) se vazia."""
+        celula = self._delta.get(linha, {}).get(coluna)
+        if celula is not None:
+            return celula
+        pos = self._posicao_base(linha, coluna)
+        if pos >= 0:
+            return float(self._soma[pos]), int(self._contagem[pos]), pos
+        return 0.0, 0, -1
+
+    def com_celula(self, linha: int, coluna: int, soma: float, contagem: int, pos: int,
+                   n_usuarios: int, n_itens: int) -> "VersaoMatriz":
+        """Versão seguinte com uma célula trocada (copia só o delta)."""
+        return self.com_celulas({linha: {coluna: (soma, contagem, pos)}}, n_usuarios, n_itens)
+
+    def com_celulas(self, celulas: dict[int, dict[int, tuple]], n_usuarios: int, n_itens: int) -> "VersaoMatriz":
+        """Versão seguinte com várias células trocadas (linha -> {coluna: (soma, contagem, pos)})."""
+        delta = dict(self._delta)
+        tamanho = self.tamanho_delta
+        for linha, trocas in celulas.items():
+            linha_delta = dict(delta.get(linha, {}))
+            tamanho += sum(1 for coluna in trocas if coluna not in linha_delta)
+            linha_delta.update(trocas)
+            delta[linha] = linha_delta
+        normas_delta = dict(self._normas_delta)
+        versao = VersaoMatriz(
+            self._base, self._soma, self._contagem, delta, tamanho, self.versao + 1,
+            self.usuarios, self.itens, self.ids_usuarios, self.ids_itens, n_usuarios, n_itens, self._normas,
+            self._base_csc, normas_delta,
+        )
+        # ainda não publicada: dá para completar as normas das linhas trocadas
+        for linha in celulas:
+            normas_delta[linha] = float(np.linalg.norm(versao._vetor(linha)))
+        return versao
+
+    def _indice_normas(self) -> tuple[np.ndarray, np.ndarray]:
+        # `_normas_delta` em arrays (linhas em ordem, normas); montado na primeira leitura
+        if self._normas_indice is None:
+            linhas = np.fromiter(self._normas_delta.keys(), dtype=np.int64, count=len(self._normas_delta))
+            valores = np.fromiter(self._normas_delta.values(), dtype=np.float64, count=len(self._normas_delta))
+            ordem = np.argsort(linhas)
+            self._normas_indice = (linhas[ordem], valores[ordem])
+        return self._normas_indice
+
+    def normas(self, n: int | None = None) -> np.ndarray:
+        """Norma das `n` primeiras linhas (todas, por padrão), num array novo."""
+        n = self.n_usuarios if n is None else n
+        resultado = np.zeros(n, dtype=np.float64)
+        m = min(n, len(self._normas))
+        resultado[:m] = self._normas[:m]
+        if self._normas_delta:
+            linhas, valores = self._indice_normas()
+            dentro = linhas < n
+            resultado[linhas[dentro]] = valores[dentro]
+        return resultado
+
+    def normas_de(self, linhas: np.ndarray) -> np.ndarray:
+        """Norma de cada linha de `linhas`."""
+        linhas = np.asarray(linhas, dtype=np.int64)
+        resultado = np.zeros(len(linhas), dtype=np.float64)
+        na_base = linhas < len(self._normas)
+        resultado[na_base] = self._normas[linhas[na_base]]
+        if self._normas_delta:
+            delta, valores = self._indice_normas()
+            pos = np.minimum(np.searchsorted(delta, linhas), len(delta) - 1)
+            mudou = delta[pos] == linhas
+            resultado[mudou] = valores[pos[mudou]]
+        return resultado
+
+    @property
+    def compacta(self) -> bool:
+        return not self.tamanho_delta and self._base.shape == (self.n_usuarios, self.n_itens)
+
+    def compactada(self) -> "VersaoMatriz":
+        """Mesma versão com o delta incorporado numa base CSR nova (O(nnz))."""
+        if self.compacta:
+            return self
+        base = self._base.tocoo()
+        soma = self._soma.copy()
+        contagem = self._contagem.copy()
+        linhas = [base.row.astype(np.int64)]
+        colunas = [base.col.astype(np.int64)]
+        somas, contagens = [soma], [contagem]
+        for linha, celulas in self._delta.items():
+            novas = []
+            for coluna, (s, c, pos) in celulas.items():
+                if pos >= 0:
+                    soma[pos], contagem[pos] = s, c
+                else:
+                    novas.append((coluna, s, c))
+            if novas:
+                linhas.append(np.full(len(novas), linha, dtype=np.int64))
+                colunas.append(np.array([n[0] for n in novas], dtype=np.int64))
+                somas.append(np.array([n[1] for n in novas], dtype=np.float64))
+                contagens.append(np.array([n[2] for n in novas], dtype=np.int64))
+
+        base, soma, contagem = montar_base(
+            np.concatenate(linhas), np.concatenate(colunas),
+            np.concatenate(somas), np.concatenate(contagens),
+            self.n_usuarios, self.n_itens,
+        )
+        return VersaoMatriz(
+            base, soma, contagem, {}, 0, self.versao,
+            self.usuarios, self.itens, self.ids_usuarios, self.ids_itens, self.n_usuarios, self.n_itens,
+            self.normas(),
+        )
+
+    def csr(self) -> sparse.csr_matrix:
+        """Matriz completa em CSR (calculada uma vez por versão; não altere)."""
+        if self._csr is None:
+            self._csr = self.compactada()._base
+        return self._csr
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """Arrays que descrevem a matriz (base compactada), para gravar em disco."""
+        v = self.compactada()
+        return {
+            "ids_usuarios": np.asarray(self.ids_usuarios[:self.n_usuarios], dtype=np.int64),
+            "ids_itens": np.asarray(self.ids_itens[:self.n_itens], dtype=np.int64),
+            # no dtype de índice da própria base, para `de_arrays` usar sem converter
+            "indptr": np.asarray(v._base.indptr),
+            "indices": np.asarray(v._base.indices),
+            "soma": v._soma.copy(),
+            "contagem": v._contagem.copy(),
+        }
+
+    def linha(self, usuario_id: int) -> np.ndarray:
+        """Vetor denso de notas do usuário, na ordem de `ids_itens`."""
+        return self._vetor(self._linha_de(usuario_id))
+
+    def _vetor(self, r: int) -> np.ndarray:
+        vetor = np.zeros(self.n_itens, dtype=np.float64)
+        if r < self._base.shape[0]:
+            ini, fim = self._base.indptr[r], self._base.indptr[r + 1]
+            vetor[self._base.indices[ini:fim]] = self._base.data[ini:fim]
+        for coluna, (soma, contagem, _) in self._delta.get(r, {}).items():
+            vetor[coluna] = soma / contagem
+        return vetor
+
+    def avaliados(self, usuario_id: int) -> set[int]:
+        """Ids dos itens que o usuário já avaliou (inclusive com nota 0)."""
+        r = self.usuarios.get(usuario_id)
+        if r is None or r >= self.n_usuarios:
+            return set()
+        colunas = list(self._delta.get(r, {}).keys())
+        if r < self._base.shape[0]:
+            ini, fim = self._base.indptr[r], self._base.indptr[r + 1]
+            colunas.extend(self._base.indices[ini:fim].tolist())
+        return {self.ids_itens[c] for c in colunas}
+
+    def produto(self, vetor: np.ndarray) -> np.ndarray:
+        """Produto matriz × vetor (um escore por linha/usuário).
+
+        Aceita também uma matriz itens × b, devolvendo usuários × b.
+        """
+        r, c = self._base.shape
+        resultado = self._base @ vetor[:c]
+        if r < self.n_usuarios:
+            resultado = np.concatenate([resultado, np.zeros((self.n_usuarios - r,) + vetor.shape[1:])])
+        for linha, celulas in self._delta.items():
+            for coluna, celula in celulas.items():
+                resultado[linha] += (celula[0] / celula[1] - self._valor_base(celula)) * vetor[coluna]
+        return resultado
+
+    def _colunas_base(self) -> sparse.csc_matrix:
+        csc = self._base_csc[0]
+        if csc is None:
+            csc = self._base_csc[0] = self._base.tocsc()
+        return csc
+
+    def produto_colunas(self, colunas: np.ndarray, valores: np.ndarray) -> np.ndarray:
+        """`produto` de um vetor que só tem `valores` nas `colunas` (ordenadas); o resto vale 0.
+
+        Lê só essas colunas: O(notas nelas) em vez de O(nnz). As parcelas de
+        cada linha entram na mesma ordem do `produto`, então o resultado é igual.
+        """
+        resultado = np.zeros(self.n_usuarios, dtype=np.float64)
+        csc = self._colunas_base()
+        na_base = colunas < csc.shape[1]
+        inicios = csc.indptr[colunas[na_base]]
+        tamanhos = csc.indptr[colunas[na_base] + 1] - inicios
+        total = int(tamanhos.sum())
+        if total:
+            # posições das células dessas colunas, uma coluna depois da outra
+            pos = np.repeat(inicios - np.cumsum(tamanhos) + tamanhos, tamanhos) + np.arange(total)
+            pesos = csc.data[pos] * np.repeat(valores[na_base], tamanhos)
+            resultado[:csc.shape[0]] = np.bincount(csc.indices[pos], weights=pesos, minlength=csc.shape[0])
+        if self._delta:
+            por_coluna = dict(zip(colunas.tolist(), valores.tolist()))
+            for linha, celulas in self._delta.items():
+                for coluna, celula in celulas.items():
+                    valor = por_coluna.get(coluna)
+                    if valor is not None:
+                        resultado[linha] += (celula[0] / celula[1] - self._valor_base(celula)) * valor
+        return resultado
+
+    def produto_linhas(self, linhas: np.ndarray, vetor: np.ndarray) -> np.ndarray:
+        """Produto só das linhas pedidas × vetor (um escore por linha pedida)."""
+        r, c = self._base.shape
+        resultado = np.zeros(len(linhas), dtype=np.float64)
+        na_base = linhas < r
+        resultado[na_base] = self._base[linhas[na_base]] @ vetor[:c]
+        if self._delta:
+            for k, linha in enumerate(linhas.tolist()):
+                for coluna, celula in self._delta.get(linha, {}).items():
+                    resultado[k] += (celula[0] / celula[1] - self._valor_base(celula)) * vetor[coluna]
+        return resultado
+
+    def quadrados(self) -> np.ndarray:
+        """Soma dos quadrados das notas de cada linha (norma ao quadrado)."""
+        base = self._base
+        linhas = np.repeat(np.arange(base.shape[0]), np.diff(base.indptr))
+        resultado = np.zeros(self.n_usuarios, dtype=np.float64)
+        resultado[:base.shape[0]] = np.bincount(linhas, weights=base.data ** 2, minlength=base.shape[0])
+        for linha, celulas in self._delta.items():
+            for celula in celulas.values():
+                resultado[linha] += (celula[0] / celula[1]) ** 2 - self._valor_base(celula) ** 2
+        return resultado
+
+    def relacionados(self, usuario_id: int) -> list[int]:
+        """Usuários com nota > 0 em algum item que `usuario_id` avaliou.
+
+        São os únicos que podem ter similaridade > 0 com ele, antes ou depois
+        de uma nota nova dele.
+        """
+        return self.relacionados_lote([usuario_id])
+
+    def relacionados_lote(self, usuario_ids) -> list[int]:
+        """União de `relacionados` de vários usuários."""
+        return [self.ids_usuarios[r] for r in np.flatnonzero(self.relacionados_mascara(usuario_ids))]
+
+    def relacionados_mascara(self, usuario_ids) -> np.ndarray:
+        """`relacionados_lote` como máscara por linha, lendo só as colunas avaliadas por eles."""
+        colunas = sorted({self.itens[i] for u in usuario_ids for i in self.avaliados(u)})
+        colunas = np.array(colunas, dtype=np.int64)
+        return self.produto_colunas(colunas, np.ones(len(colunas), dtype=np.float64)) > 0
+
+    def media(self, usuario_ids: list[int]) -> pd.Series:
+        """Média das linhas dos usuários, indexada por item_id em ordem crescente."""
+        medias = np.mean([self.linha(u) for u in usuario_ids], axis=0)
+        return pd.Series(medias, index=self.ids_itens[:self.n_itens]).sort_index()
+
+
+def montar_base(linhas, colunas, soma, contagem, n_usuarios, n_itens):
+    """`(csr, soma, contagem)` com as células ordenadas por (linha, coluna)."""
+    ordem = np.lexsort((colunas, linhas))
+    linhas, colunas = linhas[ordem], colunas[ordem]
+    soma, contagem = soma[ordem], contagem[ordem]
+
+    indptr = np.zeros(n_usuarios + 1, dtype=np.int64)
+    np.cumsum(np.bincount(linhas, minlength=n_usuarios), out=indptr[1:])
+    base = sparse.csr_matrix((soma / contagem, colunas, indptr), shape=(n_usuarios, n_itens))
+    return base, soma, contagem
+
+
+class MatrizAvaliacoes:
+    """Matriz usuário × item esparsa mantida em memória.
+
+    Guarda as notas em uma base CSR (linhas = usuários, colunas = itens) e um
+    pequeno delta com as células alteradas desde a última compactação. Cada
+    célula guarda soma e contagem, de modo que o valor exposto é a média das
+    notas, igual ao `pivot_table(...).fillna(0)` de antes. Quando o delta
+    passa de `limite_delta` células ele é compactado na base.
+
+    O estado é uma `VersaoMatriz` imutável: `adicionar` monta a versão seguinte
+    e a publica trocando uma referência, então leituras não usam lock e nunca
+    veem uma nota pela metade. Uma requisição que precisa de várias leituras
+    consistentes entre si fixa a versão com `fixar()`. As escritas são
+    serializadas entre si, então nenhuma se perde.
+    """
+
+    def __init__(self, limite_delta: int = 1024):
+        self.limite_delta = limite_delta
+        self.usuarios: dict[int, int] = {}
+        self.itens: dict[int, int] = {}
+        self.ids_usuarios: list[int] = []
+        self.ids_itens: list[int] = []
+
+        self._atual = VersaoMatriz(
+            sparse.csr_matrix((0, 0), dtype=np.float64), np.zeros(0, dtype=np.float64),
+            np.zeros(0, dtype=np.int64), {}, 0, 0,
+            self.usuarios, self.itens, self.ids_usuarios, self.ids_itens, 0, 0,
+        )
+        self._escrita = threading.Lock()
+
+    @classmethod
+    def de_dataframe(cls, df: pd.DataFrame, limite_delta: int = 1024) -> "MatrizAvaliacoes":
+        matriz = cls(limite_delta=limite_delta)
+        if df.empty:
+            return matriz
+
+        agregado = (
+            pd.DataFrame({
+                "usuario_id": df["usuario_id"].astype(int),
+                "item_id": df["item_id"].astype(int),
+                "nota": df["nota"].astype(float),
+            })
+            .groupby(["usuario_id", "item_id"])["nota"]
+            .agg(["sum", "count"])
+            .reset_index()
+        )
+
+        ids_usuarios, linhas = np.unique(agregado["usuario_id"].to_numpy(), return_inverse=True)
+        ids_itens, colunas = np.unique(agregado["item_id"].to_numpy(), return_inverse=True)
+        matriz._registrar_ids(ids_usuarios, ids_itens)
+        base, soma, contagem = montar_base(
+            linhas,
+            colunas,
+            agregado["sum"].to_numpy(dtype=np.float64),
+            agregado["count"].to_numpy(dtype=np.int64),
+            len(matriz.ids_usuarios),
+            len(matriz.ids_itens),
+        )
+        matriz._publicar_base(base, soma, contagem)
+        return matriz
+
+    @classmethod
+    def de_arrays(cls, arrays: dict[str, np.ndarray], limite_delta: int = 1024) -> "MatrizAvaliacoes":
+        """Reconstrói a matriz a partir de `arrays()` (sem agrupar as avaliações de novo).
+
+        Os arrays são usados como vieram, sem cópia: vindos de `np.load(mmap_mode="r")`
+        ficam no page cache, compartilhados entre processos. Nada escreve neles;
+        a compactação monta arrays novos.
+        """
+        matriz = cls(limite_delta=limite_delta)
+        matriz._registrar_ids(arrays["ids_usuarios"], arrays["ids_itens"])
+        soma = np.asarray(arrays["soma"], dtype=np.float64)
+        contagem = np.asarray(arrays["contagem"], dtype=np.int64)
+        base = sparse.csr_matrix(
+            (soma / np.maximum(contagem, 1), arrays["indices"], arrays["indptr"]),
+            shape=(len(matriz.ids_usuarios), len(matriz.ids_itens)),
+        )
+        matriz._publicar_base(base, soma, contagem)
+        return matriz
+
+    def _registrar_ids(self, ids_usuarios, ids_itens):
+        self.ids_usuarios.extend(int(u) for u in ids_usuarios)
+        self.ids_itens.extend(int(i) for i in ids_itens)
+        self.usuarios.update({u: k for k, u in enumerate(self.ids_usuarios)})
+        self.itens.update({i: k for k, i in enumerate(self.ids_itens)})
+
+    def _publicar_base(self, base, soma, contagem):
+        self._atual = VersaoMatriz(
+            base, soma, contagem, {}, 0, self._atual.versao,
+            self.usuarios, self.itens, self.ids_usuarios, self.ids_itens,
+            len(self.ids_usuarios), len(self.ids_itens),
+        )
+
+    def fixar(self) -> VersaoMatriz:
+        """A versão atual; todas as leituras feitas nela enxergam o mesmo estado."""
+        return self._atual
+
+    @property
+    def versao(self) -> int:
+        return self._atual.versao
+
+    @property
+    def n_usuarios(self) -> int:
+        return self._atual.n_usuarios
+
+    @property
+    def n_itens(self) -> int:
+        return self._atual.n_itens
+
+    @property
+    def nnz(self) -> int:
+        return self._atual.nnz
+
+    def __contains__(self, usuario_id) -> bool:
+        return usuario_id in self._atual
+
+    def adicionar(self, usuario_id: int, item_id: int, nota: float) -> tuple[int, int, float, float]:
+        """Soma uma nota à célula (usuário, item) e publica a versão nova.
+
+        Retorna `(linha, coluna, valor_antigo, valor_novo)`; células vazias
+        valem 0, como no pivot com `fillna(0)`.
+        """
+        with self._escrita:
+            atual = self._atual
+            n_usuarios, n_itens = atual.n_usuarios, atual.n_itens
+            linha = self.usuarios.get(usuario_id)
+            if linha is None:
+                # o id entra nas listas antes de a versão que o enxerga ser publicada
+                self.ids_usuarios.append(usuario_id)
+                linha = self.usuarios[usuario_id] = n_usuarios
+                n_usuarios += 1
+            coluna = self.itens.get(item_id)
+            if coluna is None:
+                self.ids_itens.append(item_id)
+                coluna = self.itens[item_id] = n_itens
+                n_itens += 1
+
+            soma, contagem, pos = atual.celula(linha, coluna)
+            antigo = soma / contagem if contagem else 0.0
+            soma, contagem = soma + nota, contagem + 1
+            novo = soma / contagem
+
+            versao = atual.com_celula(linha, coluna, soma, contagem, pos, n_usuarios, n_itens)
+            if versao.tamanho_delta > self.limite_delta:
+                versao = versao.compactada()
+            self._atual = versao
+            return linha, coluna, antigo, novo
+
+    def adicionar_lote(self, avaliacoes) -> list[tuple[int, int, float, float]]:
+        """`adicionar` de vários `(usuario_id, item_id, nota)`, publicados numa única versão.
+
+        Retorna `(linha, coluna, valor_antigo, valor_novo)` de cada nota, na
+        ordem recebida; a mesma célula repetida acumula como em chamadas seguidas.
+        """
+        with self._escrita:
+            atual = self._atual
+            n_usuarios, n_itens = atual.n_usuarios, atual.n_itens
+            celulas: dict[int, dict[int, tuple]] = {}
+            resultado = []
+            for usuario_id, item_id, nota in avaliacoes:
+                linha = self.usuarios.get(usuario_id)
+                if linha is None:
+                    self.ids_usuarios.append(usuario_id)
+                    linha = self.usuarios[usuario_id] = n_usuarios
+                    n_usuarios += 1
+                coluna = self.itens.get(item_id)
+                if coluna is None:
+                    self.ids_itens.append(item_id)
+                    coluna = self.itens[item_id] = n_itens
+                    n_itens += 1
+
+                trocas = celulas.setdefault(linha, {})
+                soma, contagem, pos = trocas[coluna] if coluna in trocas else atual.celula(linha, coluna)
+                antigo = soma / contagem if contagem else 0.0
+                soma, contagem = soma + nota, contagem + 1
+                trocas[coluna] = (soma, contagem, pos)
+                resultado.append((linha, coluna, antigo, soma / contagem))
+
+            if resultado:
+                versao = atual.com_celulas(celulas, n_usuarios, n_itens)
+                if versao.tamanho_delta > self.limite_delta:
+                    versao = versao.compactada()
+                self._atual = versao
+            return resultado
+
+    def compactar(self):
+        """Incorpora o delta na base CSR (O(nnz)) e publica o resultado."""
+        with self._escrita:
+            self._atual = self._atual.compactada()
+
+    def csr(self) -> sparse.csr_matrix:
+        """Matriz completa em CSR (compacta o delta antes, se houver)."""
+        if not self._atual.compacta:
+            self.compactar()
+        return self._atual.csr()
+
+    def instantanea(self) -> tuple[sparse.csr_matrix, list[int], list[int], int]:
+        """`(csr, ids_usuarios, ids_itens, versao)` de uma mesma versão."""
+        v = self._atual
+        return v.csr(), v.ids_usuarios[:v.n_usuarios], v.ids_itens[:v.n_itens], v.versao
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return self._atual.arrays()
+
+    def linha(self, usuario_id: int) -> np.ndarray:
+        return self._atual.linha(usuario_id)
+
+    def avaliados(self, usuario_id: int) -> set[int]:
+        return self._atual.avaliados(usuario_id)
+
+    def produto(self, vetor: np.ndarray) -> np.ndarray:
+        return self._atual.produto(vetor)
+
+    def produto_colunas(self, colunas: np.ndarray, valores: np.ndarray) -> np.ndarray:
+        return self._atual.produto_colunas(colunas, valores)
+
+    def produto_linhas(self, linhas: np.ndarray, vetor: np.ndarray) -> np.ndarray:
+        return self._atual.produto_linhas(linhas, vetor)
+
+    def quadrados(self) -> np.ndarray:
+        return self._atual.quadrados()
+
+    def relacionados(self, usuario_id: int) -> list[int]:
+        return self._atual.relacionados(usuario_id)
+
+    def relacionados_lote(self, usuario_ids) -> list[int]:
+        return self._atual.relacionados_lote(usuario_ids)
+
+    def relacionados_mascara(self, usuario_ids) -> np.ndarray:
+        return self._atual.relacionados_mascara(usuario_ids)
+
+    def media(self, usuario_ids: list[int]) -> pd.Series:
+        return self._atual.media(usuario_ids)
@@ -0,0 +1,215 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# limites dos baldes em segundos (de 50 µs a 10 s)
+LIMITES_PADRAO = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos(nomes, valores, extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Histograma:
+    """Histograma com baldes fixos, uma série por combinação de rótulos."""
+
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple[str, ...] = (), limites=LIMITES_PADRAO):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self.limites = tuple(limites)
+        # valores dos rótulos -> [contagem por balde (+Inf no fim), soma, total]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, *rotulos):
+        balde = bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = self._series[rotulos] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            serie[0][balde] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def linhas(self) -> list[str]:
+        with self._lock:
+            series = [(r, list(s[0]), s[1], s[2]) for r, s in self._series.items()]
+        linhas = []
+        for rotulos, baldes, soma, total in sorted(series):
+            acumulado = 0
+            for limite, n in zip(self.limites + (float("inf"),), baldes):
+                acumulado += n
+                le = f'le="{_numero(float(limite))}"'
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, rotulos, le)} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, rotulos)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, rotulos)} {total}")
+        return linhas
+
+
+class Contador:
+    """Contador que só cresce, uma série por combinação de rótulos."""
+
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple[str, ...] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self._series: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, *rotulos, valor: float = 1):
+        with self._lock:
+            self._series[rotulos] = self._series.get(rotulos, 0) + valor
+
+    def linhas(self) -> list[str]:
+        with self._lock:
+            series = sorted(self._series.items())
+        return [f"{self.nome}{_rotulos(self.rotulos, r)} {_numero(v)}" for r, v in series]
+
+
+class Coletor:
+    """Valores lidos na hora da coleta (tamanho da matriz, estado do cache...).
+
+    `funcao` devolve um número ou um dict {valores dos rótulos: número};
+    None (ex.: índice desligado) não gera linha.
+    """
+
+    def __init__(self, nome: str, ajuda: str, funcao, rotulos: tuple[str, ...] = (), tipo: str = "gauge"):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.funcao = funcao
+        self.rotulos = rotulos
+        self.tipo = tipo
+
+    def linhas(self) -> list[str]:
+        valor = self.funcao()
+        if valor is None:
+            return []
+        series = valor.items() if isinstance(valor, dict) else [((), valor)]
+        return [
+            f"{self.nome}{_rotulos(self.rotulos, r if isinstance(r, tuple) else (r,))} {_numero(v)}"
+            for r, v in series if v is not None
+        ]
+
+
+class Etapas:
+    """Tempos das etapas de uma chamada: cada `marcar` registra o tempo desde a marca anterior."""
+
+    __slots__ = ("_histograma", "_funcao", "_inicio")
+
+    def __init__(self, histograma: Histograma, funcao: str):
+        self._histograma = histograma
+        self._funcao = funcao
+        self._inicio = time.perf_counter()
+
+    def marcar(self, etapa: str):
+        agora = time.perf_counter()
+        self._histograma.observar(agora - self._inicio, self._funcao, etapa)
+        self._inicio = agora
+
+
+class Metricas:
+    """Registro das métricas do backend, exposto em `/metrics` no formato texto do Prometheus."""
+
+    def __init__(self, prefixo: str = "recomendacao"):
+        self.prefixo = prefixo
+        self._metricas: list = []
+        self.etapa_segundos = self.histograma(
+            "etapa_segundos", "Tempo de cada etapa das funções instrumentadas", ("funcao", "etapa"))
+        self.funcao_segundos = self.histograma(
+            "funcao_segundos", "Tempo total das funções instrumentadas", ("funcao",))
+        self.requisicao_segundos = self.histograma(
+            "http_requisicao_segundos", "Tempo das requisições HTTP, com validação e serialização da resposta",
+            ("metodo", "rota", "status"))
+
+    def _registrar(self, metrica):
+        metrica.nome = f"{self.prefixo}_{metrica.nome}"
+        self._metricas.append(metrica)
+        return metrica
+
+    def histograma(self, nome: str, ajuda: str, rotulos: tuple[str, ...] = (), limites=LIMITES_PADRAO) -> Histograma:
+        return self._registrar(Histograma(nome, ajuda, rotulos, limites))
+
+    def contador(self, nome: str, ajuda: str, rotulos: tuple[str, ...] = ()) -> Contador:
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def coletor(self, nome: str, ajuda: str, funcao, rotulos: tuple[str, ...] = (), tipo: str = "gauge") -> Coletor:
+        return self._registrar(Coletor(nome, ajuda, funcao, rotulos, tipo))
+
+    def etapas(self, funcao: str) -> Etapas:
+        return Etapas(self.etapa_segundos, funcao)
+
+    def cronometrar(self, funcao: str):
+        """Decorador: registra o tempo total de cada chamada em `funcao_segundos`."""
+        def decorador(f):
+            @wraps(f)
+            def envolvida(*args, **kwargs):
+                inicio = time.perf_counter()
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    self.funcao_segundos.observar(time.perf_counter() - inicio, funcao)
+            return envolvida
+        return decorador
+
+    def texto(self) -> str:
+        linhas = []
+        for metrica in self._metricas:
+            try:
+                corpo = metrica.linhas()
+            except Exception:  # um coletor quebrado não derruba a coleta inteira
+                continue
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(corpo)
+        return "\n".join(linhas) + "\n"
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI que mede cada requisição HTTP, rotulada pelo caminho da rota (não pela URL)."""
+
+    def __init__(self, app, metricas: Metricas):
+        self.app = app
+        self.metricas = metricas
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                status[0] = mensagem["status"]
+            await send(mensagem)
+
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            # o roteador grava a rota encontrada no próprio scope
+            rota = getattr(scope.get("route"), "path", None) or "desconhecida"
+            self.metricas.requisicao_segundos.observar(
+                time.perf_counter() - inicio, scope["method"], rota, str(status[0]))
@@ -0,0 +1,301 @@
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+
+class RegistroAvaliacoes:
+    """Avaliações simuladas em snapshot CSV + log append-only (NDJSON).
+
+    Cada `/avaliar` só acrescenta uma linha ao log; gravações concorrentes
+    são agrupadas (group commit) em um único write + fsync, e a chamada só
+    retorna depois que a sua linha está no disco. De tempos em tempos o log é
+    compactado no snapshot (`avaliacoes_temp.csv`). `registros` só recebe as
+    avaliações depois que o write do lote delas deu certo; se ele falha, o
+    arquivo volta ao tamanho de antes e todas as chamadas do lote recebem o
+    erro.
+
+    A primeira linha do log é `{"base": N}`: quantas linhas o snapshot tinha
+    quando o log começou. Se o processo cair depois de trocar o snapshot e
+    antes de zerar o log, a releitura pula as linhas que já estão no snapshot.
+
+    Com vários workers as gravações já passam por uma trava entre processos;
+    aí `escrever` faz só o write, sob a trava, e `aguardar` espera o fsync
+    depois que ela é solta, que agrupa as chamadas do mesmo jeito.
+
+    Políticas de fsync: "sempre" (nenhuma gravação confirmada se perde),
+    "intervalo" (no máximo um fsync a cada `intervalo_fsync` segundos; uma
+    queda do sistema operacional pode perder o último intervalo) e "nunca".
+    """
+
+    def __init__(self, caminho_snapshot: str, colunas: list[str], fsync: str = "sempre",
+                 intervalo_fsync: float = 1.0, limite_compactacao: int = 10_000):
+        self.caminho_snapshot = caminho_snapshot
+        self.caminho_log = os.path.splitext(caminho_snapshot)[0] + ".log"
+        self.colunas = colunas
+        self.fsync = fsync
+        self.intervalo_fsync = intervalo_fsync
+        self.limite_compactacao = limite_compactacao
+
+        self.registros: list[dict] = []
+        self._no_snapshot = 0
+        self._no_log = 0
+        self._ultimo_fsync = 0.0
+
+        self._cond = threading.Condition()
+        # (seq, registros, linhas) de cada chamada ainda não gravada, na ordem de chegada
+        self._pendentes: list[tuple[int, list[dict], list[str]]] = []
+        self._seq = 0
+        self._gravado = 0
+        # seq -> erro, para as chamadas cujo lote falhou na mão de outro escritor
+        self._falhas: dict[int, BaseException] = {}
+        self._escrevendo = False
+        # `escrever`/`aguardar`: última sequência já no disco e se há um fsync em curso
+        self._duravel = 0
+        self._sincronizando = False
+        self._arquivo = None
+
+        self._carregar()
+        if self._arquivo is None:
+            self._arquivo = open(self.caminho_log, "a", encoding="utf-8")
+
+    @staticmethod
+    def _normalizar(r: dict) -> dict:
+        return {"usuario_id": int(r["usuario_id"]), "item_id": int(r["item_id"]), "nota": float(r["nota"])}
+
+    def _carregar(self):
+        """Reconstrói a memória a partir do snapshot + log."""
+        if os.path.exists(self.caminho_snapshot):
+            snapshot = pd.read_csv(self.caminho_snapshot)
+            self.registros = [self._normalizar(r) for r in snapshot.to_dict(orient="records")]
+        self._no_snapshot = len(self.registros)
+
+        if not os.path.exists(self.caminho_log):
+            self._reiniciar_log()
+            return
+
+        base, linhas = 0, []
+        with open(self.caminho_log, encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    registro = json.loads(linha)
+                except json.JSONDecodeError:
+                    # última linha cortada por uma queda no meio da escrita
+                    break
+                if "base" in registro:
+                    base = registro["base"]
+                else:
+                    linhas.append(self._normalizar(registro))
+
+        ja_no_snapshot = max(0, self._no_snapshot - base)
+        self.registros.extend(linhas[ja_no_snapshot:])
+        self._no_log = len(linhas) - min(ja_no_snapshot, len(linhas))
+        if ja_no_snapshot:
+            self.compactar()
+
+    def _reiniciar_log(self):
+        tmp = self.caminho_log + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"base": self._no_snapshot}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.caminho_log)
+        self._fsync_diretorio()
+        self._no_log = 0
+
+    def dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self.registros, columns=self.colunas)
+
+    def anexar(self, registro: dict):
+        """Grava a avaliação no log; retorna só depois de ela estar no disco."""
+        self.anexar_lote([registro])
+
+    def anexar_lote(self, registros: list[dict]):
+        """Grava várias avaliações no log com um único write + fsync."""
+        registros = [self._normalizar(r) for r in registros]
+        if not registros:
+            return
+        linhas = [json.dumps(r) + "\n" for r in registros]
+        with self._cond:
+            self._seq += 1
+            meu = self._seq
+            self._pendentes.append((meu, registros, linhas))
+
+            while self._gravado < meu:
+                if self._escrevendo:
+                    self._cond.wait()
+                    continue
+
+                # vira líder: grava tudo o que está pendente de uma vez
+                self._escrevendo = True
+                lote, ate = self._pendentes, self._seq
+                self._pendentes = []
+                self._cond.release()
+                try:
+                    self._gravar([linha for _, _, ls in lote for linha in ls])
+                except BaseException as e:
+                    self._cond.acquire()
+                    # o lote é descartado (o arquivo já voltou ao tamanho de antes)
+                    for seq, _, _ in lote:
+                        if seq != meu:
+                            self._falhas[seq] = e
+                    self._escrevendo = False
+                    self._gravado = ate
+                    self._cond.notify_all()
+                    raise
+                self._cond.acquire()
+                for _, rs, _ in lote:
+                    self.registros.extend(rs)
+                    self._no_log += len(rs)
+                self._escrevendo = False
+                self._gravado = ate
+                self._cond.notify_all()
+
+            erro = self._falhas.pop(meu, None)
+            if erro is not None:
+                raise erro
+            if self._no_log >= self.limite_compactacao and not self._escrevendo:
+                self.compactar()
+
+    def escrever(self, registros: list[dict]) -> int:
+        """Grava as avaliações no log sem fsync; retorna a sequência a passar para `aguardar`.
+
+        Para chamar sob a trava que ordena as gravações entre processos: o
+        write é rápido e o fsync fica para `aguardar`, fora dela. Se o write
+        falha, o log volta ao tamanho de antes e nada entra em `registros`.
+        """
+        registros = [self._normalizar(r) for r in registros]
+        with self._cond:
+            while self._escrevendo:
+                self._cond.wait()
+            self._escrever_linhas([json.dumps(r) + "\n" for r in registros])
+            self.registros.extend(registros)
+            self._no_log += len(registros)
+            self._seq += 1
+            seq = self._seq
+            if self._no_log >= self.limite_compactacao:
+                self.compactar()
+            return seq
+
+    def aguardar(self, seq: int):
+        """Espera o fsync que cobre a gravação `seq` de `escrever`; um fsync serve a todas as anteriores.
+
+        Se o fsync falha, as avaliações já estão em `registros` e no log (outro
+        processo pode ter escrito depois delas), mas as chamadas recebem o erro.
+        """
+        with self._cond:
+            while self._duravel < seq:
+                if self._sincronizando:
+                    self._cond.wait()
+                    continue
+
+                # vira líder; o descritor duplicado continua válido se uma compactação fechar o arquivo
+                self._sincronizando = True
+                ate, fd = self._seq, os.dup(self._arquivo.fileno())
+                self._cond.release()
+                erro = None
+                try:
+                    self._sincronizar_disco(fd)
+                except BaseException as e:
+                    erro = e
+                os.close(fd)
+                self._cond.acquire()
+                if erro is not None:
+                    for outro in range(self._duravel + 1, ate + 1):
+                        if outro != seq:
+                            self._falhas[outro] = erro
+                self._duravel = ate
+                self._sincronizando = False
+                self._cond.notify_all()
+                if erro is not None:
+                    raise erro
+
+            erro = self._falhas.pop(seq, None)
+            if erro is not None:
+                raise erro
+
+    def incorporar(self, registros: list[dict]):
+        """Avaliações que outro processo já gravou no mesmo log (vários workers): só entram na memória."""
+        with self._cond:
+            self.registros.extend(self._normalizar(r) for r in registros)
+
+    def _gravar(self, linhas: list[str]):
+        inicio = self._escrever_linhas(linhas)
+        try:
+            self._sincronizar_disco(self._arquivo.fileno())
+        except BaseException:
+            self._desfazer(inicio)
+            raise
+
+    def _escrever_linhas(self, linhas: list[str]) -> int:
+        """write + flush (sem fsync); retorna o tamanho do log antes do write."""
+        # com vários workers, outro processo pode ter compactado e trocado o log
+        try:
+            if os.stat(self.caminho_log).st_ino != os.fstat(self._arquivo.fileno()).st_ino:
+                self._arquivo.close()
+                self._arquivo = open(self.caminho_log, "a", encoding="utf-8")
+        except FileNotFoundError:
+            pass
+        inicio = os.fstat(self._arquivo.fileno()).st_size
+        try:
+            self._arquivo.write("".join(linhas))
+            self._arquivo.flush()
+        except BaseException:
+            self._desfazer(inicio)
+            raise
+        return inicio
+
+    def _sincronizar_disco(self, fd: int):
+        agora = time.monotonic()
+        if self.fsync == "sempre" or (self.fsync == "intervalo" and agora - self._ultimo_fsync >= self.intervalo_fsync):
+            os.fsync(fd)
+            self._ultimo_fsync = agora
+
+    def _desfazer(self, tamanho: int):
+        """Depois de um write que falhou: descarta o buffer e corta o log de volta a `tamanho`."""
+        try:
+            self._arquivo.close()
+        except OSError:
+            pass
+        try:
+            # sem a linha cortada no meio, a releitura não para antes das seguintes
+            os.truncate(self.caminho_log, tamanho)
+        except OSError:
+            pass
+        self._arquivo = open(self.caminho_log, "a", encoding="utf-8")
+
+    def compactar(self):
+        """Reescreve o snapshot com tudo o que já está no disco e zera o log."""
+        with self._cond:
+            while self._escrevendo:
+                self._cond.wait()
+            # as linhas ainda na fila não estão em `registros`; elas vão para o log novo
+            duraveis = self.registros
+
+            tmp = self.caminho_snapshot + ".tmp"
+            pd.DataFrame(duraveis, columns=self.colunas).to_csv(tmp, index=False)
+            with open(tmp, "rb+") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp, self.caminho_snapshot)
+            self._fsync_diretorio()
+            self._no_snapshot = len(duraveis)
+
+            if self._arquivo is not None:
+                self._arquivo.close()
+            self._reiniciar_log()
+            self._arquivo = open(self.caminho_log, "a", encoding="utf-8")
+
+    def _fsync_diretorio(self):
+        # garante que o rename do snapshot/log sobreviva a uma queda
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.caminho_snapshot)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
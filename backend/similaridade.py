@@ -0,0 +1,336 @@
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+
+from matriz_avaliacoes import MatrizAvaliacoes, VersaoMatriz
+
+
+class MotorSimilaridade:
+    """Similaridade do cosseno entre um usuário e todos os outros de uma vez.
+
+    A similaridade de todos os usuários com o alvo sai de um único produto
+    matriz esparsa × vetor; as normas das linhas vêm da versão da matriz
+    usada no produto (`VersaoMatriz.normas`), então não há estado a manter
+    entre uma nota e outra.
+    """
+
+    def __init__(self, matriz: MatrizAvaliacoes):
+        self.matriz = matriz
+        self._ids = np.asarray(matriz.ids_usuarios[:matriz.n_usuarios], dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def ids(self, n: int) -> np.ndarray:
+        """`ids_usuarios` como array, com pelo menos `n` posições (a lista só cresce no fim)."""
+        ids = self._ids
+        if len(ids) < n:
+            with self._lock:
+                if len(self._ids) < n:
+                    self._ids = np.asarray(self.matriz.ids_usuarios[:n], dtype=np.int64)
+                ids = self._ids
+        return ids
+
+    def atualizar(self, usuario_id: int):
+        """Nada a fazer: a versão nova da matriz já traz a norma da linha que mudou."""
+
+    @staticmethod
+    def _cosseno(num: np.ndarray, norma_alvo: float, normas: np.ndarray) -> np.ndarray:
+        den = norma_alvo * normas[:len(num)]
+        sims = np.zeros(len(num), dtype=np.float64)
+        np.divide(num, den, out=sims, where=den != 0)
+        return sims
+
+    def similaridades(self, alvo: np.ndarray, matriz: VersaoMatriz | None = None) -> np.ndarray:
+        """Cosseno entre `alvo` e cada linha da matriz (0 quando alguma norma é 0).
+
+        `matriz` é uma versão fixada com `MatrizAvaliacoes.fixar()`; sem ela vale a atual.
+        Só as colunas que o alvo avaliou entram no produto.
+        """
+        fonte = self.matriz.fixar() if matriz is None else matriz
+        colunas = np.flatnonzero(alvo)
+        num = fonte.produto_colunas(colunas, alvo[colunas])
+        return self._cosseno(num, np.linalg.norm(alvo), fonte.normas(len(num)))
+
+    def _selecionar(self, sims: np.ndarray, usuario_id: int, k: int) -> list[int]:
+        ids = self.ids(len(sims))[:len(sims)]
+        candidatos = np.flatnonzero((sims > 0) & (ids != usuario_id))
+        if k <= 0 or len(candidatos) == 0:
+            return []
+        if len(candidatos) > k:
+            corte = np.partition(sims[candidatos], -k)[-k]
+            candidatos = candidatos[sims[candidatos] >= corte]
+
+        ordem = np.lexsort((ids[candidatos], -sims[candidatos]))[:k]
+        return [int(u) for u in ids[candidatos[ordem]]]
+
+    def vizinhos(self, usuario_id: int, k: int = 3, alvo: np.ndarray | None = None,
+                 matriz: VersaoMatriz | None = None) -> list[int]:
+        """Os `k` usuários mais similares com similaridade > 0.
+
+        Empates são resolvidos pelo menor usuario_id, como na ordenação estável
+        que o loop antigo fazia sobre os usuários em ordem crescente.
+        """
+        fonte = self.matriz.fixar() if matriz is None else matriz
+        if alvo is None:
+            alvo = fonte.linha(usuario_id)
+        return self._selecionar(self.similaridades(alvo, fonte), usuario_id, k)
+
+    def vizinhos_lote(self, usuario_ids: list[int], k: int = 3, celulas_bloco: int = 2_000_000,
+                      matriz: VersaoMatriz | None = None) -> list[list[int]]:
+        """`vizinhos` de vários usuários, com um produto matriz × matriz por bloco.
+
+        O bloco de alvos é dimensionado para o resultado (usuários × bloco) ter
+        no máximo `celulas_bloco` posições.
+        """
+        fonte = self.matriz.fixar() if matriz is None else matriz
+        resultado = []
+        bloco = max(1, celulas_bloco // max(fonte.n_usuarios, 1))
+        normas = fonte.normas()
+        for ini in range(0, len(usuario_ids), bloco):
+            parte = usuario_ids[ini:ini + bloco]
+            alvos = np.stack([fonte.linha(u) for u in parte], axis=1)
+            produtos = np.ascontiguousarray(fonte.produto(alvos).T)
+            for j, u in enumerate(parte):
+                sims = self._cosseno(produtos[j], np.linalg.norm(alvos[:, j]), normas)
+                resultado.append(self._selecionar(sims, u, k))
+        return resultado
+
+
+class IndiceVizinhos:
+    """Índice pré-calculado com os `k` vizinhos mais similares de cada usuário.
+
+    Montado uma vez na inicialização (`construir`) e mantido a cada nota nova
+    por `atualizar`: só a linha do usuário que avaliou é recalculada, e as
+    listas dos outros usuários recebem apenas a nova similaridade com ele.
+    Quando uma lista perde um vizinho e não dá para saber quem entraria no
+    lugar, o usuário fica marcado como "sujo" e é recalculado na próxima
+    consulta. `estado()` informa o quanto o índice está defasado.
+
+    As consultas não pegam o lock: cada entrada de `listas` é uma tupla
+    `(versão da matriz, lista)` que nunca é alterada, só trocada inteira por
+    outra, então quem lê vê a entrada velha ou a nova. Entrada suja, ausente
+    ou mais nova que a versão fixada pela consulta cai na busca exata sobre
+    essa versão, fora do lock.
+    """
+
+    def __init__(self, motor: MotorSimilaridade, k: int = 10, bloco: int = 256, limite_densa: int = 20_000_000):
+        self.motor = motor
+        self.k = k
+        self.bloco = bloco
+        self.limite_densa = limite_densa
+        # usuario_id -> (versão da matriz, [(vizinho_id, similaridade)] em ordem decrescente)
+        self.listas: dict[int, tuple[int, list[tuple[int, float]]]] = {}
+        # vizinho_id -> usuários que o têm na lista
+        self._reverso: dict[int, set[int]] = {}
+        self.sujos: set[int] = set()
+        # similaridade mínima para entrar na lista de cada usuário (por linha)
+        self._limiar = np.zeros(0, dtype=np.float64)
+        self.versao = -1
+        self.construido_em: float | None = None
+        self.atualizacoes = 0
+        self.recalculos = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _chave(par):
+        # maior similaridade primeiro; empate vai para o menor usuario_id
+        return (-par[1], par[0])
+
+    def _lista(self, usuario_id: int) -> list[tuple[int, float]]:
+        entrada = self.listas.get(usuario_id)
+        return entrada[1] if entrada is not None else []
+
+    def _definir(self, usuario_id: int, lista: list[tuple[int, float]], versao: int):
+        for v, _ in self._lista(usuario_id):
+            self._reverso.get(v, set()).discard(usuario_id)
+        self.listas[usuario_id] = (versao, lista)
+        for v, _ in lista:
+            self._reverso.setdefault(v, set()).add(usuario_id)
+
+        r = self.motor.matriz.usuarios[usuario_id]
+        self._crescer_limiar(r + 1)
+        self._limiar[r] = lista[-1][1] if len(lista) >= self.k else 0.0
+
+    def _crescer_limiar(self, n: int):
+        # usuário novo ainda sem lista: limiar 0, qualquer similaridade positiva entra
+        if n > len(self._limiar):
+            self._limiar = np.concatenate([self._limiar, np.zeros(max(n, self.motor.matriz.n_usuarios) - len(self._limiar))])
+
+    def _topk(self, usuario_id: int, ids: np.ndarray, sims: np.ndarray) -> list[tuple[int, float]]:
+        filtro = (sims > 0) & (ids != usuario_id)
+        ids, sims = ids[filtro], sims[filtro]
+        if len(sims) > self.k:
+            corte = np.partition(sims, -self.k)[-self.k]
+            ids, sims = ids[sims >= corte], sims[sims >= corte]
+        ordem = np.lexsort((ids, -sims))[:self.k]
+        return [(int(v), float(s)) for v, s in zip(ids[ordem], sims[ordem])]
+
+    def construir(self):
+        """Calcula a lista de todos os usuários, em blocos de M[bloco] @ M.T.
+
+        É O(usuários²): pensado para rodar uma vez na inicialização.
+        """
+        with self._lock:
+            matriz = self.motor.matriz.fixar()
+            versao = matriz.versao
+            csr = matriz.csr()
+            normas, ids = matriz.normas(), self.motor.ids(matriz.n_usuarios)
+
+            self.listas, self._reverso, self.sujos = {}, {}, set()
+            self._limiar = np.zeros(csr.shape[0], dtype=np.float64)
+            n = csr.shape[0]
+            k = min(self.k, n - 1)
+            inversas = np.zeros(n, dtype=np.float64)
+            np.divide(1.0, normas, out=inversas, where=normas != 0)
+            normalizada = sparse.diags(inversas) @ csr
+            # com poucos itens a matriz densa cabe na memória e o produto vai pelo BLAS
+            if n * csr.shape[1] <= self.limite_densa:
+                normalizada = normalizada.toarray()
+
+            for ini in range(0, n, self.bloco):
+                fim = min(ini + self.bloco, n)
+                bloco = csr[ini:fim].toarray()
+                if k <= 0:
+                    for r in range(fim - ini):
+                        self._definir(int(ids[ini + r]), [], versao)
+                    continue
+
+                # cosseno aproximado do bloco contra todos, só para achar os candidatos
+                aprox = (normalizada @ (bloco * inversas[ini:fim, None]).T).T
+                aprox[np.arange(fim - ini), np.arange(ini, fim)] = -np.inf
+                cortes = np.partition(aprox, n - k, axis=1)[:, n - k]
+
+                for r in range(fim - ini):
+                    usuario_id = int(ids[ini + r])
+                    if cortes[r] <= 0:
+                        cols = np.flatnonzero(aprox[r] > 0)
+                    else:
+                        cols = np.flatnonzero(aprox[r] >= cortes[r] - 1e-9)
+                    # valor exato (mesma conta do MotorSimilaridade) para os candidatos
+                    num = csr[cols] @ bloco[r]
+                    den = normas[ini + r] * normas[cols]
+                    sims = np.zeros(len(cols), dtype=np.float64)
+                    np.divide(num, den, out=sims, where=den != 0)
+                    self._definir(usuario_id, self._topk(usuario_id, ids[cols], sims), versao)
+
+            self.versao = versao
+            self.construido_em = time.time()
+
+    def _calcular(self, usuario_id: int, matriz: VersaoMatriz) -> tuple[np.ndarray, list[tuple[int, float]]]:
+        sims = self.motor.similaridades(matriz.linha(usuario_id), matriz)
+        return sims, self._topk(usuario_id, self.motor.ids(len(sims))[:len(sims)], sims)
+
+    def _recalcular(self, usuario_id: int):
+        matriz = self.motor.matriz.fixar()
+        sims, lista = self._calcular(usuario_id, matriz)
+        self._definir(usuario_id, lista, matriz.versao)
+        self.sujos.discard(usuario_id)
+        self.recalculos += 1
+        return sims
+
+    def atualizar(self, usuario_id: int) -> set[int]:
+        """Aplica uma nota nova do usuário (depois de `MatrizAvaliacoes.adicionar`).
+
+        Retorna os outros usuários cuja lista pode ter mudado: os que o tinham
+        na lista e os que ele passa a alcançar. Fora eles (e ele), ninguém
+        ganha nem perde vizinho.
+        """
+        with self._lock:
+            sims = self._recalcular(usuario_id)
+            ids = self.motor.ids(len(sims))[:len(sims)]
+
+            # só mudam as listas que contêm o usuário ou que ele passa a alcançar
+            self._crescer_limiar(len(sims))
+            alcance = (sims > 0) & (sims >= self._limiar[:len(sims)])
+            afetados = set(self._reverso.get(usuario_id, set()))
+            afetados.update(int(v) for v in ids[alcance])
+            afetados.discard(usuario_id)
+
+            versao = self.motor.matriz.versao
+            for v in afetados:
+                if v in self.sujos:
+                    continue
+                s = float(sims[self.motor.matriz.usuarios[v]])
+                antiga = self._lista(v)
+                lista = [par for par in antiga if par[0] != usuario_id]
+                estava = len(lista) < len(antiga)
+
+                if s > 0:
+                    lista.append((usuario_id, s))
+                lista.sort(key=self._chave)
+
+                if estava and len(antiga) >= self.k and (s <= 0 or lista[-1][0] == usuario_id):
+                    # o usuário caiu para o fim de uma lista cheia: alguém de fora
+                    # pode ter passado à frente dele
+                    self.sujos.add(v)
+                    continue
+                self._definir(v, lista[:self.k], versao)
+
+            self.versao = versao
+            self.atualizacoes += 1
+            return afetados
+
+    def vizinhos(self, usuario_id: int, k: int = 3, matriz: VersaoMatriz | None = None) -> list[int]:
+        if k > self.k:
+            return self.motor.vizinhos(usuario_id, k=k, matriz=matriz)
+        entrada = self.listas.get(usuario_id)
+        if entrada is not None and usuario_id not in self.sujos and (matriz is None or entrada[0] <= matriz.versao):
+            return [v for v, _ in entrada[1][:k]]
+
+        fonte = self.motor.matriz.fixar() if matriz is None else matriz
+        if usuario_id not in fonte:
+            return []
+        _, lista = self._calcular(usuario_id, fonte)
+        # conserta a entrada se ninguém estiver escrevendo e a versão ainda for a atual
+        if self._lock.acquire(blocking=False):
+            try:
+                atual = usuario_id in self.sujos or usuario_id not in self.listas
+                if atual and fonte.versao == self.motor.matriz.versao:
+                    self._definir(usuario_id, lista, fonte.versao)
+                    self.sujos.discard(usuario_id)
+                    self.recalculos += 1
+            finally:
+                self._lock.release()
+        return [v for v, _ in lista[:k]]
+
+    def estado(self) -> dict:
+        return {
+            "k": self.k,
+            "usuarios_indexados": len(self.listas),
+            "usuarios_sujos": len(self.sujos),
+            "versao_indice": self.versao,
+            "versao_matriz": self.motor.matriz.versao,
+            "atualizacoes_incrementais": self.atualizacoes,
+            "recalculos": self.recalculos,
+            "idade_segundos": round(time.time() - self.construido_em, 1) if self.construido_em else None,
+        }
+
+
+def medir_recall(busca, exata: MotorSimilaridade, usuario_ids: list[int], k: int = 3) -> dict:
+    """Compara os vizinhos de `busca` (índice ou LSH) com a busca exata.
+
+    Recall@k = fração dos vizinhos exatos que a busca também devolveu, média
+    sobre os usuários da amostra; junto vão as latências médias de cada lado.
+    """
+    recalls, t_busca, t_exata = [], 0.0, 0.0
+    for u in usuario_ids:
+        ini = time.perf_counter()
+        esperados = exata.vizinhos(u, k=k)
+        t_exata += time.perf_counter() - ini
+
+        ini = time.perf_counter()
+        obtidos = busca.vizinhos(u, k=k)
+        t_busca += time.perf_counter() - ini
+
+        if esperados:
+            recalls.append(len(set(esperados) & set(obtidos)) / len(esperados))
+
+    n = max(len(usuario_ids), 1)
+    return {
+        "k": k,
+        "usuarios_avaliados": len(usuario_ids),
+        "recall": round(float(np.mean(recalls)), 4) if recalls else None,
+        "latencia_media_ms": round(t_busca / n * 1000, 3),
+        "latencia_media_exata_ms": round(t_exata / n * 1000, 3),
+    }
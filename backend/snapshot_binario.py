@@ -0,0 +1,208 @@
+"""Snapshot binário (colunar) dos CSVs do backend.
+
+Cada coluna vira um `.npy` que é aberto com `mmap`, e para as avaliações
+também vão para o disco os arrays da `MatrizAvaliacoes` (ids de usuários e
+itens + CSR), então a inicialização não precisa ler CSV nem agrupar notas.
+O `manifesto.json` guarda tamanho e mtime de cada CSV; se algum mudar, o
+snapshot é refeito na próxima carga.
+
+Para gerar pela linha de comando (por exemplo no build do deploy):
+
+    python snapshot_binario.py [--diretorio DIR] [--forcar]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from matriz_avaliacoes import MatrizAvaliacoes
+
+VERSAO_FORMATO = 2
+COLUNAS_MATRIZ = ("usuario_id", "item_id", "nota")
+
+
+class SnapshotBinario:
+    """Tabelas (`itens`, `avaliacoes`, ...) lidas do snapshot ou, se ele não puder ser usado, do CSV."""
+
+    def __init__(self, diretorio: str, fontes: dict[str, str]):
+        self.diretorio = diretorio
+        self.fontes = fontes
+        self.manifesto: dict | None = None
+        self.erro: str | None = None
+
+    @property
+    def caminho_manifesto(self) -> str:
+        return os.path.join(self.diretorio, "manifesto.json")
+
+    @staticmethod
+    def _assinatura(caminho: str) -> dict:
+        info = os.stat(caminho)
+        return {"tamanho": info.st_size, "mtime_ns": info.st_mtime_ns}
+
+    def _assinaturas(self) -> dict:
+        return {nome: self._assinatura(caminho) for nome, caminho in self.fontes.items()}
+
+    def _ler_manifesto(self) -> dict | None:
+        try:
+            with open(self.caminho_manifesto, encoding="utf-8") as f:
+                manifesto = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifesto.get("versao_formato") != VERSAO_FORMATO:
+            return None
+        if manifesto.get("fontes") != self._assinaturas():
+            return None
+        return manifesto
+
+    def abrir(self, forcar: bool = False) -> "SnapshotBinario":
+        """Usa o snapshot se ele bate com os CSVs; senão o refaz. Se nem isso der, fica no CSV."""
+        try:
+            self.manifesto = None if forcar else self._ler_manifesto()
+            if self.manifesto is None:
+                self.construir(forcar=forcar)
+        except OSError as e:
+            # ex.: disco só de leitura; segue lendo os CSVs
+            self.manifesto = None
+            self.erro = repr(e)
+        return self
+
+    def construir(self, forcar: bool = False):
+        """Gera o snapshot a partir dos CSVs e troca o diretório inteiro de uma vez."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.diretorio)), exist_ok=True)
+        with open(self.diretorio + ".trava", "w") as trava:
+            if fcntl is not None:
+                fcntl.flock(trava, fcntl.LOCK_EX)
+            try:
+                # outro processo pode ter acabado de gerar enquanto esperávamos a trava
+                manifesto = None if forcar else self._ler_manifesto()
+                if manifesto is not None:
+                    self.manifesto = manifesto
+                    return
+                self._gerar()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(trava, fcntl.LOCK_UN)
+
+    def _gerar(self):
+        inicio = time.perf_counter()
+        pai = os.path.dirname(os.path.abspath(self.diretorio))
+        tmp = tempfile.mkdtemp(prefix=".snapshot-", dir=pai)
+        try:
+            # assinatura antes da leitura: se o CSV mudar durante, a próxima carga refaz
+            fontes = self._assinaturas()
+            tabelas = {}
+            for nome, caminho in self.fontes.items():
+                df = pd.read_csv(caminho)
+                tabelas[nome] = self._gravar_tabela(df, os.path.join(tmp, nome))
+
+            manifesto = {
+                "versao_formato": VERSAO_FORMATO,
+                "fontes": fontes,
+                "tabelas": tabelas,
+                "duracao_s": round(time.perf_counter() - inicio, 4),
+            }
+            with open(os.path.join(tmp, "manifesto.json"), "w", encoding="utf-8") as f:
+                json.dump(manifesto, f, ensure_ascii=False, indent=1)
+
+            antigo = None
+            if os.path.exists(self.diretorio):
+                antigo = tmp + ".antigo"
+                os.rename(self.diretorio, antigo)
+            os.rename(tmp, self.diretorio)
+            if antigo:
+                shutil.rmtree(antigo, ignore_errors=True)
+            self.manifesto = manifesto
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def _gravar_tabela(df: pd.DataFrame, pasta: str) -> dict:
+        os.makedirs(pasta)
+        colunas = []
+        for k, coluna in enumerate(df.columns):
+            serie = df[coluna]
+            arquivo = f"c{k}.npy"
+            nulos = serie.isna().to_numpy()
+            if pd.api.types.is_numeric_dtype(serie.dtype) or pd.api.types.is_bool_dtype(serie.dtype):
+                np.save(os.path.join(pasta, arquivo), serie.to_numpy())
+            else:
+                # texto em largura fixa (<U…) para poder ser mapeado em memória
+                valores = serie.to_numpy(dtype=object)
+                np.save(os.path.join(pasta, arquivo), np.array(["" if n else str(v) for v, n in zip(valores, nulos)], dtype=str))
+            if nulos.any():
+                np.save(os.path.join(pasta, f"c{k}.nulos.npy"), nulos)
+            colunas.append({"nome": coluna, "arquivo": arquivo, "dtype": str(serie.dtype), "nulos": bool(nulos.any())})
+
+        tabela = {"linhas": len(df), "colunas": colunas, "matriz": False}
+        if all(c in df.columns for c in COLUNAS_MATRIZ):
+            os.makedirs(os.path.join(pasta, "matriz"))
+            for nome, array in MatrizAvaliacoes.de_dataframe(df).arrays().items():
+                np.save(os.path.join(pasta, "matriz", f"{nome}.npy"), array)
+            tabela["matriz"] = True
+        return tabela
+
+    def tabela(self, nome: str) -> pd.DataFrame:
+        """DataFrame igual ao `pd.read_csv` do CSV; colunas numéricas ficam mapeadas do disco."""
+        if self.manifesto is None:
+            return pd.read_csv(self.fontes[nome])
+
+        pasta = os.path.join(self.diretorio, nome)
+        dados = {}
+        for coluna in self.manifesto["tabelas"][nome]["colunas"]:
+            # ndarray comum que continua apontando para o arquivo mapeado
+            array = np.asarray(np.load(os.path.join(pasta, coluna["arquivo"]), mmap_mode="r"))
+            if array.dtype.kind == "U":
+                array = array.astype(object)
+                if coluna["nulos"]:
+                    nulos = np.load(os.path.join(pasta, coluna["arquivo"].replace(".npy", ".nulos.npy")))
+                    array[nulos] = np.nan
+            serie = pd.Series(array, copy=False)
+            if str(serie.dtype) != coluna["dtype"]:
+                serie = serie.astype(coluna["dtype"])
+            dados[coluna["nome"]] = serie
+        return pd.DataFrame(dados, copy=False)
+
+    def matriz(self, nome: str) -> MatrizAvaliacoes:
+        """`MatrizAvaliacoes` da tabela, montada direto dos arrays gravados."""
+        if self.manifesto is None or not self.manifesto["tabelas"][nome]["matriz"]:
+            return MatrizAvaliacoes.de_dataframe(self.tabela(nome))
+        pasta = os.path.join(self.diretorio, nome, "matriz")
+        arrays = {
+            arquivo[:-len(".npy")]: np.load(os.path.join(pasta, arquivo), mmap_mode="r")
+            for arquivo in os.listdir(pasta)
+        }
+        return MatrizAvaliacoes.de_arrays(arrays)
+
+    def estado(self) -> dict:
+        return {
+            "ativo": self.manifesto is not None,
+            "diretorio": self.diretorio,
+            "fontes": self.manifesto["fontes"] if self.manifesto else None,
+            "duracao_construcao_s": self.manifesto["duracao_s"] if self.manifesto else None,
+            "erro": self.erro,
+        }
+
+
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Gera o snapshot binário de itens.csv e avaliacoes.csv.")
+    parser.add_argument("--diretorio", default=os.path.join(base_dir, "dados_binarios"))
+    parser.add_argument("--forcar", action="store_true", help="refaz mesmo se o snapshot estiver em dia")
+    args = parser.parse_args()
+
+    snapshot = SnapshotBinario(args.diretorio, {
+        "itens": os.path.join(base_dir, "itens.csv"),
+        "avaliacoes": os.path.join(base_dir, "avaliacoes.csv"),
+    }).abrir(forcar=args.forcar)
+    print(json.dumps(snapshot.estado(), ensure_ascii=False, indent=1))
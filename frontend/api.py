@@ -0,0 +1,97 @@
+"""Cliente do backend usado pelo app.
+
+Uma única `requests.Session` por processo do Streamlit (a conexão TLS com o
+Render é reaproveitada entre reruns e entre usuários), GETs em `st.cache_data`
+com TTL — limpos depois de um `/avaliar` — e `em_paralelo` para disparar
+chamadas independentes ao mesmo tempo.
+"""
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from urllib3.util.retry import Retry
+
+API = os.environ.get("API_URL", "https://recomendacao-de-experiencias-manaus.onrender.com").rstrip("/")
+# segundos que um GET fica no cache (um /avaliar limpa antes)
+TTL_CACHE = 300
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="api")
+
+
+@st.cache_resource(show_spinner=False)
+def sessao() -> requests.Session:
+    s = requests.Session()
+    # GETs são repetidos em falha passageira (ex.: backend acordando no Render); POSTs não
+    repetir = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+    adaptador = HTTPAdapter(pool_connections=2, pool_maxsize=16, max_retries=repetir)
+    s.mount("https://", adaptador)
+    s.mount("http://", adaptador)
+    return s
+
+
+@st.cache_data(ttl=TTL_CACHE, show_spinner=False)
+def obter(caminho: str, params: tuple = (), timeout: float = 8) -> dict:
+    """GET com resposta JSON; `params` vai como tupla de pares para entrar na chave do cache."""
+    r = sessao().get(f"{API}/{caminho}", params=dict(params), timeout=timeout)
+    r.raise_for_status()
+    return r.json()
+
+
+@st.cache_data(ttl=TTL_CACHE, show_spinner=False)
+def obter_ndjson(caminho: str, params: tuple = (), timeout: float = 12) -> tuple[dict, list[dict]]:
+    """GET em NDJSON: `(cabeçalho, registros)`. O timeout vale por leitura, não para a lista toda."""
+    params = dict(params, formato="ndjson")
+    with sessao().get(f"{API}/{caminho}", params=params, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        linhas = (json.loads(l) for l in r.iter_lines() if l)
+        cabecalho = next(linhas, {})
+        return cabecalho, list(linhas)
+
+
+def limpar_cache():
+    obter.clear()
+    obter_ndjson.clear()
+
+
+def categorias() -> dict:
+    return obter("categorias")
+
+
+def acuracia() -> list[dict]:
+    _, usuarios = obter_ndjson("acuracia")
+    return usuarios
+
+
+def recomendar(payload: dict) -> dict:
+    r = sessao().post(f"{API}/recomendar", json=payload, timeout=12)
+    r.raise_for_status()
+    return r.json()
+
+
+def avaliar(usuario_id: int, item_id: int, nota: float) -> dict:
+    r = sessao().post(
+        f"{API}/avaliar",
+        json={"usuario_id": usuario_id, "item_id": item_id, "nota": nota},
+        timeout=8,
+    )
+    r.raise_for_status()
+    # a nota muda acurácia, categorias e listas: nada do que está em cache vale mais
+    limpar_cache()
+    return r.json()
+
+
+def em_paralelo(funcao, *args, **kwargs) -> Future:
+    """Roda `funcao` numa thread do pool; o `.result()` devolve o valor ou levanta o erro dela."""
+    contexto = get_script_run_ctx()
+
+    def executar():
+        # sem o contexto do rerun, st.cache_data na thread reclama e não acha a sessão
+        add_script_run_ctx(threading.current_thread(), contexto)
+        return funcao(*args, **kwargs)
+
+    return _executor.submit(executar)
@@ -1,13 +1,15 @@
 import streamlit as st
 import requests
+import html
 import pandas as pd
 import folium
 from streamlit_folium import st_folium
-from folium.plugins import MeasureControl
+from folium.plugins import FastMarkerCluster, MeasureControl
 import plotly.express as px
 
+import api
+
 st.set_page_config(page_title="Manaus Explorer", page_icon="🌴", layout="wide")
-API = "https://recomendacao-de-experiencias-manaus.onrender.com/"
 
 st.markdown(
     """
@@ -93,6 +95,39 @@ def categoria_icone(cat: str):
     cat = (cat or "").lower()
     return {"cultura": "🎨", "gastronomia": "🍽️", "natureza": "🌳", "lazer": "🏖️"}.get(cat, "❓")
 
+CENTRO_MANAUS = (-3.1190, -60.0217)
+
+# cada linha de `marcadores` vira um marcador no navegador (sem um objeto Python por item)
+MARCADOR_JS = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({icon: 'info-sign', markerColor: 'blue', prefix: 'glyphicon'});
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindTooltip(row[2]);
+    marker.bindPopup(row[3], {maxWidth: 300});
+    return marker;
+};
+"""
+
+@st.cache_data(show_spinner=False)
+def marcadores(df: pd.DataFrame, localizacao: str, preco: str) -> list[list]:
+    """`[lat, lon, nome, popup]` dos itens do filtro, montados uma vez por combinação de filtros."""
+    df = df.dropna(subset=["lat", "lon"])
+    if localizacao:
+        df = df[df["localizacao"] == localizacao]
+    if preco:
+        df = df[df["preco_estimado"] == preco]
+
+    def texto(coluna: str) -> pd.Series:
+        return df[coluna].fillna("N/D").astype(str).map(html.escape)
+
+    popup = (
+        "<b>" + texto("nome") + "</b><br>Categoria: " + texto("categoria")
+        + "<br>Localização: " + texto("localizacao") + "<br>Preço: " + texto("preco_estimado")
+    )
+    return pd.DataFrame({
+        "lat": df["lat"].astype(float), "lon": df["lon"].astype(float), "nome": texto("nome"), "popup": popup,
+    }).values.tolist()
+
 st.session_state.setdefault("mode", "✨ Recomendações")
 st.session_state.setdefault("recs", [])
 st.session_state.setdefault("explicacao", "")
@@ -127,13 +162,8 @@ item_id_sim = int(itens_df.loc[sel_idx, "id"])
 
 if st.sidebar.button("Enviar Avaliação"):
     try:
-        r = requests.post(
-            f"{API}/avaliar",
-            json={"usuario_id": usuario_id, "item_id": item_id_sim, "nota": nota_sim},
-            timeout=8,
-        )
-        r.raise_for_status()
-        st.sidebar.success(r.json().get("mensagem", "Avaliação registrada."))
+        resposta = api.avaliar(usuario_id, item_id_sim, nota_sim)
+        st.sidebar.success(resposta.get("mensagem", "Avaliação registrada."))
     except requests.exceptions.RequestException as e:
         st.sidebar.error(f"Erro ao enviar avaliação: {e}")
 
@@ -145,9 +175,7 @@ if st.sidebar.button("Gerar Recomendações"):
         "preco_estimado": preco or None,
     }
     try:
-        resp = requests.post(f"{API}/recomendar", json=payload, timeout=12)
-        resp.raise_for_status()
-        data = resp.json()
+        data = api.recomendar(payload)
         st.session_state["recs"] = data.get("recomendacoes", [])
         st.session_state["explicacao"] = data.get("explicacao", "")
         st.session_state["mode"] = "✨ Recomendações"
@@ -193,46 +221,43 @@ elif st.session_state["mode"] == "🗺️ Mapa":
     st.subheader("Mapa de Manaus")
 
     focus = st.session_state.get("map_focus")
+    foco = None
     if focus:
         center = [focus["lat"], focus["lon"]]
         zoom = 15
         st.success(f"Mostrando: {focus['label']}  —  Lat {focus['lat']:.6f}, Lon {focus['lon']:.6f}")
+        # o destaque vai como camada à parte: trocar de item só move a vista, o mapa não é refeito
+        foco = folium.FeatureGroup(name="foco")
+        folium.Marker(center, tooltip=focus["label"], icon=folium.Icon(color="red", icon="star")).add_to(foco)
     else:
-        center = [-3.1190, -60.0217]  
+        center = list(CENTRO_MANAUS)
         zoom = 11
 
-    m = folium.Map(location=center, zoom_start=zoom, tiles="CartoDB positron", control_scale=True)
+    # o mapa base não depende do foco; centro e zoom vão direto para o st_folium
+    m = folium.Map(location=CENTRO_MANAUS, zoom_start=11, tiles="CartoDB positron", control_scale=True)
     MeasureControl(position="topleft", primary_length_unit="kilometers").add_to(m)
-
-    df_map = itens_df.copy()
-    if localizacao:
-        df_map = df_map[df_map["localizacao"] == localizacao]
-    if preco:
-        df_map = df_map[df_map["preco_estimado"] == preco]
-
-    for _, r in df_map.dropna(subset=["lat", "lon"]).iterrows():
-        lat, lon = float(r["lat"]), float(r["lon"])
-        is_focus = focus and abs(lat - focus["lat"]) < 1e-6 and abs(lon - focus["lon"]) < 1e-6
-        icon = folium.Icon(color=("red" if is_focus else "blue"), icon=("star" if is_focus else "info-sign"))
-        popup = folium.Popup(
-            f"<b>{r['nome']}</b><br>Categoria: {r.get('categoria','N/D')}<br>Localização: {r.get('localizacao','N/D')}<br>Preço: {r.get('preco_estimado','N/D')}",
-            max_width=300,
-        )
-        folium.Marker([lat, lon], tooltip=r["nome"], popup=popup, icon=icon).add_to(m)
+    FastMarkerCluster(marcadores(itens_df, localizacao, preco), callback=MARCADOR_JS, name="itens").add_to(m)
 
     if st.button("← Voltar para Recomendações", key="voltar_recs"):
         st.session_state["mode"] = "✨ Recomendações"
         st.rerun()
 
-    st_folium(m, height=620, use_container_width=True, returned_objects=[], key=f"mapa_{hash(str(center))}")
+    st_folium(
+        m, height=620, use_container_width=True, returned_objects=[],
+        center=center, zoom=zoom, feature_group_to_add=foco,
+        # chave fixa por filtro: o componente só é recriado quando a camada de itens muda
+        key=f"mapa_{localizacao}_{preco}",
+    )
 
 elif st.session_state["mode"] == "📊 Análises":
     st.subheader("📊 Análises do Sistema")
 
+    # as duas chamadas são independentes: saem juntas (e do cache, se já vieram antes)
+    futuro_cat = api.em_paralelo(api.categorias)
+    futuro_acc = api.em_paralelo(api.acuracia)
+
     try:
-        resp_cat = requests.get(f"{API}/categorias", timeout=8)
-        resp_cat.raise_for_status()
-        data_cat = resp_cat.json()
+        data_cat = futuro_cat.result()
 
         if data_cat:
             df_cat = pd.DataFrame({"Categoria": list(data_cat.keys()), "Quantidade": list(data_cat.values())})
@@ -248,10 +273,7 @@ elif st.session_state["mode"] == "📊 Análises":
         st.error(f"Erro ao carregar categorias: {e}")
 
     try:
-        resp_acc = requests.get(f"{API}/acuracia", timeout=12)
-        resp_acc.raise_for_status()
-        data_acc = resp_acc.json()
-        usuarios = data_acc.get("usuarios", [])
+        usuarios = futuro_acc.result()
 
         usuarios_validos = [u for u in usuarios if u.get("acuracia") is not None]
         if usuarios_validos: